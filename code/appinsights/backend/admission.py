@@ -0,0 +1,132 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, Optional
+from telemetry import admission_shed_counter, admission_queue_histogram, register_admission_controller
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+ROUTE_CHECKOUT = "checkout"
+ROUTE_CATALOG = "catalog"
+ROUTE_DEFAULT = "default"
+
+# Ordem de prioridade ao liberar vagas: checkout antes de navegação
+ROUTE_PRIORITY = (ROUTE_CHECKOUT, ROUTE_CATALOG, ROUTE_DEFAULT)
+
+CATALOG_PREFIXES = ("/api/products", "/api/categories", "/api/customers")
+CHECKOUT_PREFIXES = ("/api/orders", "/api/simulate")
+# Probes e administração nunca são descartados
+EXEMPT_PATHS = ("/livez", "/readyz", "/health")
+EXEMPT_PREFIXES = ("/api/admin",)
+
+def classify_request(method: str, path: str) -> Optional[str]:
+    """Classe de rota da requisição (None = isenta de controle de admissão)"""
+    if path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES):
+        return None
+    if method == "POST" and path.startswith(CHECKOUT_PREFIXES):
+        return ROUTE_CHECKOUT
+    if method == "GET" and path.startswith(CATALOG_PREFIXES):
+        return ROUTE_CATALOG
+    return ROUTE_DEFAULT
+
+class AdmissionController:
+    """Limita requisições simultâneas por classe de rota, com fila limitada
+    
+    - Cada classe tem seu limite de requisições em andamento, e todas
+      dividem um limite global (max_in_flight)
+    - Sem vaga, a requisição espera numa fila da sua classe por até
+      queue_timeout segundos; fila cheia ou prazo vencido = descarte (503)
+    - Ao liberar uma vaga, as filas são atendidas por prioridade
+      (ROUTE_PRIORITY): checkout passa à frente da navegação
+    """
+    
+    def __init__(self, limits: Dict[str, int], max_in_flight: int, queue_size: int, queue_timeout: float):
+        self.limits = limits
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight: Dict[str, int] = {route_class: 0 for route_class in ROUTE_PRIORITY}
+        self._total = 0
+        self._queues: Dict[str, Deque[asyncio.Future]] = {route_class: deque() for route_class in ROUTE_PRIORITY}
+    
+    def _has_capacity(self, route_class: str) -> bool:
+        return self._total < self.max_in_flight and self.in_flight[route_class] < self.limits[route_class]
+    
+    def _admit(self, route_class: str):
+        self.in_flight[route_class] += 1
+        self._total += 1
+    
+    async def acquire(self, route_class: str) -> bool:
+        """Obtém uma vaga para a requisição; False = descartar"""
+        # Quem já espera na mesma classe vai primeiro. Esperas em outras
+        # classes só persistem quando bloqueadas pelo limite da própria classe
+        # (release sempre admite tudo o que cabe), então não impedem esta.
+        if self._has_capacity(route_class) and not self._queues[route_class]:
+            self._admit(route_class)
+            return True
+        
+        queue = self._queues[route_class]
+        if len(queue) >= self.queue_size:
+            admission_shed_counter.add(1, {"route_class": route_class, "reason": "queue_full"})
+            return False
+        
+        future = asyncio.get_running_loop().create_future()
+        queue.append(future)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                queue.remove(future)
+                future.cancel()
+                admission_shed_counter.add(1, {"route_class": route_class, "reason": "timeout"})
+                return False
+        except asyncio.CancelledError:
+            # Cliente desconectou enquanto esperava
+            if future.done():
+                self.release(route_class)
+            else:
+                queue.remove(future)
+                future.cancel()
+            raise
+        finally:
+            admission_queue_histogram.record((time.perf_counter() - start) * 1000, {"route_class": route_class})
+        
+        return True
+    
+    def release(self, route_class: str):
+        """Libera a vaga e admite os próximos da fila, por prioridade"""
+        self.in_flight[route_class] -= 1
+        self._total -= 1
+        
+        for queued_class in ROUTE_PRIORITY:
+            queue = self._queues[queued_class]
+            while queue and self._has_capacity(queued_class):
+                future = queue.popleft()
+                if not future.done():
+                    self._admit(queued_class)
+                    future.set_result(None)
+            if self._total >= self.max_in_flight:
+                break
+    
+    def stats(self) -> dict:
+        return {
+            "in_flight": dict(self.in_flight),
+            "queued": {route_class: len(queue) for route_class, queue in self._queues.items()},
+            "limits": dict(self.limits),
+            "max_in_flight": self.max_in_flight
+        }
+
+admission_controller = AdmissionController(
+    limits={
+        ROUTE_CHECKOUT: settings.admission_checkout_limit,
+        ROUTE_CATALOG: settings.admission_catalog_limit,
+        ROUTE_DEFAULT: settings.admission_default_limit
+    },
+    max_in_flight=settings.admission_max_in_flight,
+    queue_size=settings.admission_queue_size,
+    queue_timeout=settings.admission_queue_timeout
+)
+register_admission_controller(admission_controller)
\ No newline at end of file
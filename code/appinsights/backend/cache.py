@@ -0,0 +1,196 @@
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+import pydantic_core
+from telemetry import cache_hits_counter, cache_misses_counter, cache_evictions_counter
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """Cache LRU em memória com TTL e carregamento single-flight
+    
+    - Limitado a max_entries: a entrada menos usada é descartada (eviction)
+    - Entradas expiram após ttl_seconds
+    - get_or_load garante que apenas uma corrotina carrega uma chave ausente;
+      as demais aguardam o mesmo resultado (evita stampede em chave fria)
+    
+    O cache é por processo: em várias réplicas, o TTL limita o tempo máximo
+    em que uma réplica pode servir um valor desatualizado.
+    """
+    
+    def __init__(self, name: str, max_entries: int = 1024, ttl_seconds: float = 60.0, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Chaves invalidadas durante a própria carga: o resultado (que pode
+        # estar desatualizado) não é gravado; as demais cargas não são afetadas
+        self._stale: Set[str] = set()
+        self._attributes = {"cache": name}
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Retorna o valor em cache ou None (sem carregar)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        
+        value, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        
+        self._entries.move_to_end(key)
+        return value
+    
+    def get_tag(self, key: str) -> Optional[str]:
+        """Tag da entrada em cache, sem carregar nem contar hit/miss"""
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[2]
+    
+    def tag(self, value: Any) -> Optional[str]:
+        """Tag calculada uma vez por carga e guardada com a entrada (ver CatalogCache)"""
+        return None
+    
+    def set(self, key: str, value: Any):
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds, self.tag(value))
+        self._entries.move_to_end(key)
+        
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            cache_evictions_counter.add(1, self._attributes)
+    
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Retorna o valor da chave, carregando-o uma única vez se ausente
+        
+        Valores None não são armazenados (ex: recurso não encontrado).
+        """
+        if not self.enabled:
+            return await loader()
+        
+        value = self.get(key)
+        if value is not None:
+            cache_hits_counter.add(1, self._attributes)
+            return value
+        
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            cache_hits_counter.add(1, {**self._attributes, "coalesced": True})
+            return await asyncio.shield(inflight)
+        
+        cache_misses_counter.add(1, self._attributes)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+            if value is not None and key not in self._stale:
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            # Evita "exception was never retrieved" quando não há seguidores
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+            self._stale.discard(key)
+    
+    async def get_or_load_tagged(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Tuple[Any, Optional[str]]:
+        """Como get_or_load, retornando também a tag do valor
+        
+        Valores que não ficaram em cache (cache desligado ou carga
+        invalidada) têm a tag calculada na hora.
+        """
+        value = await self.get_or_load(key, loader)
+        if value is None:
+            return None, None
+        
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is value:
+            return value, entry[2]
+        return value, self.tag(value)
+    
+    def _mark_stale(self, keys: Iterable[str]):
+        """Impede que cargas em andamento destas chaves gravem o resultado"""
+        self._stale.update(key for key in keys if key in self._inflight)
+    
+    def invalidate(self, key: str) -> bool:
+        """Remove uma chave; retorna True se ela existia"""
+        self._mark_stale((key,))
+        return self._entries.pop(key, None) is not None
+    
+    def invalidate_prefix(self, prefix: str) -> int:
+        """Remove todas as chaves com o prefixo informado"""
+        self._mark_stale(key for key in self._inflight if key.startswith(prefix))
+        keys = [key for key in self._entries if key.startswith(prefix)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+    
+    def clear(self) -> int:
+        self._mark_stale(self._inflight)
+        count = len(self._entries)
+        self._entries.clear()
+        return count
+    
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "inflight": len(self._inflight)
+        }
+
+class CatalogCache(TTLCache):
+    """Cache de categorias e produtos servidos pela API de catálogo"""
+    
+    CATEGORIES_KEY = "categories"
+    
+    @staticmethod
+    def category_key(category_id: int) -> str:
+        return f"category:{category_id}"
+    
+    @staticmethod
+    def product_key(product_id: int) -> str:
+        return f"product:{product_id}"
+    
+    @staticmethod
+    def product_list_key(category_id: Optional[int], skip: int, limit: int, cursor: Optional[str] = None, fast: bool = False) -> str:
+        view = "fast" if fast else "full"
+        return f"products:{view}:category:{category_id}:{skip}:{limit}:{cursor}"
+    
+    def tag(self, value: Any) -> str:
+        """ETag fraca derivada do conteúdo (schemas pydantic ou dicts)
+        
+        Mesmo conteúdo, mesma ETag em qualquer réplica e após restarts. É
+        fraca porque os bytes da resposta dependem do serializador (JSON
+        padrão ou orjson), não do conteúdo.
+        """
+        return 'W/"' + hashlib.sha1(pydantic_core.to_json(value)).hexdigest()[:24] + '"'
+    
+    def invalidate_products(self, product_ids: Iterable[int]) -> int:
+        """Invalida produtos alterados e todas as listagens de produtos
+        
+        Só o estoque (units_in_stock) muda com pedidos: os chamadores invocam
+        isto apenas quando a reserva de estoque está ativa.
+        """
+        removed = sum(self.invalidate(self.product_key(product_id)) for product_id in product_ids)
+        removed += self.invalidate_prefix("products:")
+        return removed
+
+catalog_cache = CatalogCache(
+    "catalog",
+    max_entries=settings.catalog_cache_max_entries,
+    ttl_seconds=settings.catalog_cache_ttl_seconds,
+    enabled=settings.catalog_cache_enabled
+)
\ No newline at end of file
@@ -0,0 +1,97 @@
+import time
+import logging
+import threading
+from typing import Optional
+from azure.core.credentials import AccessToken
+
+logger = logging.getLogger(__name__)
+
+POSTGRES_AAD_SCOPE = "https://ossrdbms-aad.database.windows.net/.default"
+
+class FakeCredential:
+    """Credencial local para testes offline (sem Azure AD)
+    
+    Emite tokens sequenciais com validade configurável, imitando a interface
+    get_token() do DefaultAzureCredential.
+    """
+    
+    def __init__(self, token_prefix: str = "fake-token", lifetime_seconds: int = 3600):
+        self.token_prefix = token_prefix
+        self.lifetime_seconds = lifetime_seconds
+        self.calls = 0
+    
+    def get_token(self, *scopes, **kwargs) -> AccessToken:
+        self.calls += 1
+        return AccessToken(f"{self.token_prefix}-{self.calls}", int(time.time()) + self.lifetime_seconds)
+
+class ManagedIdentityTokenProvider:
+    """Mantém o token do Azure AD em memória e o renova antes de expirar
+    
+    O token é obtido uma vez no start() e depois renovado por uma thread em
+    background, refresh_margin segundos antes da expiração. get_token() apenas
+    lê o valor em cache, então o caminho das requisições (abertura de novas
+    conexões no pool) nunca chama o DefaultAzureCredential.
+    """
+    
+    def __init__(
+        self,
+        credential,
+        scope: str = POSTGRES_AAD_SCOPE,
+        refresh_margin: int = 300,
+        retry_interval: int = 30
+    ):
+        self.credential = credential
+        self.scope = scope
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self._token: Optional[AccessToken] = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        """Obtém o primeiro token e inicia a renovação em background"""
+        self._refresh()
+        self._thread = threading.Thread(target=self._refresh_loop, name="aad-token-refresh", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Interrompe a thread de renovação"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+    
+    def get_token(self) -> str:
+        """Retorna o token em cache (não faz chamadas de rede)"""
+        with self._lock:
+            token = self._token
+        if token is None:
+            raise RuntimeError("Token do Managed Identity ainda não foi obtido")
+        if token.expires_on <= time.time():
+            logger.warning("Token do Managed Identity expirado em cache, aguardando renovação")
+        return token.token
+    
+    @property
+    def expires_on(self) -> Optional[int]:
+        with self._lock:
+            return self._token.expires_on if self._token else None
+    
+    def _refresh(self):
+        token = self.credential.get_token(self.scope)
+        with self._lock:
+            self._token = token
+        logger.info(f"Token do Managed Identity renovado, expira em {int(token.expires_on - time.time())}s")
+    
+    def _seconds_until_refresh(self) -> float:
+        expires_on = self.expires_on or 0
+        return max(expires_on - self.refresh_margin - time.time(), 1)
+    
+    def _refresh_loop(self):
+        wait = self._seconds_until_refresh()
+        while not self._stop_event.wait(wait):
+            try:
+                self._refresh()
+                wait = self._seconds_until_refresh()
+            except Exception as e:
+                logger.error(f"Falha ao renovar token do Managed Identity: {e}")
+                wait = self.retry_interval
\ No newline at end of file
@@ -1,19 +1,98 @@
 import os
+import time
 import logging
-from sqlalchemy import create_engine, text
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from azure.identity import DefaultAzureCredential
 from config import settings
+from credentials import FakeCredential, ManagedIdentityTokenProvider
+from telemetry import pool_checkout_histogram, db_query_histogram, register_pool
 
 logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
+class _CheckoutTimingMixin:
+    """Mede o tempo de espera no checkout de conexões do pool"""
+    pool_label = "async"
+    
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            pool_checkout_histogram.record(elapsed_ms, {"pool": self.pool_label})
+
+class InstrumentedAsyncQueuePool(_CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    pool_label = "async"
+
+class InstrumentedReplicaPool(_CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    pool_label = "replica"
+
+def install_query_timing(engine, target: str):
+    """Registra a duração de cada query no histograma, por destino (primary/replica)"""
+    
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+    
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - context._query_start) * 1000
+        db_query_histogram.record(elapsed_ms, {"target": target})
+
+class ReplicaSession(Session):
+    """Sessão de leitura na réplica com fallback para o primário
+    
+    Se uma query falha e a réplica foi marcada como indisponível (hook
+    handle_error), a sessão passa para o primário (info["primary_bind"]) e
+    refaz a query uma vez: a requisição que encontrou a falha não vira 500.
+    """
+    
+    def _with_fallback(self, method, *args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            primary = self.info.get("primary_bind")
+            if primary is None or self.bind is primary or db_connection.replica_healthy:
+                raise
+            logger.warning("Query na réplica falhou, repetindo no primário")
+            self.rollback()
+            self.bind = primary
+            return method(*args, **kwargs)
+    
+    def execute(self, *args, **kwargs):
+        return self._with_fallback(super().execute, *args, **kwargs)
+    
+    def scalar(self, *args, **kwargs):
+        return self._with_fallback(super().scalar, *args, **kwargs)
+    
+    def scalars(self, *args, **kwargs):
+        return self._with_fallback(super().scalars, *args, **kwargs)
+
 class DatabaseConnection:
+    """Engines asyncpg do primário e da réplica opcional
+    
+    Só existe o pool assíncrono: cada processo abre no máximo
+    db_pool_size + db_max_overflow conexões com o primário.
+    """
+    
     def __init__(self):
-        self.engine = None
-        self.SessionLocal = None
+        self.async_engine = None
+        self.AsyncSessionLocal = None
+        self.token_provider = None
+        # Réplica somente leitura opcional (DATABASE_REPLICA_URL)
+        self.replica_engine = None
+        self.ReplicaSessionLocal = None
+        # Atualizado pelo HealthMonitor; erros de conexão o derrubam na hora
+        self.replica_healthy = False
+        # Até este instante (monotonic) as leituras ficam no primário
+        self._primary_reads_until = 0.0
         self._setup_connection()
     
     def _setup_connection(self):
@@ -25,18 +104,29 @@ class DatabaseConnection:
             else:
                 logger.info("Configurando conexão com connection string")
                 self._setup_connection_string()
-                
-            # Testa a conexão
-            self._test_connection()
+            
+            if settings.database_replica_url:
+                self._setup_replica()
+            
+            install_query_timing(self.async_engine.sync_engine, "primary")
             
         except Exception as e:
             logger.error(f"Erro ao configurar conexão com banco de dados: {e}")
             raise
     
     def _setup_managed_identity_connection(self):
-        """Configura conexão usando System Managed Identity"""
+        """Configura conexão usando System Managed Identity
+        
+        O token não é fixado nos connect_args: o evento do_connect injeta o
+        token em cache do ManagedIdentityTokenProvider a cada nova conexão,
+        e o provider o renova em background antes de expirar.
+        """
         try:
-            credential = DefaultAzureCredential()
+            if settings.managed_identity_fake_credential:
+                logger.warning("Usando FakeCredential para Managed Identity (modo offline)")
+                credential = FakeCredential()
+            else:
+                credential = DefaultAzureCredential()
             
             # Extrai informações da DATABASE_URL
             db_url = settings.database_url.replace("postgresql://", "")
@@ -51,54 +141,203 @@ class DatabaseConnection:
             port = server_port[1] if len(server_port) > 1 else "5432"
             database = server_db[1] if len(server_db) > 1 else "northwind"
             
-            # Obtém o token de acesso
-            token_response = credential.get_token("https://ossrdbms-aad.database.windows.net/.default")
-            access_token = token_response.token
+            # Obtém o primeiro token e inicia a renovação em background
+            self.token_provider = ManagedIdentityTokenProvider(
+                credential,
+                refresh_margin=settings.managed_identity_refresh_margin
+            )
+            self.token_provider.start()
             
-            # Monta a connection string com o token
+            # Monta a connection string (o token é injetado no do_connect)
             connection_string = f"postgresql://{server}:{port}/{database}?sslmode=require"
             
-            self.engine = create_engine(
-                connection_string,
-                connect_args={"password": access_token},
-                echo=settings.debug
+            # Engine assíncrono (asyncpg) com o provider de token
+            async_url, async_connect_args = self._to_async_url(connection_string)
+            self.async_engine = create_async_engine(
+                async_url,
+                connect_args=async_connect_args,
+                echo=settings.debug,
+                **self._pool_options(InstrumentedAsyncQueuePool)
             )
             
+            self._attach_token_provider(self.async_engine.sync_engine)
+            self._register_pools()
+        
         except Exception as e:
             logger.error(f"Erro ao configurar Managed Identity: {e}")
             raise
     
     def _setup_connection_string(self):
         """Configura conexão usando connection string tradicional"""
-        self.engine = create_engine(
-            settings.database_url,
-            echo=settings.debug
+        async_url, async_connect_args = self._to_async_url(settings.database_url)
+        self.async_engine = create_async_engine(
+            async_url,
+            connect_args=async_connect_args,
+            echo=settings.debug,
+            **self._pool_options(InstrumentedAsyncQueuePool)
+        )
+        
+        self._register_pools()
+    
+    def _setup_replica(self):
+        """Engine assíncrono para a réplica de leitura
+        
+        A réplica não é testada no startup: as leituras usam o primário até
+        o HealthMonitor confirmar que ela responde. Com Managed Identity o
+        mesmo provider de token é usado (informe a URL sem senha).
+        """
+        async_url, async_connect_args = self._to_async_url(settings.database_replica_url)
+        self.replica_engine = create_async_engine(
+            async_url,
+            connect_args=async_connect_args,
+            echo=settings.debug,
+            **self._pool_options(InstrumentedReplicaPool)
+        )
+        
+        if self.token_provider is not None:
+            self._attach_token_provider(self.replica_engine.sync_engine)
+        self._attach_replica_failover(self.replica_engine.sync_engine)
+        install_query_timing(self.replica_engine.sync_engine, "replica")
+        register_pool("replica", self.replica_engine.sync_engine.pool)
+        
+        self.ReplicaSessionLocal = async_sessionmaker(
+            bind=self.replica_engine,
+            class_=AsyncSession,
+            sync_session_class=ReplicaSession,
+            info={"primary_bind": self.async_engine.sync_engine},
+            autoflush=False,
+            expire_on_commit=False
+        )
+        logger.info("Réplica de leitura configurada")
+    
+    def _attach_replica_failover(self, engine):
+        """Tira a réplica de uso ao primeiro erro de conexão"""
+        
+        @event.listens_for(engine, "handle_error")
+        def _mark_replica_unhealthy(context):
+            if context.is_disconnect or context.connection is None:
+                if self.replica_healthy:
+                    logger.warning("Réplica de leitura indisponível, usando o primário")
+                self.replica_healthy = False
+    
+    def pin_reads_to_primary(self, seconds: float):
+        """Lê do primário pelos próximos segundos (chamado após escritas no catálogo)
+        
+        Evita que uma réplica atrasada recarregue no cache o valor anterior à
+        escrita logo depois da invalidação. Vale só para este processo.
+        """
+        self._primary_reads_until = max(self._primary_reads_until, time.monotonic() + seconds)
+    
+    def read_session_factory(self):
+        """Fábrica de sessões para leituras: réplica se saudável, senão primário"""
+        if (
+            self.ReplicaSessionLocal is not None
+            and self.replica_healthy
+            and time.monotonic() >= self._primary_reads_until
+        ):
+            return self.ReplicaSessionLocal
+        return self.get_async_session_local()
+    
+    def _attach_token_provider(self, engine):
+        """Injeta o token em cache como senha em cada nova conexão física"""
+        token_provider = self.token_provider
+        
+        @event.listens_for(engine, "do_connect")
+        def _provide_token(dialect, conn_rec, cargs, cparams):
+            cparams["password"] = token_provider.get_token()
+    
+    @staticmethod
+    def _pool_options(poolclass):
+        """Parâmetros do pool de conexões a partir das settings"""
+        return {
+            "poolclass": poolclass,
+            "pool_size": settings.db_pool_size,
+            "max_overflow": settings.db_max_overflow,
+            "pool_timeout": settings.db_pool_timeout,
+            "pool_recycle": settings.db_pool_recycle,
+            "pool_pre_ping": settings.db_pool_pre_ping,
+            "pool_use_lifo": settings.db_pool_use_lifo,
+        }
+    
+    def _register_pools(self):
+        """Exporta as métricas de uso dos pools via OpenTelemetry"""
+        register_pool("async", self.async_engine.sync_engine.pool)
+        logger.info(
+            f"Pool de conexões: size={settings.db_pool_size}, "
+            f"overflow={settings.db_max_overflow}, lifo={settings.db_pool_use_lifo}, "
+            f"pgbouncer={settings.db_pgbouncer_mode}"
         )
     
-    def _test_connection(self):
-        """Testa a conexão com o banco de dados"""
+    @staticmethod
+    def _to_async_url(connection_string: str):
+        """Converte a URL do psycopg2 para o driver asyncpg
+        
+        O asyncpg não aceita o parâmetro sslmode na URL, então ele é
+        repassado como ssl nos connect_args. No modo PgBouncer os caches de
+        prepared statements são desativados, pois o PgBouncer em modo
+        transaction não mantém statements entre transações.
+        """
+        url = make_url(connection_string)
+        connect_args = {}
+        
+        query = dict(url.query)
+        sslmode = query.pop("sslmode", None)
+        if sslmode:
+            connect_args["ssl"] = sslmode
+        
+        if settings.db_pgbouncer_mode:
+            query["prepared_statement_cache_size"] = "0"
+            connect_args["statement_cache_size"] = 0
+        
+        url = url.set(drivername="postgresql+asyncpg", query=query)
+        return url, connect_args
+    
+    async def test_connection(self):
+        """Testa a conexão com o banco de dados (chamado no startup)"""
         try:
-            with self.engine.connect() as connection:
-                result = connection.execute(text("SELECT 1"))
+            async with self.async_engine.connect() as connection:
+                await connection.execute(text("SELECT 1"))
                 logger.info("Conexão com banco de dados estabelecida com sucesso")
         except Exception as e:
             logger.error(f"Falha no teste de conexão: {e}")
             raise
     
-    def get_session_local(self):
-        """Retorna a classe de sessão configurada"""
-        if self.SessionLocal is None:
-            self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
-        return self.SessionLocal
+    def get_async_session_local(self):
+        """Retorna a fábrica de sessões assíncronas (AsyncSession)"""
+        if self.AsyncSessionLocal is None:
+            # expire_on_commit=False evita lazy loads após o commit,
+            # que não são permitidos em sessões assíncronas
+            self.AsyncSessionLocal = async_sessionmaker(
+                bind=self.async_engine,
+                class_=AsyncSession,
+                autoflush=False,
+                expire_on_commit=False
+            )
+        return self.AsyncSessionLocal
+    
+    async def dispose(self):
+        """Libera os pools de conexão no shutdown da aplicação"""
+        if self.token_provider is not None:
+            self.token_provider.stop()
+        if self.async_engine is not None:
+            await self.async_engine.dispose()
+        if self.replica_engine is not None:
+            await self.replica_engine.dispose()
 
 # Instância global da conexão
 db_connection = DatabaseConnection()
-SessionLocal = db_connection.get_session_local()
+AsyncSessionLocal = db_connection.get_async_session_local()
 
-def get_db():
-    """Dependency para FastAPI obter sessão do banco"""
-    db = SessionLocal()
-    try:
+async def get_async_db():
+    """Dependency para FastAPI obter sessão assíncrona do banco"""
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
+
+async def get_async_read_db():
+    """Dependency para leituras de catálogo (réplica quando disponível)
+    
+    Escritas e leituras que precisam ver a própria escrita (OrderService,
+    pedidos) continuam em get_async_db, sempre no primário.
+    """
+    async with db_connection.read_session_factory()() as db:
+        yield db
\ No newline at end of file
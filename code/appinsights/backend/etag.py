@@ -0,0 +1,25 @@
+from typing import Optional
+from fastapi import Request, Response
+
+def _opaque_tag(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+def etag_matches(request: Request, etag: Optional[str]) -> bool:
+    """Verifica se o If-None-Match da requisição corresponde à ETag"""
+    header = request.headers.get("if-none-match")
+    if not header or etag is None:
+        return False
+    if header.strip() == "*":
+        return True
+    
+    # If-None-Match usa comparação fraca: ignora o prefixo W/ dos dois lados
+    candidates = (_opaque_tag(tag.strip()) for tag in header.split(","))
+    return _opaque_tag(etag) in candidates
+
+def not_modified(etag: str) -> Response:
+    """Resposta 304 sem corpo (não serializa nem consulta o banco)"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
\ No newline at end of file
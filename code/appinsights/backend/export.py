@@ -0,0 +1,136 @@
+import io
+import csv
+import json
+import logging
+from datetime import date, datetime
+from typing import AsyncIterator, List
+from sqlalchemy import select
+from database import db_connection
+from models import Order, OrderDetail, Product, Category
+from telemetry import tracer
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+ORDER_COLUMNS = [
+    "order_id", "customer_id", "order_date", "required_date", "shipped_date", "freight",
+    "ship_name", "ship_address", "ship_city", "ship_region", "ship_postal_code", "ship_country"
+]
+DETAIL_COLUMNS = ["product_id", "unit_price", "quantity", "discount"]
+
+PRODUCT_COLUMNS = [
+    "product_id", "product_name", "supplier_id", "category_id", "category_name", "quantity_per_unit",
+    "unit_price", "units_in_stock", "units_on_order", "reorder_level", "discontinued"
+]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(value)}")
+
+def _to_ndjson(records: List[dict]) -> str:
+    return "".join(json.dumps(record, default=_json_default) + "\n" for record in records)
+
+def _to_csv(rows: List[list], header: List[str] = None) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+async def _stream_rows(statement):
+    """Executa a query com cursor server-side e devolve lotes de linhas
+    
+    Usa uma sessão própria (na réplica de leitura, se disponível): o gerador
+    roda depois que o endpoint retornou, enquanto o corpo é transmitido.
+    """
+    async with db_connection.read_session_factory()() as session:
+        result = await session.stream(statement.execution_options(yield_per=settings.export_batch_size))
+        async for partition in result.partitions():
+            yield partition
+
+async def export_products(fmt: str) -> AsyncIterator[str]:
+    """Exporta o catálogo completo de produtos (com o nome da categoria)"""
+    statement = (
+        select(
+            Product.product_id, Product.product_name, Product.supplier_id, Product.category_id,
+            Category.category_name, Product.quantity_per_unit, Product.unit_price,
+            Product.units_in_stock, Product.units_on_order, Product.reorder_level, Product.discontinued
+        )
+        .outerjoin(Category, Product.category_id == Category.category_id)
+        .order_by(Product.product_id)
+    )
+    
+    with tracer.start_as_current_span("export_products") as span:
+        span.set_attribute("format", fmt)
+        total = 0
+        
+        if fmt == "csv":
+            yield _to_csv([], header=PRODUCT_COLUMNS)
+        
+        async for rows in _stream_rows(statement):
+            total += len(rows)
+            if fmt == "csv":
+                yield _to_csv([list(row) for row in rows])
+            else:
+                yield _to_ndjson([dict(row._mapping) for row in rows])
+        
+        span.set_attribute("rows", total)
+        logger.info(f"Exportação de produtos concluída: {total} linhas")
+
+async def export_orders(fmt: str) -> AsyncIterator[str]:
+    """Exporta todos os pedidos com seus itens
+    
+    Uma única query (pedidos LEFT JOIN itens, ordenada por order_id) é lida
+    em lotes. No CSV cada linha é um item; no NDJSON as linhas consecutivas
+    do mesmo pedido são agrupadas em um objeto com a lista order_details.
+    """
+    order_columns = [getattr(Order, column) for column in ORDER_COLUMNS]
+    detail_columns = [getattr(OrderDetail, column) for column in DETAIL_COLUMNS]
+    statement = (
+        select(*order_columns, *detail_columns)
+        .outerjoin(OrderDetail, Order.order_id == OrderDetail.order_id)
+        .order_by(Order.order_id, OrderDetail.product_id)
+    )
+    
+    with tracer.start_as_current_span("export_orders") as span:
+        span.set_attribute("format", fmt)
+        total_orders = 0
+        current = None
+        
+        if fmt == "csv":
+            yield _to_csv([], header=ORDER_COLUMNS + DETAIL_COLUMNS)
+        
+        async for rows in _stream_rows(statement):
+            if fmt == "csv":
+                yield _to_csv([list(row) for row in rows])
+                continue
+            
+            completed = []
+            for row in rows:
+                values = row._mapping
+                if current is None or current["order_id"] != values["order_id"]:
+                    if current is not None:
+                        completed.append(current)
+                    current = {column: values[column] for column in ORDER_COLUMNS}
+                    current["order_details"] = []
+                if values["product_id"] is not None:
+                    current["order_details"].append({column: values[column] for column in DETAIL_COLUMNS})
+            
+            total_orders += len(completed)
+            if completed:
+                yield _to_ndjson(completed)
+        
+        # O último pedido só é fechado ao final do cursor
+        if current is not None:
+            total_orders += 1
+            yield _to_ndjson([current])
+        
+        span.set_attribute("orders", total_orders)
+        logger.info(f"Exportação de pedidos concluída ({fmt})")
\ No newline at end of file
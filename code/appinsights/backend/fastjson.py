@@ -0,0 +1,64 @@
+import time
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlalchemy import select
+from models import Product, Category, Customer
+from telemetry import serialization_histogram
+from config import settings
+
+# Projeções usadas pelo caminho rápido: colunas puras, sem hidratar objetos
+# ORM nem validar com pydantic. As chaves seguem os campos dos schemas, então
+# o JSON (e o schema OpenAPI declarado no response_model) não muda.
+PRODUCT_PROJECTION = (
+    *Product.__table__.columns,
+    Category.category_name.label("_category_name"),
+    Category.description.label("_category_description")
+)
+CUSTOMER_PROJECTION = tuple(Customer.__table__.columns)
+
+def use_fast_json(request: Request) -> bool:
+    """Caminho rápido habilitado globalmente ou pelo header X-Fast-Json: 1"""
+    return settings.fast_json_enabled or request.headers.get("x-fast-json") == "1"
+
+def select_products_projection():
+    return select(*PRODUCT_PROJECTION).outerjoin(Category, Product.category_id == Category.category_id)
+
+def select_customers_projection():
+    return select(*CUSTOMER_PROJECTION)
+
+def product_row_to_dict(row) -> dict:
+    """Converte a linha projetada no formato de schemas.Product"""
+    data = dict(row._mapping)
+    category_name = data.pop("_category_name")
+    category_description = data.pop("_category_description")
+    data["category"] = {
+        "category_name": category_name,
+        "description": category_description,
+        "category_id": data["category_id"]
+    } if category_name is not None else None
+    return data
+
+def customer_row_to_dict(row) -> dict:
+    return dict(row._mapping)
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse que mede a serialização do corpo (default_response_class)
+    
+    Mede só a geração dos bytes (json.dumps); a conversão pelo response_model
+    acontece antes, no FastAPI, e entra no tempo do endpoint.
+    """
+    
+    serializer = "json"
+    
+    def render(self, content) -> bytes:
+        start = time.perf_counter()
+        body = super().render(content)
+        serialization_histogram.record((time.perf_counter() - start) * 1000, {"serializer": self.serializer})
+        return body
+
+class TimedORJSONResponse(TimedJSONResponse, ORJSONResponse):
+    serializer = "orjson"
+
+def fast_json_response(content, response: Response) -> ORJSONResponse:
+    """Serializa com orjson preservando os headers já definidos no endpoint"""
+    return TimedORJSONResponse(content, headers=dict(response.headers))
\ No newline at end of file
@@ -0,0 +1,281 @@
+import os
+import json
+import queue
+import logging
+import threading
+from collections import defaultdict
+from typing import List, Optional
+from opentelemetry.context import Context
+from opentelemetry.sdk.metrics.export import (
+    Gauge,
+    Histogram as HistogramData,
+    MetricExporter,
+    MetricExportResult,
+    MetricsData,
+    Sum
+)
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+
+logger = logging.getLogger(__name__)
+
+# Modo local (TELEMETRY_EXPORTER=file): spans e métricas em arquivos
+# OTLP-JSON, uma requisição de exportação (ExportTraceServiceRequest /
+# ExportMetricsServiceRequest) por linha, como o file exporter do Collector
+
+class RotatingJsonLinesWriter:
+    """Arquivo JSON Lines com rotação por tamanho (como RotatingFileHandler)"""
+    
+    def __init__(self, path: str, max_bytes: int, backup_count: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "ab")
+    
+    def write(self, document: dict):
+        line = json.dumps(document, separators=(",", ":")).encode() + b"\n"
+        if self.max_bytes and self._file.tell() > 0 and self._file.tell() + len(line) > self.max_bytes:
+            self._rotate()
+        self._file.write(line)
+        self._file.flush()
+    
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "wb")
+    
+    def close(self):
+        self._file.close()
+
+def _any_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_any_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+def _attributes(attributes) -> List[dict]:
+    return [{"key": key, "value": _any_value(value)} for key, value in (attributes or {}).items()]
+
+def _scope(scope) -> dict:
+    return {"name": scope.name, "version": scope.version or ""} if scope else {}
+
+def encode_span(span: ReadableSpan) -> dict:
+    encoded = {
+        "traceId": format(span.context.trace_id, "032x"),
+        "spanId": format(span.context.span_id, "016x"),
+        "name": span.name,
+        # OTLP numera a partir de SPAN_KIND_INTERNAL = 1
+        "kind": span.kind.value + 1,
+        "startTimeUnixNano": str(span.start_time),
+        "endTimeUnixNano": str(span.end_time),
+        "attributes": _attributes(span.attributes),
+        "status": {"code": span.status.status_code.value, "message": span.status.description or ""}
+    }
+    if span.parent is not None:
+        encoded["parentSpanId"] = format(span.parent.span_id, "016x")
+    if span.events:
+        encoded["events"] = [
+            {"name": event.name, "timeUnixNano": str(event.timestamp), "attributes": _attributes(event.attributes)}
+            for event in span.events
+        ]
+    return encoded
+
+def encode_spans(spans: List[ReadableSpan]) -> dict:
+    """ExportTraceServiceRequest em JSON (spans agrupados por resource e scope)"""
+    grouped = defaultdict(lambda: defaultdict(list))
+    resources, scopes = {}, {}
+    for span in spans:
+        resource_key, scope_key = id(span.resource), id(span.instrumentation_scope)
+        resources[resource_key] = span.resource
+        scopes[scope_key] = span.instrumentation_scope
+        grouped[resource_key][scope_key].append(encode_span(span))
+    
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": _attributes(resources[resource_key].attributes)},
+                "scopeSpans": [
+                    {"scope": _scope(scopes[scope_key]), "spans": encoded}
+                    for scope_key, encoded in by_scope.items()
+                ]
+            }
+            for resource_key, by_scope in grouped.items()
+        ]
+    }
+
+def _number_point(point) -> dict:
+    encoded = {
+        "attributes": _attributes(point.attributes),
+        "startTimeUnixNano": str(point.start_time_unix_nano or 0),
+        "timeUnixNano": str(point.time_unix_nano)
+    }
+    if isinstance(point.value, int):
+        encoded["asInt"] = str(point.value)
+    else:
+        encoded["asDouble"] = point.value
+    return encoded
+
+def _histogram_point(point) -> dict:
+    return {
+        "attributes": _attributes(point.attributes),
+        "startTimeUnixNano": str(point.start_time_unix_nano),
+        "timeUnixNano": str(point.time_unix_nano),
+        "count": str(point.count),
+        "sum": point.sum,
+        "bucketCounts": [str(count) for count in point.bucket_counts],
+        "explicitBounds": list(point.explicit_bounds),
+        "min": point.min,
+        "max": point.max
+    }
+
+def encode_metric(metric) -> Optional[dict]:
+    encoded = {"name": metric.name, "description": metric.description or "", "unit": metric.unit or ""}
+    data = metric.data
+    if isinstance(data, Sum):
+        encoded["sum"] = {
+            "dataPoints": [_number_point(point) for point in data.data_points],
+            "aggregationTemporality": data.aggregation_temporality.value,
+            "isMonotonic": data.is_monotonic
+        }
+    elif isinstance(data, Gauge):
+        encoded["gauge"] = {"dataPoints": [_number_point(point) for point in data.data_points]}
+    elif isinstance(data, HistogramData):
+        encoded["histogram"] = {
+            "dataPoints": [_histogram_point(point) for point in data.data_points],
+            "aggregationTemporality": data.aggregation_temporality.value
+        }
+    else:
+        # Histogramas exponenciais não são usados pela aplicação
+        return None
+    return encoded
+
+def encode_metrics(metrics_data: MetricsData) -> dict:
+    """ExportMetricsServiceRequest em JSON"""
+    return {
+        "resourceMetrics": [
+            {
+                "resource": {"attributes": _attributes(resource_metrics.resource.attributes)},
+                "scopeMetrics": [
+                    {
+                        "scope": _scope(scope_metrics.scope),
+                        "metrics": [
+                            encoded for encoded in map(encode_metric, scope_metrics.metrics) if encoded is not None
+                        ]
+                    }
+                    for scope_metrics in resource_metrics.scope_metrics
+                ]
+            }
+            for resource_metrics in metrics_data.resource_metrics
+        ]
+    }
+
+class FileSpanProcessor(SpanProcessor):
+    """Grava spans amostrados em arquivo, fora do thread da requisição
+    
+    on_end só enfileira o span numa fila limitada (queue_size); com a fila
+    cheia o span é descartado e contado, sem bloquear a requisição. Um
+    thread em background codifica e grava lotes de até batch_size spans.
+    """
+    
+    def __init__(self, writer: RotatingJsonLinesWriter, queue_size: int, batch_size: int = 512, flush_interval: float = 1.0):
+        self.writer = writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self._queue: "queue.Queue[ReadableSpan]" = queue.Queue(maxsize=queue_size)
+        self._write_lock = threading.Lock()
+        self._shutdown = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="file-span-exporter", daemon=True)
+        self._thread.start()
+    
+    def on_start(self, span: Span, parent_context: Optional[Context] = None):
+        pass
+    
+    def on_end(self, span: ReadableSpan):
+        if not span.context.trace_flags.sampled:
+            return
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            if not self.dropped:
+                logger.warning("Fila do exportador de spans cheia: spans serão descartados")
+            self.dropped += 1
+    
+    def _run(self):
+        while not self._shutdown.is_set():
+            try:
+                span = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            self._write([span] + self._take(self.batch_size - 1))
+    
+    def _take(self, limit: int) -> List[ReadableSpan]:
+        spans = []
+        while len(spans) < limit:
+            try:
+                spans.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return spans
+    
+    def _write(self, spans: List[ReadableSpan]):
+        with self._write_lock:
+            try:
+                self.writer.write(encode_spans(spans))
+                self.written += len(spans)
+            except Exception as e:
+                logger.warning(f"Erro ao gravar spans em {self.writer.path}: {e}")
+    
+    def stats(self) -> dict:
+        return {
+            "path": self.writer.path,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped
+        }
+    
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        spans = self._take(self.batch_size)
+        while spans:
+            self._write(spans)
+            spans = self._take(self.batch_size)
+        return True
+    
+    def shutdown(self):
+        self._shutdown.set()
+        self._thread.join(timeout=self.flush_interval * 2)
+        self.force_flush()
+        with self._write_lock:
+            self.writer.close()
+
+class FileMetricExporter(MetricExporter):
+    """Exportador de métricas para arquivo (chamado pelo thread do PeriodicExportingMetricReader)"""
+    
+    def __init__(self, writer: RotatingJsonLinesWriter):
+        super().__init__()
+        self.writer = writer
+    
+    def export(self, metrics_data: MetricsData, timeout_millis: float = 10_000, **kwargs) -> MetricExportResult:
+        try:
+            self.writer.write(encode_metrics(metrics_data))
+            return MetricExportResult.SUCCESS
+        except Exception as e:
+            logger.warning(f"Erro ao gravar métricas em {self.writer.path}: {e}")
+            return MetricExportResult.FAILURE
+    
+    def force_flush(self, timeout_millis: float = 10_000) -> bool:
+        return True
+    
+    def shutdown(self, timeout_millis: float = 30_000, **kwargs):
+        self.writer.close()
\ No newline at end of file
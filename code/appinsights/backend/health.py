@@ -0,0 +1,133 @@
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import text
+from database import db_connection
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class HealthMonitor:
+    """Estado de saúde atualizado em background e servido da memória
+    
+    Uma tarefa executa SELECT 1 a cada health_check_interval segundos; os
+    probes (/livez, /readyz, /health) só leem o último resultado, sem tocar
+    no pool. A saturação do pool é calculada no momento do probe, em O(1).
+    """
+    
+    def __init__(self, interval: float, db_timeout: float, saturation_threshold: float, stale_after: float):
+        self.interval = interval
+        self.db_timeout = db_timeout
+        self.saturation_threshold = saturation_threshold
+        self.stale_after = stale_after
+        self.database_status = "unknown"
+        self.database_latency_ms: Optional[float] = None
+        self.replica_status = "not_configured" if db_connection.replica_engine is None else "unknown"
+        self.last_check: Optional[datetime] = None
+        self._last_check_monotonic: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def app_insights_status(self) -> str:
+        return "configured" if settings.applicationinsights_connection_string else "not_configured"
+    
+    async def start(self):
+        """Executa a primeira verificação e inicia a atualização periódica"""
+        await self.check()
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
+    
+    async def check(self):
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._ping_database(), timeout=self.db_timeout)
+            self.database_status = "healthy"
+            self.database_latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        except Exception as e:
+            if self.database_status != "unhealthy":
+                logger.error(f"Erro na conexão com banco: {e!r}")
+            self.database_status = "unhealthy"
+            self.database_latency_ms = None
+        
+        if db_connection.replica_engine is not None:
+            await self.check_replica()
+        
+        self.last_check = datetime.now()
+        self._last_check_monotonic = time.monotonic()
+    
+    async def check_replica(self):
+        """Devolve a réplica ao roteamento de leituras quando ela responde"""
+        try:
+            await asyncio.wait_for(self._ping_database(db_connection.replica_engine), timeout=self.db_timeout)
+            healthy = True
+        except Exception as e:
+            if db_connection.replica_healthy:
+                logger.warning("Réplica de leitura indisponível: %r", e)
+            healthy = False
+        
+        if healthy and not db_connection.replica_healthy:
+            logger.info("Réplica de leitura disponível para o catálogo")
+        db_connection.replica_healthy = healthy
+        self.replica_status = "healthy" if healthy else "unhealthy"
+    
+    @staticmethod
+    async def _ping_database(engine=None):
+        async with (engine or db_connection.async_engine).connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    
+    @staticmethod
+    def pool_saturation() -> float:
+        """Fração das conexões do pool do primário em uso (0 a 1)"""
+        capacity = settings.db_pool_size + settings.db_max_overflow
+        return db_connection.async_engine.sync_engine.pool.checkedout() / capacity if capacity else 0.0
+    
+    def is_stale(self) -> bool:
+        return self._last_check_monotonic is None or time.monotonic() - self._last_check_monotonic > self.stale_after
+    
+    def is_alive(self) -> bool:
+        """Processo vivo: a tarefa de verificação continua rodando"""
+        return self._task is not None and not self._task.done()
+    
+    def readiness(self) -> dict:
+        """Pronto para tráfego: banco ok, verificação recente e pool abaixo do limite"""
+        saturation = self.pool_saturation()
+        reasons = []
+        if self.database_status != "healthy":
+            reasons.append("database_unhealthy")
+        if self.is_stale():
+            reasons.append("health_check_stale")
+        if saturation >= self.saturation_threshold:
+            reasons.append("pool_saturated")
+        
+        return {
+            "status": "ready" if not reasons else "not_ready",
+            "reasons": reasons,
+            "database_status": self.database_status,
+            "database_latency_ms": self.database_latency_ms,
+            # Réplica indisponível não tira o pod de rotação: as leituras vão ao primário
+            "replica_status": self.replica_status,
+            "pool_saturation": round(saturation, 3),
+            "app_insights_status": self.app_insights_status,
+            "last_check": self.last_check.isoformat() if self.last_check else None
+        }
+
+health_monitor = HealthMonitor(
+    interval=settings.health_check_interval,
+    db_timeout=settings.health_db_timeout,
+    saturation_threshold=settings.health_pool_saturation_threshold,
+    stale_after=settings.health_stale_after
+)
\ No newline at end of file
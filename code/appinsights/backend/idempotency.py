@@ -0,0 +1,290 @@
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Set, Tuple
+from fastapi import HTTPException
+from sqlalchemy import and_, delete, or_, update
+from sqlalchemy.dialects.postgresql import insert
+from database import db_connection, AsyncSessionLocal
+from models import IdempotencyKey
+from queries import uncounted_queries
+from schemas import OrderCreate, OrderResponse
+from telemetry import idempotency_counter
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Intervalo de consulta enquanto outra réplica processa a mesma chave
+POLL_INTERVAL_SECONDS = 0.1
+
+# Backoff das novas tentativas de gravar a resposta (store indisponível)
+COMPLETE_RETRY_INITIAL_SECONDS = 0.5
+COMPLETE_RETRY_MAX_SECONDS = 30.0
+
+class IdempotencyRecord(NamedTuple):
+    fingerprint: str
+    # None enquanto o pedido ainda está em processamento
+    response: Optional[OrderResponse]
+
+def request_fingerprint(order_data: OrderCreate) -> str:
+    """Hash do payload: a mesma chave com outro pedido é rejeitada"""
+    return hashlib.sha256(order_data.model_dump_json().encode()).hexdigest()
+
+class MemoryIdempotencyStore:
+    """Respostas em um LRU em memória com TTL (por processo)
+    
+    Suficiente para uma réplica: as requisições concorrentes com a mesma
+    chave são coordenadas pelo IdempotencyManager, então claim sempre vence.
+    """
+    
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+    
+    async def start(self):
+        pass
+    
+    async def get(self, key: str) -> Optional[IdempotencyRecord]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        
+        record, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        
+        self._entries.move_to_end(key)
+        return record
+    
+    async def claim(self, key: str, fingerprint: str) -> bool:
+        return True
+    
+    async def complete(self, key: str, fingerprint: str, response: OrderResponse):
+        self._entries[key] = (IdempotencyRecord(fingerprint, response), time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    async def release(self, key: str):
+        pass
+    
+    def stats(self) -> dict:
+        return {"backend": "memory", "entries": len(self._entries), "max_entries": self.max_entries}
+
+class PostgresIdempotencyStore:
+    """Respostas na tabela idempotency_keys, compartilhada entre réplicas
+    
+    claim insere a chave sem resposta (INSERT ... ON CONFLICT DO NOTHING):
+    só uma réplica executa o pedido, as outras aguardam a resposta gravada.
+    Linhas expiradas, ou em processamento há mais que o tempo de espera
+    (réplica que caiu no meio do pedido), são descartadas no próximo claim.
+    """
+    
+    def __init__(self, ttl_seconds: float, wait_timeout: float):
+        self.ttl_seconds = ttl_seconds
+        self.wait_timeout = wait_timeout
+    
+    async def start(self):
+        """Cria a tabela idempotency_keys caso ainda não exista"""
+        async with db_connection.async_engine.begin() as conn:
+            await conn.run_sync(IdempotencyKey.__table__.create, checkfirst=True)
+    
+    async def get(self, key: str) -> Optional[IdempotencyRecord]:
+        with uncounted_queries():
+            async with AsyncSessionLocal() as session:
+                row = await session.get(IdempotencyKey, key)
+        
+        if row is None or row.created_at < datetime.utcnow() - timedelta(seconds=self.ttl_seconds):
+            return None
+        
+        response = OrderResponse.model_validate(row.response) if row.response is not None else None
+        return IdempotencyRecord(row.fingerprint, response)
+    
+    async def claim(self, key: str, fingerprint: str) -> bool:
+        now = datetime.utcnow()
+        with uncounted_queries():
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    delete(IdempotencyKey).where(
+                        IdempotencyKey.key == key,
+                        or_(
+                            IdempotencyKey.created_at < now - timedelta(seconds=self.ttl_seconds),
+                            and_(
+                                IdempotencyKey.response.is_(None),
+                                IdempotencyKey.created_at < now - timedelta(seconds=self.wait_timeout)
+                            )
+                        )
+                    )
+                )
+                claimed = await session.scalar(
+                    insert(IdempotencyKey)
+                    .values(key=key, fingerprint=fingerprint, created_at=now)
+                    .on_conflict_do_nothing(index_elements=[IdempotencyKey.key])
+                    .returning(IdempotencyKey.key)
+                )
+                await session.commit()
+        return claimed is not None
+    
+    async def complete(self, key: str, fingerprint: str, response: OrderResponse):
+        with uncounted_queries():
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    update(IdempotencyKey)
+                    .where(IdempotencyKey.key == key)
+                    .values(response=response.model_dump(mode="json"))
+                )
+                await session.commit()
+    
+    async def release(self, key: str):
+        """Libera a chave de um pedido que falhou (o retry executa de novo)"""
+        with uncounted_queries():
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.response.is_(None))
+                )
+                await session.commit()
+    
+    def stats(self) -> dict:
+        return {"backend": "postgres"}
+
+class IdempotencyManager:
+    """Executa cada Idempotency-Key uma única vez
+    
+    - Chave já concluída: devolve a resposta armazenada (replay)
+    - Chave em processamento neste processo: aguarda o mesmo resultado
+    - Chave em processamento em outra réplica (store postgres): consulta
+      até a resposta ser gravada ou o tempo de espera acabar (409)
+    
+    Só respostas de sucesso são armazenadas. Se o pedido falhar, a chave
+    é liberada e quem aguardava recebe o mesmo erro; um retry posterior
+    executa o pedido novamente. Depois que o pedido foi criado a chave
+    nunca é liberada: se a resposta não puder ser gravada, ela fica
+    pendente neste processo (replay local) e é regravada em segundo plano.
+    """
+    
+    def __init__(self, store, wait_timeout: float):
+        self.store = store
+        self.wait_timeout = wait_timeout
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Respostas de pedidos já criados cuja gravação no store falhou
+        self._pending: Dict[str, IdempotencyRecord] = {}
+        self._tasks: Set[asyncio.Task] = set()
+    
+    async def execute(
+        self,
+        key: str,
+        fingerprint: str,
+        handler: Callable[[], Awaitable[OrderResponse]]
+    ) -> Tuple[OrderResponse, bool]:
+        """Retorna (resposta, replayed)"""
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            record = self._pending.get(key) or await self.store.get(key)
+            if record is not None and record.response is not None:
+                return self._replay(record, fingerprint, "replayed")
+            # Outra corrotina pode ter iniciado a chave durante o get
+            inflight = self._inflight.get(key)
+        
+        if inflight is not None:
+            record = await asyncio.shield(inflight)
+            return self._replay(record, fingerprint, "coalesced")
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            record = await self._claim_or_wait(key, fingerprint)
+            if record is not None:
+                future.set_result(record)
+                return self._replay(record, fingerprint, "replayed")
+            
+            try:
+                response = await handler()
+            except BaseException:
+                await self.store.release(key)
+                raise
+            
+            record = IdempotencyRecord(fingerprint, response)
+            future.set_result(record)
+            # Blindado: o pedido já existe, a gravação continua mesmo se o
+            # cliente desconectar
+            await asyncio.shield(self._complete(key, record))
+            idempotency_counter.add(1, {"outcome": "executed"})
+            return response, False
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                # Evita "exception was never retrieved" quando não há seguidores
+                future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+    
+    async def _complete(self, key: str, record: IdempotencyRecord):
+        """Grava a resposta; em falha, mantém a chave pendente e tenta de novo"""
+        try:
+            await self.store.complete(key, record.fingerprint, record.response)
+        except Exception:
+            logger.exception("Falha ao gravar a resposta da Idempotency-Key %s, tentando em segundo plano", key)
+            idempotency_counter.add(1, {"outcome": "complete_failed"})
+            self._pending[key] = record
+            task = asyncio.create_task(self._retry_complete(key, record))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    async def _retry_complete(self, key: str, record: IdempotencyRecord):
+        """Regrava a resposta com backoff até conseguir ou a chave expirar"""
+        delay = COMPLETE_RETRY_INITIAL_SECONDS
+        deadline = time.monotonic() + self.store.ttl_seconds
+        try:
+            while time.monotonic() < deadline:
+                await asyncio.sleep(delay)
+                try:
+                    await self.store.complete(key, record.fingerprint, record.response)
+                    return
+                except Exception as e:
+                    logger.warning("Nova falha ao gravar a resposta da Idempotency-Key %s: %s", key, e)
+                    delay = min(delay * 2, COMPLETE_RETRY_MAX_SECONDS)
+        finally:
+            self._pending.pop(key, None)
+    
+    async def _claim_or_wait(self, key: str, fingerprint: str) -> Optional[IdempotencyRecord]:
+        """Reserva a chave; se outra réplica a detém, aguarda sua resposta"""
+        deadline = time.monotonic() + self.wait_timeout
+        while not await self.store.claim(key, fingerprint):
+            record = await self.store.get(key)
+            if record is not None and record.response is not None:
+                return record
+            
+            if time.monotonic() >= deadline:
+                idempotency_counter.add(1, {"outcome": "timeout"})
+                raise HTTPException(status_code=409, detail="Pedido com esta Idempotency-Key ainda em processamento")
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+        return None
+    
+    def _replay(self, record: IdempotencyRecord, fingerprint: str, outcome: str) -> Tuple[OrderResponse, bool]:
+        if record.fingerprint != fingerprint:
+            idempotency_counter.add(1, {"outcome": "mismatch"})
+            raise HTTPException(status_code=422, detail="Idempotency-Key já utilizada com outro pedido")
+        
+        idempotency_counter.add(1, {"outcome": outcome})
+        return record.response, True
+    
+    def stats(self) -> dict:
+        return {**self.store.stats(), "inflight": len(self._inflight), "pending": len(self._pending)}
+
+def create_idempotency_store():
+    """Cria o store configurado em IDEMPOTENCY_BACKEND (memory ou postgres)"""
+    backend = settings.idempotency_backend.lower()
+    if backend == "postgres":
+        return PostgresIdempotencyStore(settings.idempotency_ttl_seconds, settings.idempotency_wait_timeout)
+    if backend != "memory":
+        logger.warning(f"Backend de idempotência desconhecido '{backend}', usando memory")
+    return MemoryIdempotencyStore(settings.idempotency_max_entries, settings.idempotency_ttl_seconds)
+
+idempotency = IdempotencyManager(create_idempotency_store(), settings.idempotency_wait_timeout)
\ No newline at end of file
@@ -0,0 +1,94 @@
+import asyncio
+import math
+import random
+import logging
+from typing import List, Tuple
+from opentelemetry import trace
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+DISTRIBUTIONS = ("fixed", "uniform", "lognormal", "histogram")
+
+class DelayProvider:
+    """Gera atrasos simulados sem bloquear o event loop
+    
+    Cada etapa informa a faixa (low, high) esperada; a distribuição configurada
+    decide como o valor é sorteado dentro dela:
+    - fixed: valor constante (latency_fixed_seconds ou ponto médio da faixa)
+    - uniform: uniforme entre low e high (comportamento original)
+    - lognormal: mediana na média geométrica da faixa, com cauda longa
+    - histogram: sorteio ponderado entre os buckets de latency_histogram
+    """
+    
+    def __init__(
+        self,
+        distribution: str = "uniform",
+        scale: float = 1.0,
+        fixed_seconds: float = None,
+        lognormal_sigma: float = 0.5,
+        max_seconds: float = 5.0,
+        histogram: str = ""
+    ):
+        if distribution not in DISTRIBUTIONS:
+            logger.warning(f"Distribuição de latência desconhecida '{distribution}', usando uniform")
+            distribution = "uniform"
+        
+        self.distribution = distribution
+        self.scale = scale
+        self.fixed_seconds = fixed_seconds
+        self.lognormal_sigma = lognormal_sigma
+        self.max_seconds = max_seconds
+        self.histogram_values, self.histogram_weights = self._parse_histogram(histogram)
+        
+        if self.distribution == "histogram" and not self.histogram_values:
+            logger.warning("Histograma de latência vazio, usando uniform")
+            self.distribution = "uniform"
+    
+    @staticmethod
+    def _parse_histogram(spec: str) -> Tuple[List[float], List[float]]:
+        """Converte "0.1:60,0.5:30" em listas de valores e pesos"""
+        values, weights = [], []
+        for bucket in filter(None, (part.strip() for part in spec.split(","))):
+            try:
+                value, weight = bucket.split(":", 1)
+                values.append(float(value))
+                weights.append(float(weight))
+            except ValueError:
+                logger.warning(f"Bucket de histograma inválido ignorado: '{bucket}'")
+        return values, weights
+    
+    def sample(self, low: float, high: float) -> float:
+        """Sorteia um atraso (em segundos) para a faixa informada"""
+        if self.distribution == "fixed":
+            delay = self.fixed_seconds if self.fixed_seconds is not None else (low + high) / 2
+        elif self.distribution == "lognormal":
+            median = math.sqrt(low * high) if low > 0 else (low + high) / 2
+            delay = random.lognormvariate(math.log(median), self.lognormal_sigma) if median > 0 else 0.0
+        elif self.distribution == "histogram":
+            delay = random.choices(self.histogram_values, weights=self.histogram_weights)[0]
+        else:
+            delay = random.uniform(low, high)
+        
+        return min(max(delay * self.scale, 0.0), self.max_seconds)
+    
+    async def sleep(self, low: float, high: float) -> float:
+        """Aguarda o atraso sorteado sem bloquear outras requisições"""
+        delay = self.sample(low, high)
+        
+        span = trace.get_current_span()
+        span.set_attribute("simulated_delay_ms", round(delay * 1000, 1))
+        
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+# Instância global configurada a partir das settings
+delay_provider = DelayProvider(
+    distribution=settings.latency_distribution,
+    scale=settings.latency_scale,
+    fixed_seconds=settings.latency_fixed_seconds,
+    lognormal_sigma=settings.latency_lognormal_sigma,
+    max_seconds=settings.latency_max_seconds,
+    histogram=settings.latency_histogram
+)
\ No newline at end of file
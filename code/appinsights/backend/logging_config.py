@@ -0,0 +1,142 @@
+import sys
+import json
+import time
+import queue
+import random
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+from opentelemetry import trace
+
+# Contadores de registros descartados (expostos em /api/admin/logging)
+_dropped = {"queue_full": 0, "sampled": 0, "rate_limited": 0}
+_listener: Optional[QueueListener] = None
+
+class TraceContextFilter(logging.Filter):
+    """Anexa trace_id/span_id do span OpenTelemetry ativo ao registro
+    
+    Roda no thread da requisição (antes da fila): o contexto do span não
+    existe mais quando o listener formata o registro.
+    """
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = trace.get_current_span().get_span_context()
+        if context.is_valid:
+            record.trace_id = format(context.trace_id, "032x")
+            record.span_id = format(context.span_id, "016x")
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Amostragem e limite de taxa por logger para registros abaixo de WARNING
+    
+    - sample_rate: fração dos registros DEBUG/INFO mantidos (1.0 = todos)
+    - rate_limit: registros por segundo por logger (token bucket com rajada
+      de um segundo); 0 desativa o limite
+    WARNING e acima nunca são descartados.
+    """
+    
+    def __init__(self, sample_rate: float = 1.0, rate_limit: float = 0.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.rate_limit = rate_limit
+        self._buckets: Dict[str, list] = {}
+        self._lock = threading.Lock()
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            _dropped["sampled"] += 1
+            return False
+        
+        if self.rate_limit > 0 and not self._take_token(record.name):
+            _dropped["rate_limited"] += 1
+            return False
+        return True
+    
+    def _take_token(self, logger_name: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.setdefault(logger_name, [self.rate_limit, now])
+            tokens, last = bucket
+            tokens = min(self.rate_limit, tokens + (now - last) * self.rate_limit)
+            if tokens < 1:
+                bucket[:] = [tokens, now]
+                return False
+            bucket[:] = [tokens - 1, now]
+            return True
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler que adia toda a formatação para o thread do listener
+    
+    O QueueHandler padrão formata a mensagem no thread que chamou o logger;
+    aqui o registro vai para a fila como está (msg % args é resolvido só
+    pelo formatter do listener). Fila cheia descarta e conta o registro em
+    vez de bloquear a requisição.
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped["queue_full"] += 1
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+            entry["span_id"] = record.span_id
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+def setup_logging(settings):
+    """Configura o logging raiz: fila em memória + listener em background
+    
+    Os loggers da aplicação só enfileiram o registro; formatação (JSON ou
+    texto) e escrita em stdout acontecem no thread do QueueListener.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if settings.log_format == "json" else logging.Formatter(TEXT_FORMAT))
+    
+    handler = DeferredQueueHandler(queue.Queue(maxsize=settings.log_queue_size))
+    handler.addFilter(SamplingFilter(settings.log_sample_rate, settings.log_rate_limit_per_logger))
+    handler.addFilter(TraceContextFilter())
+    
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(logging.DEBUG if settings.debug else settings.log_level.upper())
+    
+    _listener = QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+def logging_stats() -> dict:
+    return {
+        "queued": _listener.queue.qsize() if _listener else 0,
+        "dropped": dict(_dropped)
+    }
\ No newline at end of file
@@ -0,0 +1,37 @@
+import time
+import asyncio
+from typing import Optional
+from telemetry import set_event_loop_lag
+from config import settings
+
+class EventLoopLagProbe:
+    """Mede o atraso do loop de eventos em background
+    
+    A tarefa dorme interval segundos e mede quanto acordou atrasada: o
+    excesso é o tempo em que o loop ficou ocupado com código síncrono
+    (CPU, serialização, I/O bloqueante) sem atender outras corrotinas.
+    """
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+    
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag_ms = max((time.perf_counter() - start - self.interval) * 1000, 0.0)
+            set_event_loop_lag(lag_ms)
+
+event_loop_probe = EventLoopLagProbe(settings.metrics_loop_probe_interval)
\ No newline at end of file
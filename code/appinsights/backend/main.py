@@ -1,17 +1,16 @@
+import json
 import logging
-import sys
-import traceback
 from datetime import datetime
-from fastapi import FastAPI, Depends, HTTPException, Query, Request
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from typing import List, Optional
 from contextlib import asynccontextmanager
 
-from database import get_db, db_connection, Base
-from models import Product, Category, Customer, Order
+from database import get_async_db, get_async_read_db, db_connection
+from models import Product, Category, Customer, Order, OrderOutbox
 from schemas import (
     Product as ProductSchema, 
     Category as CategorySchema, 
@@ -19,20 +18,44 @@ from schemas import (
     Order as OrderSchema,
     OrderCreate, 
     OrderResponse, 
+    OrderStatus,
+    BulkOrderResponse,
     HealthCheck
 )
-from services import OrderService
-from telemetry import setup_telemetry, tracer
+from services import OrderService, SCENARIO_SUCCESS, SCENARIO_PAYMENT_ERROR, SCENARIO_STOCK_ERROR
+from cache import catalog_cache
+from health import health_monitor
+from admission import admission_controller, classify_request
+from logging_config import logging_stats
+from idempotency import idempotency, request_fingerprint
+from outbox import OUTBOX_COMPLETED, ensure_outbox_schema
+from etag import etag_matches, not_modified, set_etag
+from pagination import decode_cursor, apply_keyset_page
+from export import export_orders, export_products, MEDIA_TYPES
+from fastjson import (
+    use_fast_json,
+    select_products_projection,
+    select_customers_projection,
+    product_row_to_dict,
+    customer_row_to_dict,
+    fast_json_response,
+    TimedJSONResponse
+)
+from queries import (
+    PRODUCT_WITH_CATEGORY,
+    ORDER_WITH_DETAILS,
+    install_query_counter,
+    install_query_budget_guard,
+    bind_query_budget,
+    start_query_counter,
+    query_budget
+)
+from telemetry import setup_telemetry, tracer, request_db_time_histogram, attribute_policy_stats, tracing_stats
+from loop_monitor import event_loop_probe
+from profiling import request_profiler, FORMAT_SPEEDSCOPE, FORMAT_COLLAPSED
 from config import settings
 
-# Configure logging detalhado
-logging.basicConfig(
-    level=logging.DEBUG,  # Mudou para DEBUG
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# Logging configurado em config.py (ver logging_config.setup_logging)
 logger = logging.getLogger(__name__)
 
 @asynccontextmanager
@@ -44,35 +67,139 @@ async def lifespan(app: FastAPI):
     # Configura telemetria
     setup_telemetry(app)
     
+    await db_connection.test_connection()
+    await health_monitor.start()
+    event_loop_probe.start()
+    
+    await idempotency.store.start()
+    # O modo assíncrono também pode ser pedido por requisição (Prefer)
+    try:
+        await ensure_outbox_schema()
+    except Exception as e:
+        logger.warning(f"Não foi possível criar a tabela order_outbox: {e}")
+    
     yield
     
     # Shutdown
     logger.info("Finalizando aplicação")
+    await health_monitor.stop()
+    await event_loop_probe.stop()
+    await db_connection.dispose()
 
 # Cria a aplicação FastAPI
 app = FastAPI(
     title="Northwind E-commerce API",
     description="API de demonstração do Azure Application Insights com banco de dados Northwind",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # Registra o tempo de serialização das respostas JSON
+    default_response_class=TimedJSONResponse,
+    # Orçamento de queries do endpoint roteado (ver query_budget_middleware)
+    dependencies=[Depends(bind_query_budget)]
 )
 
 # Middleware de tratamento de exceções global
 @app.middleware("http")
 async def catch_exceptions_middleware(request: Request, call_next):
     try:
-        logger.debug(f"Processing request: {request.method} {request.url}")
-        response = await call_next(request)
-        logger.debug(f"Response status: {response.status_code}")
-        return response
+        return await call_next(request)
     except Exception as e:
-        logger.error(f"Unhandled exception for {request.method} {request.url}: {str(e)}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Unhandled exception for %s %s", request.method, request.url)
         return JSONResponse(
             status_code=500,
             content={"detail": f"Internal server error: {str(e)}", "path": str(request.url)}
         )
 
+# Contagem de queries por requisição (orçamento de queries por endpoint);
+# instalada aqui e não em database.py porque queries importa models, que
+# importa database
+install_query_counter(db_connection.async_engine.sync_engine)
+if db_connection.replica_engine is not None:
+    install_query_counter(db_connection.replica_engine.sync_engine)
+if settings.db_query_budget_strict:
+    install_query_budget_guard()
+
+@app.middleware("http")
+async def query_budget_middleware(request: Request, call_next):
+    counter = start_query_counter()
+    response = await call_next(request)
+    
+    response.headers["X-DB-Query-Count"] = str(counter.count)
+    
+    # Rota como template (/api/orders/{order_id}): cardinalidade limitada
+    route = request.scope.get("route")
+    if route is not None:
+        request_db_time_histogram.record(counter.elapsed_ms, {"route": route.path, "method": request.method})
+    
+    if counter.exceeded:
+        logger.warning(
+            f"Orçamento de queries excedido em {request.method} {request.url.path}: "
+            f"{counter.count} queries (limite {counter.budget})"
+        )
+        # Excessos antes de um commit já foram barrados no before_commit; se a
+        # requisição confirmou escritas, trocar a resposta por 500 esconderia
+        # esses efeitos do cliente, então o excesso posterior só vai ao log
+        if settings.db_query_budget_strict and not counter.commits:
+            return JSONResponse(
+                status_code=500,
+                content={
+                    "detail": "Orçamento de queries excedido",
+                    "queries": counter.count,
+                    "budget": counter.budget
+                }
+            )
+    
+    return response
+
+async def profiling_middleware(request: Request, call_next):
+    """Perfila requisições com X-Profile: 1 ou sorteadas por PROFILING_SAMPLE_RATE"""
+    if not request_profiler.should_profile(request):
+        return await call_next(request)
+    return await request_profiler.profile(request, call_next)
+
+# Desabilitado (padrão) o middleware nem é registrado: custo zero
+if settings.profiling_enabled:
+    app.middleware("http")(profiling_middleware)
+
+async def admission_control_middleware(request: Request, call_next):
+    """Descarta com 503 + Retry-After o que excede a capacidade por classe de rota"""
+    route_class = classify_request(request.method, request.url.path)
+    if route_class is None:
+        return await call_next(request)
+    
+    if not await admission_controller.acquire(route_class):
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Servidor sobrecarregado, tente novamente"},
+            headers={"Retry-After": str(settings.admission_retry_after)}
+        )
+    
+    try:
+        response = await call_next(request)
+    except BaseException:
+        admission_controller.release(route_class)
+        raise
+    
+    # call_next retorna assim que os headers ficam prontos: o corpo (ex: as
+    # exportações em StreamingResponse) ainda vai ser gerado, então a vaga só
+    # é liberada quando ele termina (ou a conexão cai)
+    body_iterator = response.body_iterator
+    
+    async def release_after_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            admission_controller.release(route_class)
+    
+    response.body_iterator = release_after_body()
+    return response
+
+# Registrado por último para envolver os demais middlewares (descarta antes
+# de qualquer trabalho); desabilitado não adiciona custo algum
+if settings.admission_control_enabled:
+    app.middleware("http")(admission_control_middleware)
+
 # Configura CORS
 app.add_middleware(
     CORSMiddleware,
@@ -80,30 +207,38 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Link", "X-DB-Query-Count", "Idempotent-Replayed", "Retry-After", "X-Profile-Id"],
 )
 
-# Endpoints de Health Check
+# Endpoints de Health Check (respondidos do estado em memória do HealthMonitor)
 @app.get("/health", response_model=HealthCheck)
-async def health_check(db: Session = Depends(get_db)):
+@query_budget(0)
+async def health_check():
     """Endpoint de verificação de saúde da aplicação"""
-    with tracer.start_as_current_span("health_check"):
-        try:
-            # Testa conexão com banco
-            db.execute(text("SELECT 1")).fetchone()
-            db_status = "healthy"
-        except Exception as e:
-            logger.error(f"Erro na conexão com banco: {e}")
-            db_status = "unhealthy"
-        
-        # Verifica Application Insights
-        app_insights_status = "configured" if settings.applicationinsights_connection_string else "not_configured"
-        
-        return HealthCheck(
-            status="healthy" if db_status == "healthy" else "unhealthy",
-            timestamp=datetime.now(),
-            database_status=db_status,
-            app_insights_status=app_insights_status
-        )
+    db_status = health_monitor.database_status
+    return HealthCheck(
+        status="healthy" if db_status == "healthy" else "unhealthy",
+        timestamp=health_monitor.last_check or datetime.now(),
+        database_status=db_status,
+        app_insights_status=health_monitor.app_insights_status
+    )
+
+@app.get("/livez")
+@query_budget(0)
+async def liveness():
+    """Liveness: o processo e o loop de eventos respondem"""
+    if not health_monitor.is_alive():
+        return JSONResponse(status_code=503, content={"status": "dead"})
+    return {"status": "alive"}
+
+@app.get("/readyz")
+@query_budget(0)
+async def readiness():
+    """Readiness: banco saudável e pool de conexões abaixo do limite de saturação"""
+    state = health_monitor.readiness()
+    if state["status"] != "ready":
+        return JSONResponse(status_code=503, content=state)
+    return state
 
 @app.get("/")
 async def root():
@@ -116,188 +251,562 @@ async def root():
 
 # Endpoints de Produtos
 @app.get("/api/products", response_model=List[ProductSchema])
+@query_budget(1)
 async def get_products(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     category_id: Optional[int] = Query(None),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Paginação por cursor (vazio = primeira página); ignora skip"),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    """Lista produtos com paginação e filtro por categoria"""
+    """Lista produtos com paginação (offset ou cursor) e filtro por categoria"""
     with tracer.start_as_current_span("get_products") as span:
         span.set_attribute("skip", skip)
         span.set_attribute("limit", limit)
         
-        query = db.query(Product).filter(Product.discontinued == 0)
+        # Caminho rápido (opt-in): projeção de colunas serializada com orjson,
+        # sem hidratar objetos ORM nem validar com pydantic
+        fast = use_fast_json(request) and not category_id
+        span.set_attribute("fast_json", fast)
+        
+        if fast:
+            query = select_products_projection().where(Product.discontinued == 0)
+        else:
+            # A categoria aninhada vem no mesmo SELECT (evita N+1 e lazy load,
+            # que não é permitido em AsyncSession)
+            query = (
+                select(Product)
+                .options(*PRODUCT_WITH_CATEGORY)
+                .where(Product.discontinued == 0)
+            )
         
         if category_id:
-            query = query.filter(Product.category_id == category_id)
+            query = query.where(Product.category_id == category_id)
             span.set_attribute("category_id", category_id)
         
-        products = query.offset(skip).limit(limit).all()
+        if cursor is not None:
+            # Keyset: custo constante independente da profundidade da página
+            span.set_attribute("pagination", "keyset")
+            after = decode_cursor(cursor, Product.product_id)
+            if after is not None:
+                query = query.where(Product.product_id > after)
+            query = query.order_by(Product.product_id).limit(limit + 1)
+        else:
+            query = query.order_by(Product.product_id).offset(skip).limit(limit)
+        
+        async def load_products():
+            if fast:
+                result = await db.execute(query)
+                return [product_row_to_dict(row) for row in result]
+            result = await db.scalars(query)
+            return [ProductSchema.model_validate(product) for product in result.all()]
+        
+        # Listagens servidas pelo cache de catálogo; a ETag (hash do conteúdo)
+        # é guardada com a entrada, então o 304 não consulta nem serializa
+        key = catalog_cache.product_list_key(category_id, skip, limit, cursor, fast)
+        etag = catalog_cache.get_tag(key)
+        if etag_matches(request, etag):
+            span.set_attribute("not_modified", True)
+            return not_modified(etag)
+        
+        products, etag = await catalog_cache.get_or_load_tagged(key, load_products)
+        if etag_matches(request, etag):
+            span.set_attribute("not_modified", True)
+            return not_modified(etag)
+        set_etag(response, etag)
+        
+        if cursor is not None:
+            products = apply_keyset_page(products, limit, Product.product_id, request, response)
         
         span.set_attribute("products_count", len(products))
-        logger.info(f"Retornando {len(products)} produtos")
+        logger.info("Retornando %d produtos", len(products))
         
+        if fast:
+            return fast_json_response(products, response)
         return products
 
 @app.get("/api/products/{product_id}", response_model=ProductSchema)
-async def get_product(product_id: int, db: Session = Depends(get_db)):
+@query_budget(1)
+async def get_product(
+    product_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_read_db)
+):
     """Obtém detalhes de um produto específico"""
     with tracer.start_as_current_span("get_product") as span:
         span.set_attribute("product_id", product_id)
         
-        product = db.query(Product).filter(Product.product_id == product_id).first()
+        key = catalog_cache.product_key(product_id)
+        etag = catalog_cache.get_tag(key)
+        if etag_matches(request, etag):
+            span.set_attribute("not_modified", True)
+            return not_modified(etag)
+        
+        async def load_product():
+            product = await db.scalar(
+                select(Product)
+                .options(*PRODUCT_WITH_CATEGORY)
+                .where(Product.product_id == product_id)
+            )
+            return ProductSchema.model_validate(product) if product else None
+        
+        product, etag = await catalog_cache.get_or_load_tagged(key, load_product)
         
         if not product:
-            logger.warning(f"Produto {product_id} não encontrado")
+            logger.warning("Produto %s não encontrado", product_id)
             raise HTTPException(status_code=404, detail="Produto não encontrado")
         
-        logger.info(f"Retornando produto {product.product_name}")
+        if etag_matches(request, etag):
+            span.set_attribute("not_modified", True)
+            return not_modified(etag)
+        set_etag(response, etag)
+        logger.info("Retornando produto %s", product.product_name)
         return product
 
 # Endpoints de Categorias
 @app.get("/api/categories", response_model=List[CategorySchema])
-async def get_categories(db: Session = Depends(get_db)):
+@query_budget(1)
+async def get_categories(request: Request, response: Response, db: AsyncSession = Depends(get_async_read_db)):
     """Lista todas as categorias de produtos"""
-    with tracer.start_as_current_span("get_categories"):
-        categories = db.query(Category).all()
-        
-        logger.info(f"Retornando {len(categories)} categorias")
+    with tracer.start_as_current_span("get_categories") as span:
+        etag = catalog_cache.get_tag(catalog_cache.CATEGORIES_KEY)
+        if etag_matches(request, etag):
+            span.set_attribute("not_modified", True)
+            return not_modified(etag)
+        
+        async def load_categories():
+            result = await db.scalars(select(Category))
+            return [CategorySchema.model_validate(category) for category in result.all()]
+        
+        categories, etag = await catalog_cache.get_or_load_tagged(catalog_cache.CATEGORIES_KEY, load_categories)
+        if etag_matches(request, etag):
+            span.set_attribute("not_modified", True)
+            return not_modified(etag)
+        set_etag(response, etag)
+        
+        logger.info("Retornando %d categorias", len(categories))
         return categories
 
 @app.get("/api/categories/{category_id}", response_model=CategorySchema)
-async def get_category(category_id: int, db: Session = Depends(get_db)):
+@query_budget(1)
+async def get_category(category_id: int, db: AsyncSession = Depends(get_async_read_db)):
     """Obtém detalhes de uma categoria específica"""
     with tracer.start_as_current_span("get_category") as span:
         span.set_attribute("category_id", category_id)
         
-        category = db.query(Category).filter(Category.category_id == category_id).first()
+        async def load_category():
+            category = await db.get(Category, category_id)
+            return CategorySchema.model_validate(category) if category else None
+        
+        category = await catalog_cache.get_or_load(catalog_cache.category_key(category_id), load_category)
         
         if not category:
-            logger.warning(f"Categoria {category_id} não encontrada")
+            logger.warning("Categoria %s não encontrada", category_id)
             raise HTTPException(status_code=404, detail="Categoria não encontrada")
         
         return category
 
 # Endpoints de Clientes
 @app.get("/api/customers", response_model=List[CustomerSchema])
+@query_budget(1)
 async def get_customers(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Paginação por cursor (vazio = primeira página); ignora skip"),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    """Lista clientes com paginação"""
+    """Lista clientes com paginação (offset ou cursor)"""
     with tracer.start_as_current_span("get_customers") as span:
         span.set_attribute("skip", skip)
         span.set_attribute("limit", limit)
         
-        customers = db.query(Customer).offset(skip).limit(limit).all()
+        fast = use_fast_json(request)
+        span.set_attribute("fast_json", fast)
+        
+        query = select_customers_projection() if fast else select(Customer)
+        query = query.order_by(Customer.customer_id)
+        
+        if cursor is not None:
+            span.set_attribute("pagination", "keyset")
+            after = decode_cursor(cursor, Customer.customer_id)
+            if after is not None:
+                query = query.where(Customer.customer_id > after)
+            query = query.limit(limit + 1)
+        else:
+            query = query.offset(skip).limit(limit)
+        
+        if fast:
+            result = await db.execute(query)
+            customers = [customer_row_to_dict(row) for row in result]
+        else:
+            result = await db.scalars(query)
+            customers = result.all()
+        
+        if cursor is not None:
+            customers = apply_keyset_page(customers, limit, Customer.customer_id, request, response)
         
         span.set_attribute("customers_count", len(customers))
+        
+        if fast:
+            return fast_json_response(customers, response)
         return customers
 
 @app.get("/api/customers/{customer_id}", response_model=CustomerSchema)
-async def get_customer(customer_id: str, db: Session = Depends(get_db)):
+@query_budget(1)
+async def get_customer(customer_id: str, db: AsyncSession = Depends(get_async_read_db)):
     """Obtém detalhes de um cliente específico"""
     with tracer.start_as_current_span("get_customer") as span:
         span.set_attribute("customer_id", customer_id)
         
-        customer = db.query(Customer).filter(Customer.customer_id == customer_id).first()
+        customer = await db.get(Customer, customer_id)
         
         if not customer:
-            logger.warning(f"Cliente {customer_id} não encontrado")
+            logger.warning("Cliente %s não encontrado", customer_id)
             raise HTTPException(status_code=404, detail="Cliente não encontrado")
         
         return customer
 
 # Endpoints de Pedidos
 @app.post("/api/orders", response_model=OrderResponse)
-async def create_order(order: OrderCreate, db: Session = Depends(get_db)):
-    """Cria um novo pedido - incluindo cenários de erro para demonstração"""
+@query_budget(7)
+async def create_order(
+    order: OrderCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    prefer: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Cria um novo pedido - incluindo cenários de erro para demonstração
+    
+    Com o header Idempotency-Key, repetições da mesma chave (retries,
+    duplo clique) recebem a resposta original sem processar de novo.
+    
+    No modo assíncrono (ORDER_ASYNC_ENABLED ou Prefer: respond-async) o
+    pedido é gravado com uma entrada no outbox e a resposta é 202; o
+    status final fica em GET /api/orders/{order_id}/status.
+    """
     with tracer.start_as_current_span("create_order") as span:
         span.set_attribute("customer_id", order.customer_id)
         span.set_attribute("items_count", len(order.items))
         
         order_service = OrderService(db)
-        return order_service.create_order(order)
+        async_mode = settings.order_async_enabled or "respond-async" in (prefer or "")
+        span.set_attribute("async_mode", async_mode)
+        if async_mode:
+            response.status_code = 202
+            handler = lambda: order_service.accept_order(order)
+        else:
+            handler = lambda: order_service.create_order(order)
+        
+        if not idempotency_key:
+            return await handler()
+        
+        result, replayed = await idempotency.execute(idempotency_key, request_fingerprint(order), handler)
+        
+        span.set_attribute("idempotent_replayed", replayed)
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return result
+
+def _bulk_too_large(count: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Lote com {count} pedidos excede o limite de {settings.bulk_orders_max_items}"
+    )
+
+async def read_ndjson_orders(request: Request) -> list:
+    """Lê o NDJSON incrementalmente, linha a linha, conforme os chunks chegam
+    
+    Só a linha parcial do fim de cada chunk fica em buffer; o limite de
+    itens é verificado durante a leitura, sem esperar o corpo inteiro.
+    """
+    items = []
+    buffer = b""
+    line_number = 0
+    
+    def parse(line: bytes):
+        nonlocal line_number
+        line_number += 1
+        if not line.strip():
+            return
+        try:
+            items.append(json.loads(line))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"JSON inválido na linha {line_number}")
+        if len(items) > settings.bulk_orders_max_items:
+            raise _bulk_too_large(len(items))
+    
+    async for chunk in request.stream():
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        for line in lines:
+            parse(line)
+    parse(buffer)
+    return items
+
+async def read_bulk_orders(request: Request) -> list:
+    """Lê o corpo do lote: array JSON ou NDJSON (um pedido por linha)"""
+    if "ndjson" in request.headers.get("content-type", ""):
+        return await read_ndjson_orders(request)
+    
+    try:
+        items = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="JSON inválido")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="O corpo deve ser um array de pedidos")
+    
+    if len(items) > settings.bulk_orders_max_items:
+        raise _bulk_too_large(len(items))
+    return items
+
+@app.post("/api/orders/bulk", response_model=BulkOrderResponse)
+async def create_orders_bulk(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Cria pedidos em lote para carga e seeding (array JSON ou NDJSON)
+    
+    Não passa pelos cenários simulados de erro nem pelo atraso artificial.
+    Retorna um resultado por item, na ordem do payload.
+    """
+    with tracer.start_as_current_span("create_orders_bulk") as span:
+        orders = await read_bulk_orders(request)
+        span.set_attribute("orders_count", len(orders))
+        
+        order_service = OrderService(db)
+        return await order_service.create_orders_bulk(orders)
+
+@app.get("/api/orders", response_model=List[OrderSchema])
+@query_budget(2)
+async def get_orders(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    customer_id: Optional[str] = Query(None),
+    cursor: Optional[str] = Query("", description="Cursor retornado em X-Next-Cursor (vazio = primeira página)"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Lista pedidos com paginação por cursor (ordenados por order_id)"""
+    with tracer.start_as_current_span("get_orders") as span:
+        span.set_attribute("limit", limit)
+        
+        query = select(Order).options(*ORDER_WITH_DETAILS).order_by(Order.order_id)
+        
+        if customer_id:
+            query = query.where(Order.customer_id == customer_id)
+            span.set_attribute("customer_id", customer_id)
+        
+        after = decode_cursor(cursor, Order.order_id)
+        if after is not None:
+            query = query.where(Order.order_id > after)
+        
+        result = await db.scalars(query.limit(limit + 1))
+        orders = apply_keyset_page(result.all(), limit, Order.order_id, request, response)
+        
+        span.set_attribute("orders_count", len(orders))
+        return orders
 
 @app.get("/api/orders/{order_id}", response_model=OrderSchema)
-async def get_order(order_id: int, db: Session = Depends(get_db)):
+@query_budget(2)
+async def get_order(order_id: int, db: AsyncSession = Depends(get_async_db)):
     """Obtém detalhes de um pedido específico"""
     with tracer.start_as_current_span("get_order") as span:
         span.set_attribute("order_id", order_id)
         
-        order = db.query(Order).filter(Order.order_id == order_id).first()
+        order = await db.scalar(
+            select(Order)
+            .options(*ORDER_WITH_DETAILS)
+            .where(Order.order_id == order_id)
+        )
         
         if not order:
-            logger.warning(f"Pedido {order_id} não encontrado")
+            logger.warning("Pedido %s não encontrado", order_id)
             raise HTTPException(status_code=404, detail="Pedido não encontrado")
         
         return order
 
+@app.get("/api/orders/{order_id}/status", response_model=OrderStatus)
+@query_budget(2)
+async def get_order_status(order_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Status de processamento de um pedido (modo assíncrono)
+    
+    Pedidos sem entrada no outbox foram processados de forma síncrona.
+    """
+    with tracer.start_as_current_span("get_order_status") as span:
+        span.set_attribute("order_id", order_id)
+        
+        entry = await db.scalar(select(OrderOutbox).where(OrderOutbox.order_id == order_id))
+        if entry:
+            return OrderStatus(
+                order_id=order_id,
+                status=entry.status,
+                attempts=entry.attempts,
+                error=entry.error,
+                created_at=entry.created_at,
+                processed_at=entry.processed_at
+            )
+        
+        if not await db.get(Order, order_id):
+            raise HTTPException(status_code=404, detail="Pedido não encontrado")
+        return OrderStatus(order_id=order_id, status=OUTBOX_COMPLETED)
+
+# Endpoints de Exportação (streaming com cursor server-side)
+@app.get("/api/export/products")
+async def export_products_endpoint(format: str = Query("ndjson", pattern="^(ndjson|csv)$")):
+    """Exporta o catálogo completo de produtos em NDJSON ou CSV"""
+    return StreamingResponse(
+        export_products(format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename=products.{format}"}
+    )
+
+@app.get("/api/export/orders")
+async def export_orders_endpoint(format: str = Query("ndjson", pattern="^(ndjson|csv)$")):
+    """Exporta todos os pedidos com itens em NDJSON ou CSV"""
+    return StreamingResponse(
+        export_orders(format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename=orders.{format}"}
+    )
+
+# Endpoints Administrativos
+async def require_admin_key(x_admin_key: Optional[str] = Header(None)):
+    """Exige o header X-Admin-Key quando ADMIN_API_KEY está configurada"""
+    if settings.admin_api_key and x_admin_key != settings.admin_api_key:
+        raise HTTPException(status_code=403, detail="Acesso administrativo negado")
+
+@app.get("/api/admin/cache", dependencies=[Depends(require_admin_key)])
+async def get_cache_stats():
+    """Estatísticas do cache de catálogo"""
+    return catalog_cache.stats()
+
+@app.get("/api/admin/idempotency", dependencies=[Depends(require_admin_key)])
+async def get_idempotency_stats():
+    """Estatísticas do store de Idempotency-Key"""
+    return idempotency.stats()
+
+@app.get("/api/admin/admission", dependencies=[Depends(require_admin_key)])
+async def get_admission_stats():
+    """Requisições em andamento e na fila do controle de admissão"""
+    return {"enabled": settings.admission_control_enabled, **admission_controller.stats()}
+
+@app.get("/api/admin/logging", dependencies=[Depends(require_admin_key)])
+async def get_logging_stats():
+    """Fila do logging assíncrono e registros descartados (fila cheia, amostragem, limite)"""
+    return logging_stats()
+
+@app.get("/api/admin/metrics", dependencies=[Depends(require_admin_key)])
+async def get_metrics_stats():
+    """Atributos de métricas descartados pela política de cardinalidade"""
+    return attribute_policy_stats()
+
+@app.get("/api/admin/tracing", dependencies=[Depends(require_admin_key)])
+async def get_tracing_stats():
+    """Modo de amostragem e traces mantidos/descartados pelo modo tail"""
+    return tracing_stats()
+
+@app.get("/api/admin/profiles", dependencies=[Depends(require_admin_key)])
+async def list_profiles():
+    """Perfis de requisição guardados em memória (mais recentes primeiro)"""
+    return {"enabled": settings.profiling_enabled, "profiles": request_profiler.list_profiles()}
+
+@app.get("/api/admin/profiles/{profile_id}", dependencies=[Depends(require_admin_key)])
+async def download_profile(
+    profile_id: int,
+    format: str = Query(FORMAT_SPEEDSCOPE, pattern=f"^({FORMAT_SPEEDSCOPE}|{FORMAT_COLLAPSED})$")
+):
+    """Baixa um perfil para o speedscope ou em pilhas colapsadas (flamegraph.pl)"""
+    profile = request_profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    
+    if format == FORMAT_COLLAPSED:
+        media_type, filename = "text/plain", f"profile-{profile_id}.collapsed.txt"
+    else:
+        media_type, filename = "application/json", f"profile-{profile_id}.speedscope.json"
+    return Response(
+        content=request_profiler.render(profile, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.delete("/api/admin/cache", dependencies=[Depends(require_admin_key)])
+async def invalidate_cache(
+    key: Optional[str] = Query(None, description="Chave exata, ex: product:11"),
+    prefix: Optional[str] = Query(None, description="Prefixo, ex: products:")
+):
+    """Invalida entradas do cache de catálogo (sem parâmetros limpa tudo)"""
+    with tracer.start_as_current_span("invalidate_cache") as span:
+        if key:
+            removed = int(catalog_cache.invalidate(key))
+        elif prefix:
+            removed = catalog_cache.invalidate_prefix(prefix)
+        else:
+            removed = catalog_cache.clear()
+        
+        span.set_attribute("removed", removed)
+        logger.info(f"Cache de catálogo invalidado: {removed} entradas removidas")
+        return {"removed": removed, **catalog_cache.stats()}
+
 # Endpoints de Simulação para Demonstração
 @app.post("/api/simulate/success")
-async def simulate_success(db: Session = Depends(get_db)):
+@query_budget(9)
+async def simulate_success(db: AsyncSession = Depends(get_async_db)):
     """Força um cenário de sucesso para demonstração"""
     with tracer.start_as_current_span("simulate_success"):
         
         # Busca um cliente aleatório
-        customer = db.query(Customer).first()
+        customer = await db.scalar(select(Customer).limit(1))
         if not customer:
             raise HTTPException(status_code=404, detail="Nenhum cliente encontrado")
         
         # Busca um produto aleatório
-        product = db.query(Product).filter(Product.discontinued == 0).first()
+        product = await db.scalar(select(Product).where(Product.discontinued == 0).limit(1))
         if not product:
             raise HTTPException(status_code=404, detail="Nenhum produto encontrado")
         
-        # Cria um pedido forçando sucesso
-        original_success_rate = settings.success_rate
-        settings.success_rate = 100
-        settings.error_payment_rate = 0
-        settings.error_stock_rate = 0
+        # Encerra a transação das leituras: o atraso simulado não segura a conexão
+        await db.commit()
+        
+        # Cria um pedido forçando sucesso (cenário explícito, sem alterar settings)
+        order_data = OrderCreate(
+            customer_id=customer.customer_id,
+            items=[{
+                "product_id": product.product_id,
+                "quantity": 1,
+                "unit_price": product.unit_price,
+                "discount": 0
+            }]
+        )
         
-        try:
-            order_data = OrderCreate(
-                customer_id=customer.customer_id,
-                items=[{
-                    "product_id": product.product_id,
-                    "quantity": 1,
-                    "unit_price": product.unit_price,
-                    "discount": 0
-                }]
-            )
-            
-            order_service = OrderService(db)
-            result = order_service.create_order(order_data)
-            
-            return {
-                "message": "Cenário de sucesso executado",
-                "result": result
-            }
-            
-        finally:
-            # Restaura configurações originais
-            settings.success_rate = original_success_rate
+        order_service = OrderService(db)
+        result = await order_service.create_order(order_data, scenario=SCENARIO_SUCCESS)
+        
+        return {
+            "message": "Cenário de sucesso executado",
+            "result": result
+        }
 
 @app.post("/api/simulate/payment-error")
-async def simulate_payment_error(db: Session = Depends(get_db)):
+@query_budget(2)
+async def simulate_payment_error(db: AsyncSession = Depends(get_async_db)):
     """Força um erro de pagamento para demonstração"""
     with tracer.start_as_current_span("simulate_payment_error"):
         
-        customer = db.query(Customer).first()
+        customer = await db.scalar(select(Customer).limit(1))
         if not customer:
             raise HTTPException(status_code=404, detail="Nenhum cliente encontrado")
         
-        product = db.query(Product).filter(Product.discontinued == 0).first()
+        product = await db.scalar(select(Product).where(Product.discontinued == 0).limit(1))
         if not product:
             raise HTTPException(status_code=404, detail="Nenhum produto encontrado")
         
-        # Força erro de pagamento
-        settings.error_payment_rate = 100
-        settings.error_stock_rate = 0
-        settings.success_rate = 0
+        # Encerra a transação das leituras: o atraso simulado não segura a conexão
+        await db.commit()
         
+        # Força erro de pagamento (cenário explícito, sem alterar settings)
         try:
             order_data = OrderCreate(
                 customer_id=customer.customer_id,
@@ -310,7 +819,7 @@ async def simulate_payment_error(db: Session = Depends(get_db)):
             )
             
             order_service = OrderService(db)
-            order_service.create_order(order_data)
+            await order_service.create_order(order_data, scenario=SCENARIO_PAYMENT_ERROR)
             
         except HTTPException as e:
             return {
@@ -318,28 +827,25 @@ async def simulate_payment_error(db: Session = Depends(get_db)):
                 "error": e.detail,
                 "status_code": e.status_code
             }
-        finally:
-            # Restaura configurações (normalmente não chegaria aqui)
-            settings.error_payment_rate = 15
 
 @app.post("/api/simulate/stock-error")
-async def simulate_stock_error(db: Session = Depends(get_db)):
+@query_budget(3)
+async def simulate_stock_error(db: AsyncSession = Depends(get_async_db)):
     """Força um erro de estoque para demonstração"""
     with tracer.start_as_current_span("simulate_stock_error"):
         
-        customer = db.query(Customer).first()
+        customer = await db.scalar(select(Customer).limit(1))
         if not customer:
             raise HTTPException(status_code=404, detail="Nenhum cliente encontrado")
         
-        product = db.query(Product).filter(Product.discontinued == 0).first()
+        product = await db.scalar(select(Product).where(Product.discontinued == 0).limit(1))
         if not product:
             raise HTTPException(status_code=404, detail="Nenhum produto encontrado")
         
-        # Força erro de estoque
-        settings.error_payment_rate = 0
-        settings.error_stock_rate = 100
-        settings.success_rate = 0
+        # Encerra a transação das leituras: o atraso simulado não segura a conexão
+        await db.commit()
         
+        # Força erro de estoque (cenário explícito, sem alterar settings)
         try:
             order_data = OrderCreate(
                 customer_id=customer.customer_id,
@@ -352,7 +858,7 @@ async def simulate_stock_error(db: Session = Depends(get_db)):
             )
             
             order_service = OrderService(db)
-            order_service.create_order(order_data)
+            await order_service.create_order(order_data, scenario=SCENARIO_STOCK_ERROR)
             
         except HTTPException as e:
             return {
@@ -360,9 +866,6 @@ async def simulate_stock_error(db: Session = Depends(get_db)):
                 "error": e.detail,
                 "status_code": e.status_code
             }
-        finally:
-            # Restaura configurações (normalmente não chegaria aqui)
-            settings.error_stock_rate = 15
 
 # Handler global de exceções
 @app.exception_handler(Exception)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -94,4 +94,33 @@ class OrderDetail(Base):
     discount = Column(Float, default=0)
     
     order = relationship("Order", back_populates="order_details")
-    product = relationship("Product")
\ No newline at end of file
+    product = relationship("Product")
+
+class IdempotencyKey(Base):
+    """Respostas de pedidos por Idempotency-Key (store "postgres")"""
+    __tablename__ = "idempotency_keys"
+    
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    # Nulo enquanto o pedido está em processamento
+    response = Column(JSON)
+    created_at = Column(DateTime, nullable=False)
+
+class OrderOutbox(Base):
+    """Pedidos aceitos no modo assíncrono, aguardando o worker (worker.py)"""
+    __tablename__ = "order_outbox"
+    __table_args__ = (Index("ix_order_outbox_status_available", "status", "available_at"),)
+    
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, ForeignKey("orders.order_id"), nullable=False, index=True)
+    # OrderCreate original (itens e cliente) e total calculado no aceite
+    payload = Column(JSON, nullable=False)
+    total_amount = Column(Float, nullable=False)
+    # pending -> processing -> completed | failed
+    status = Column(String(20), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    created_at = Column(DateTime, nullable=False)
+    available_at = Column(DateTime, nullable=False)
+    locked_until = Column(DateTime)
+    processed_at = Column(DateTime)
\ No newline at end of file
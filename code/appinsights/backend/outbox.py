@@ -0,0 +1,96 @@
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import db_connection
+from models import OrderOutbox
+from schemas import OrderCreate
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_PENDING = "pending"
+OUTBOX_PROCESSING = "processing"
+OUTBOX_COMPLETED = "completed"
+OUTBOX_FAILED = "failed"
+
+async def ensure_outbox_schema():
+    """Cria a tabela order_outbox caso ainda não exista"""
+    async with db_connection.async_engine.begin() as conn:
+        await conn.run_sync(OrderOutbox.__table__.create, checkfirst=True)
+
+def outbox_entry_values(order_id: int, order_data: OrderCreate, total_amount: float) -> dict:
+    """Colunas da entrada do outbox, gravada na mesma transação do pedido"""
+    now = datetime.utcnow()
+    return {
+        "order_id": order_id,
+        "payload": order_data.model_dump(mode="json"),
+        "total_amount": total_amount,
+        "status": OUTBOX_PENDING,
+        "attempts": 0,
+        "created_at": now,
+        "available_at": now
+    }
+
+async def claim_entries(session: AsyncSession, batch_size: int, lease_seconds: float) -> List[OrderOutbox]:
+    """Reserva um lote de entradas para este worker
+    
+    FOR UPDATE SKIP LOCKED permite vários workers sem disputa pelas mesmas
+    linhas. Entradas em processing com a reserva vencida (worker que caiu)
+    voltam a ser elegíveis.
+    """
+    now = datetime.utcnow()
+    candidates = (
+        select(OrderOutbox.id)
+        .where(
+            or_(
+                and_(OrderOutbox.status == OUTBOX_PENDING, OrderOutbox.available_at <= now),
+                and_(OrderOutbox.status == OUTBOX_PROCESSING, OrderOutbox.locked_until < now)
+            )
+        )
+        .order_by(OrderOutbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    result = await session.execute(
+        update(OrderOutbox)
+        .where(OrderOutbox.id.in_(candidates))
+        .values(
+            status=OUTBOX_PROCESSING,
+            attempts=OrderOutbox.attempts + 1,
+            locked_until=now + timedelta(seconds=lease_seconds)
+        )
+        .returning(OrderOutbox)
+        .execution_options(synchronize_session=False)
+    )
+    entries = result.scalars().all()
+    await session.commit()
+    return entries
+
+async def finish_entry(
+    session: AsyncSession,
+    entry_id: int,
+    status: str,
+    error: Optional[str] = None,
+    retry_at: Optional[datetime] = None
+):
+    """Grava o resultado; com retry_at a entrada volta para pending"""
+    values = {"status": status, "error": error, "locked_until": None}
+    if retry_at is not None:
+        values["available_at"] = retry_at
+    else:
+        values["processed_at"] = datetime.utcnow()
+    
+    await session.execute(update(OrderOutbox).where(OrderOutbox.id == entry_id).values(**values))
+    await session.commit()
+
+async def queue_stats(session: AsyncSession) -> Tuple[int, float]:
+    """Profundidade da fila e idade (segundos) da entrada pendente mais antiga"""
+    depth, oldest = (
+        await session.execute(
+            select(func.count(), func.min(OrderOutbox.created_at))
+            .where(OrderOutbox.status.in_([OUTBOX_PENDING, OUTBOX_PROCESSING]))
+        )
+    ).one()
+    age = (datetime.utcnow() - oldest).total_seconds() if oldest is not None else 0.0
+    return depth, age
\ No newline at end of file
@@ -0,0 +1,62 @@
+import json
+import base64
+import binascii
+from typing import Any, List, Optional
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import Column
+
+def encode_cursor(column: Column, last_key: Any) -> str:
+    """Gera o cursor opaco a partir da coluna de ordenação e da chave do último item"""
+    raw = json.dumps({"c": column.key, "k": last_key}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, column: Column) -> Optional[Any]:
+    """Extrai a chave do cursor; cursor vazio significa primeira página
+    
+    O cursor precisa ter sido gerado para a mesma coluna de ordenação e a
+    chave precisa ter o tipo da coluna: cursores de outro endpoint ou
+    adulterados resultam em 400, nunca em erro do banco.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido")
+    
+    if not isinstance(payload, dict) or payload.keys() != {"c", "k"} or payload["c"] != column.key:
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido para este endpoint")
+    
+    key = payload["k"]
+    # bool é subclasse de int, mas nunca é uma chave válida
+    if isinstance(key, bool) or not isinstance(key, column.type.python_type):
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido para este endpoint")
+    return key
+
+def apply_keyset_page(
+    rows: List[Any],
+    limit: int,
+    column: Column,
+    request: Request,
+    response: Response
+) -> List[Any]:
+    """Recorta a página e publica o próximo cursor nos headers
+    
+    A query deve buscar limit + 1 linhas: a linha extra indica que existe
+    uma próxima página. O cursor vai em X-Next-Cursor e no header Link
+    (rel="next"), mantendo o corpo como lista para os clientes atuais.
+    As linhas podem ser objetos ORM ou dicts (caminho rápido).
+    """
+    if len(rows) <= limit:
+        return rows
+    
+    page = rows[:limit]
+    last = page[-1]
+    last_key = last[column.key] if isinstance(last, dict) else getattr(last, column.key)
+    next_cursor = encode_cursor(column, last_key)
+    next_url = request.url.include_query_params(cursor=next_cursor)
+    
+    response.headers["X-Next-Cursor"] = next_cursor
+    response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return page
\ No newline at end of file
@@ -0,0 +1,115 @@
+import random
+import itertools
+from collections import deque
+from datetime import datetime
+from typing import Deque, List, Optional
+from fastapi import Request
+from pyinstrument import Profiler
+from pyinstrument.renderers import SpeedscopeRenderer
+from config import settings
+
+# Formatos de download: speedscope (https://www.speedscope.app) ou pilhas
+# colapsadas para flamegraph.pl / inferno
+FORMAT_SPEEDSCOPE = "speedscope"
+FORMAT_COLLAPSED = "collapsed"
+
+# Administração (inclusive o download dos perfis) e probes não são perfilados
+EXCLUDED_PREFIXES = ("/api/admin", "/livez", "/readyz", "/health")
+
+class RequestProfile:
+    """Perfil de uma requisição guardado no anel em memória"""
+    
+    def __init__(self, profile_id: int, method: str, path: str, status_code: int, duration_ms: float, session):
+        self.profile_id = profile_id
+        self.method = method
+        self.path = path
+        self.status_code = status_code
+        self.duration_ms = duration_ms
+        self.created_at = datetime.now()
+        self.session = session
+    
+    def summary(self) -> dict:
+        return {
+            "id": self.profile_id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": self.status_code,
+            "duration_ms": round(self.duration_ms, 2),
+            "created_at": self.created_at.isoformat()
+        }
+
+def collapsed_stacks(session) -> str:
+    """Pilhas no formato "a;b;c <microssegundos>" (tempo próprio de cada frame)"""
+    lines = []
+    
+    def walk(frame, stack: List[str]):
+        name = f"{frame.function} ({frame.file_path_short}:{frame.line_no})".replace(";", ",")
+        stack = stack + [name]
+        self_time = frame.time - sum(child.time for child in frame.children)
+        if round(self_time * 1_000_000) > 0:
+            lines.append(f"{';'.join(stack)} {round(self_time * 1_000_000)}")
+        for child in frame.children:
+            walk(child, stack)
+    
+    root = session.root_frame()
+    if root is not None:
+        walk(root, [])
+    return "\n".join(lines) + "\n"
+
+class RequestProfiler:
+    """Profiling amostral (pyinstrument) de requisições individuais
+    
+    Uma requisição é perfilada com o header X-Profile: 1 (exige X-Admin-Key
+    quando ADMIN_API_KEY está definido) ou sorteada por sample_rate. O
+    pyinstrument em async_mode registra só o contexto da requisição, com o
+    tempo em await atribuído ao ponto de espera. Os últimos max_profiles
+    perfis ficam num anel em memória; o mais antigo sai ao entrar um novo.
+    """
+    
+    def __init__(self, sample_rate: float, max_profiles: int, interval: float):
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self._profiles: Deque[RequestProfile] = deque(maxlen=max_profiles)
+        self._ids = itertools.count(1)
+    
+    def should_profile(self, request: Request) -> bool:
+        if request.url.path.startswith(EXCLUDED_PREFIXES):
+            return False
+        if request.headers.get("x-profile") == "1":
+            return not settings.admin_api_key or request.headers.get("x-admin-key") == settings.admin_api_key
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+    
+    async def profile(self, request: Request, call_next):
+        profiler = Profiler(interval=self.interval, async_mode="enabled")
+        profiler.start()
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+        finally:
+            session = profiler.stop()
+            profile = RequestProfile(
+                next(self._ids), request.method, request.url.path, status_code, session.duration * 1000, session
+            )
+            self._profiles.append(profile)
+        
+        response.headers["X-Profile-Id"] = str(profile.profile_id)
+        return response
+    
+    def list_profiles(self) -> List[dict]:
+        return [profile.summary() for profile in reversed(self._profiles)]
+    
+    def get(self, profile_id: int) -> Optional[RequestProfile]:
+        return next((profile for profile in self._profiles if profile.profile_id == profile_id), None)
+    
+    @staticmethod
+    def render(profile: RequestProfile, output_format: str) -> str:
+        if output_format == FORMAT_COLLAPSED:
+            return collapsed_stacks(profile.session)
+        return SpeedscopeRenderer().render(profile.session)
+
+request_profiler = RequestProfiler(
+    sample_rate=settings.profiling_sample_rate,
+    max_profiles=settings.profiling_max_profiles,
+    interval=settings.profiling_interval
+)
\ No newline at end of file
@@ -0,0 +1,130 @@
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from fastapi import HTTPException, Request
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload, selectinload
+from models import Product, Order
+
+logger = logging.getLogger(__name__)
+
+# Perfis de carregamento: evitam N+1 nas relações serializadas pelos schemas
+# - Produto -> categoria (many-to-one): JOIN na mesma query
+# - Pedido -> itens (one-to-many): uma query extra com IN (...)
+PRODUCT_WITH_CATEGORY = (joinedload(Product.category),)
+ORDER_WITH_DETAILS = (selectinload(Order.order_details),)
+
+class QueryCounter:
+    """Contador de queries SQL (e do tempo gasto nelas) durante uma requisição"""
+    
+    def __init__(self):
+        self.count = 0
+        self.elapsed_ms = 0.0
+        # Orçamento do endpoint roteado (bind_query_budget) e commits feitos
+        self.budget: Optional[int] = None
+        self.commits = 0
+    
+    @property
+    def exceeded(self) -> bool:
+        return self.budget is not None and self.count > self.budget
+
+class QueryBudgetExceeded(HTTPException):
+    """Commit recusado: a requisição excedeu o orçamento de queries (modo estrito)"""
+    
+    def __init__(self, count: int, budget: int):
+        super().__init__(
+            status_code=500,
+            detail=f"Orçamento de queries excedido: {count} queries (limite {budget})"
+        )
+
+_current_counter: ContextVar[Optional[QueryCounter]] = ContextVar("db_query_counter", default=None)
+
+def install_query_counter(engine):
+    """Registra o contador de queries no engine (sync) informado"""
+    
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count_query(conn, cursor, statement, parameters, context, executemany):
+        counter = _current_counter.get()
+        if counter is not None:
+            counter.count += 1
+            context._counted_query_start = time.perf_counter()
+    
+    @event.listens_for(engine, "after_cursor_execute")
+    def _time_query(conn, cursor, statement, parameters, context, executemany):
+        counter = _current_counter.get()
+        start = getattr(context, "_counted_query_start", None)
+        if counter is not None and start is not None:
+            counter.elapsed_ms += (time.perf_counter() - start) * 1000
+
+def _check_budget(session):
+    counter = _current_counter.get()
+    if counter is not None and counter.exceeded:
+        raise QueryBudgetExceeded(counter.count, counter.budget)
+
+def _count_commit(session):
+    counter = _current_counter.get()
+    if counter is not None:
+        counter.commits += 1
+
+def install_query_budget_guard():
+    """Modo estrito: recusa o commit de requisições acima do orçamento
+    
+    O before_commit roda antes de qualquer escrita ser confirmada, então a
+    requisição falha com 500 sem deixar efeitos no banco (a sessão é
+    descartada com rollback pela dependency). Instalar de novo não duplica
+    os hooks.
+    """
+    if not event.contains(Session, "before_commit", _check_budget):
+        event.listen(Session, "before_commit", _check_budget)
+        event.listen(Session, "after_commit", _count_commit)
+
+def remove_query_budget_guard():
+    """Remove os hooks do modo estrito (testes)"""
+    if event.contains(Session, "before_commit", _check_budget):
+        event.remove(Session, "before_commit", _check_budget)
+        event.remove(Session, "after_commit", _count_commit)
+
+async def bind_query_budget(request: Request):
+    """Dependency global: informa ao contador o orçamento do endpoint roteado
+    
+    O middleware roda antes do roteamento; só a partir daqui o endpoint
+    (e seu orçamento) é conhecido.
+    """
+    counter = _current_counter.get()
+    if counter is not None:
+        counter.budget = get_query_budget(request.scope.get("endpoint"))
+
+def start_query_counter() -> QueryCounter:
+    """Inicia a contagem de queries no contexto atual"""
+    counter = QueryCounter()
+    _current_counter.set(counter)
+    return counter
+
+@contextmanager
+def uncounted_queries():
+    """Executa queries auxiliares (fora do fluxo do endpoint) sem contá-las"""
+    token = _current_counter.set(None)
+    try:
+        yield
+    finally:
+        _current_counter.reset(token)
+
+def query_budget(max_queries: int):
+    """Decorator que declara o orçamento de queries de um endpoint
+    
+    Deve ficar abaixo do decorator de rota do FastAPI. O middleware de
+    orçamento compara a contagem da requisição com este valor; no modo
+    estrito o commit acima do orçamento é recusado (install_query_budget_guard).
+    """
+    
+    def decorator(endpoint):
+        endpoint.__query_budget__ = max_queries
+        return endpoint
+    
+    return decorator
+
+def get_query_budget(endpoint) -> Optional[int]:
+    """Retorna o orçamento declarado para o endpoint (ou None)"""
+    return getattr(endpoint, "__query_budget__", None)
\ No newline at end of file
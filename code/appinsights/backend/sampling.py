@@ -0,0 +1,96 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON, ParentBased, Sampler, TraceIdRatioBased
+from opentelemetry.trace import StatusCode
+
+# Modos de amostragem (TRACING_SAMPLING)
+SAMPLING_ALWAYS_ON = "always_on"
+SAMPLING_RATIO = "ratio"
+SAMPLING_TAIL = "tail"
+
+# Spans de banco (TRACING_DB_SPANS): as duas instrumentações geram um span
+# por query cada, com os mesmos dados
+DB_SPANS_SQLALCHEMY = "sqlalchemy"
+DB_SPANS_PSYCOPG2 = "psycopg2"
+DB_SPANS_BOTH = "both"
+DB_SPANS_NONE = "none"
+
+def build_sampler(mode: str, ratio: float) -> Sampler:
+    """Sampler de cabeça para o modo configurado
+    
+    Todos respeitam a decisão do chamador (ParentBased): um trace começa
+    amostrado ou não no serviço de origem e é mantido inteiro. No modo tail
+    tudo é gravado e a decisão fica com TailSamplingSpanProcessor.
+    """
+    if mode == SAMPLING_RATIO:
+        return ParentBased(TraceIdRatioBased(ratio))
+    return ParentBased(ALWAYS_ON)
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """Decide no fim do trace local se os spans são exportados
+    
+    Os spans ficam em memória até o span raiz local (sem pai ou com pai
+    remoto) terminar. O trace é mantido se algum span terminou com erro, se
+    a raiz passou de latency_threshold_ms ou, para os demais, pela fração
+    ratio (pelo trace_id, como TraceIdRatioBased). Só então os spans seguem
+    para o processor de exportação (delegate).
+    
+    O buffer é limitado a max_traces traces em andamento; acima disso o mais
+    antigo é descartado. Spans que terminam depois da raiz (tarefas em
+    background) abrem um buffer que só sai por esse descarte.
+    """
+    
+    def __init__(self, delegate: SpanProcessor, ratio: float, latency_threshold_ms: float, max_traces: int):
+        self.delegate = delegate
+        self.latency_threshold_ns = latency_threshold_ms * 1_000_000
+        self.max_traces = max_traces
+        self._ratio_bound = TraceIdRatioBased.get_bound_for_rate(ratio)
+        self._traces: "OrderedDict[int, List[ReadableSpan]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"kept_error": 0, "kept_slow": 0, "kept_sampled": 0, "dropped": 0, "evicted": 0}
+    
+    def on_start(self, span: Span, parent_context: Optional[Context] = None):
+        self.delegate.on_start(span, parent_context=parent_context)
+    
+    def on_end(self, span: ReadableSpan):
+        trace_id = span.context.trace_id
+        is_local_root = span.parent is None or span.parent.is_remote
+        
+        with self._lock:
+            if not is_local_root:
+                self._traces.setdefault(trace_id, []).append(span)
+                if len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+                    self._stats["evicted"] += 1
+                return
+            spans = self._traces.pop(trace_id, [])
+        
+        spans.append(span)
+        reason = self._keep_reason(span, spans)
+        self._stats[reason or "dropped"] += 1
+        if reason is not None:
+            for finished in spans:
+                self.delegate.on_end(finished)
+    
+    def _keep_reason(self, root: ReadableSpan, spans: List[ReadableSpan]) -> Optional[str]:
+        if any(finished.status.status_code is StatusCode.ERROR for finished in spans):
+            return "kept_error"
+        if root.end_time - root.start_time >= self.latency_threshold_ns:
+            return "kept_slow"
+        if root.context.trace_id & TraceIdRatioBased.TRACE_ID_LIMIT < self._ratio_bound:
+            return "kept_sampled"
+        return None
+    
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._traces)
+        return {"pending_traces": pending, **self._stats}
+    
+    def shutdown(self):
+        self.delegate.shutdown()
+    
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.delegate.force_flush(timeout_millis)
\ No newline at end of file
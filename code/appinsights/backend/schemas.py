@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -49,9 +49,10 @@ class Customer(CustomerBase):
 
 class OrderDetailCreate(BaseModel):
     product_id: int
-    quantity: int
-    unit_price: Optional[float] = None
-    discount: Optional[float] = 0
+    quantity: int = Field(gt=0)
+    unit_price: Optional[float] = Field(None, ge=0)
+    # Fração de 0 a 1; null equivale a sem desconto
+    discount: Optional[float] = Field(0, ge=0, le=1)
 
 class OrderDetail(OrderDetailCreate):
     order_id: int
@@ -94,6 +95,27 @@ class OrderResponse(BaseModel):
     total_amount: Optional[float] = None
     scenario: Optional[str] = None
 
+class OrderStatus(BaseModel):
+    order_id: int
+    status: str
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    processed_at: Optional[datetime] = None
+
+class BulkOrderResult(BaseModel):
+    index: int
+    success: bool
+    order_id: Optional[int] = None
+    total_amount: Optional[float] = None
+    error: Optional[str] = None
+
+class BulkOrderResponse(BaseModel):
+    total: int
+    created: int
+    failed: int
+    results: List[BulkOrderResult]
+
 class HealthCheck(BaseModel):
     status: str
     timestamp: datetime
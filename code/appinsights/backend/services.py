@@ -1,42 +1,106 @@
-import random
 import time
+import random
+import bisect
 import logging
+from collections import defaultdict
+from itertools import accumulate
+from typing import Any, Callable, List, Optional, Tuple
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy import Integer, column, insert, select, update, values
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
-from models import Order, OrderDetail, Product, Customer
-from schemas import OrderCreate, OrderResponse
+from pydantic import ValidationError
+from models import Order, OrderDetail, OrderOutbox, Product, Customer
+from outbox import outbox_entry_values
+from schemas import OrderCreate, OrderResponse, BulkOrderResult, BulkOrderResponse
 from opentelemetry import trace
-from telemetry import tracer, orders_counter, revenue_counter, conversion_counter, error_counter
+from latency import delay_provider
+from cache import catalog_cache
+from telemetry import (
+    tracer,
+    orders_counter,
+    revenue_counter,
+    conversion_counter,
+    error_counter,
+    stock_lock_wait_histogram,
+    stock_reservations_counter,
+    order_stage
+)
+from database import db_connection
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+SCENARIO_SUCCESS = "success"
+SCENARIO_PAYMENT_ERROR = "payment_error"
+SCENARIO_STOCK_ERROR = "stock_error"
+# Resposta do modo assíncrono: pedido gravado, processamento pendente no outbox
+SCENARIO_ACCEPTED = "accepted"
+
+# IDs por query IN nas cargas em lote (asyncpg aceita até 32767 parâmetros)
+IN_CHUNK_SIZE = 1000
+
+class ScenarioChooser:
+    """Sorteia o cenário do pedido a partir de pesos fixos
+    
+    A distribuição acumulada é calculada uma única vez; cada sorteio é uma
+    busca binária, sem ler nem alterar as settings globais.
+    """
+    
+    def __init__(self, weights: dict):
+        active = {name: weight for name, weight in weights.items() if weight > 0}
+        if not active:
+            active = {SCENARIO_SUCCESS: 1}
+        
+        self.scenarios = list(active)
+        self._cumulative = list(accumulate(active.values()))
+        self._total = self._cumulative[-1]
+    
+    @classmethod
+    def from_settings(cls) -> "ScenarioChooser":
+        return cls({
+            SCENARIO_PAYMENT_ERROR: settings.error_payment_rate,
+            SCENARIO_STOCK_ERROR: settings.error_stock_rate,
+            SCENARIO_SUCCESS: settings.success_rate
+        })
+    
+    def choose(self) -> str:
+        index = bisect.bisect_right(self._cumulative, random.uniform(0, self._total))
+        return self.scenarios[min(index, len(self.scenarios) - 1)]
+
+# Distribuição padrão, definida pelas taxas configuradas no startup
+default_scenario_chooser = ScenarioChooser.from_settings()
+
 class OrderService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession, scenario_chooser: ScenarioChooser = None):
         self.db = db
+        self.scenario_chooser = scenario_chooser or default_scenario_chooser
     
-    def create_order(self, order_data: OrderCreate) -> OrderResponse:
-        """Processa um pedido com diferentes cenários de sucesso/erro"""
+    async def create_order(self, order_data: OrderCreate, scenario: Optional[str] = None) -> OrderResponse:
+        """Processa um pedido com diferentes cenários de sucesso/erro
+        
+        scenario força um cenário específico apenas para esta chamada; sem ele
+        o cenário é sorteado pela distribuição configurada.
+        """
         
         with tracer.start_as_current_span("order_processing") as span:
             span.set_attribute("customer_id", order_data.customer_id)
             span.set_attribute("items_count", len(order_data.items))
             
             try:
-                # Determina o cenário baseado nas probabilidades configuradas
-                scenario = self._determine_scenario()
+                # Determina o cenário (explícito ou sorteado pelas probabilidades)
+                scenario = scenario or self.scenario_chooser.choose()
                 span.set_attribute("scenario", scenario)
                 
-                logger.info(f"Processando pedido para cliente {order_data.customer_id}, cenário: {scenario}")
+                logger.info("Processando pedido para cliente %s, cenário: %s", order_data.customer_id, scenario)
                 
                 # Executa o cenário apropriado
-                if scenario == "payment_error":
-                    return self._simulate_payment_error(order_data)
-                elif scenario == "stock_error":
-                    return self._simulate_stock_error(order_data)
+                if scenario == SCENARIO_PAYMENT_ERROR:
+                    return await self._simulate_payment_error(order_data)
+                elif scenario == SCENARIO_STOCK_ERROR:
+                    return await self._simulate_stock_error(order_data)
                 else:
-                    return self._process_successful_order(order_data)
+                    return await self._process_successful_order(order_data)
                     
             except HTTPException:
                 # Re-lança HTTPException sem modificar (para erros simulados)
@@ -48,93 +112,445 @@ class OrderService:
                 error_counter.add(1, {"error_type": "unexpected", "operation": "order_processing"})
                 raise HTTPException(status_code=500, detail="Erro interno do servidor")
     
-    def _determine_scenario(self) -> str:
-        """Determina qual cenário executar baseado nas probabilidades"""
-        rand = random.randint(1, 100)
-        
-        if rand <= settings.error_payment_rate:
-            return "payment_error"
-        elif rand <= settings.error_payment_rate + settings.error_stock_rate:
-            return "stock_error"
-        else:
-            return "success"
-    
-    def _process_successful_order(self, order_data: OrderCreate) -> OrderResponse:
+    async def _process_successful_order(self, order_data: OrderCreate) -> OrderResponse:
         """Processa um pedido com sucesso"""
         with tracer.start_as_current_span("successful_order_processing"):
             
-            # Verifica se o cliente existe
-            customer = self.db.query(Customer).filter(Customer.customer_id == order_data.customer_id).first()
-            if not customer:
-                raise HTTPException(status_code=404, detail="Cliente não encontrado")
-            
-            # Calcula o total do pedido
-            total_amount = 0
-            for item in order_data.items:
-                product = self.db.query(Product).filter(Product.product_id == item.product_id).first()
-                if not product:
-                    raise HTTPException(status_code=404, detail=f"Produto {item.product_id} não encontrado")
-                
-                item_price = item.unit_price if item.unit_price else product.unit_price
-                total_amount += item_price * item.quantity * (1 - item.discount)
-            
-            # Simula tempo de processamento
-            time.sleep(random.uniform(0.1, 0.5))
-            
-            # Cria o pedido
-            new_order = Order(
-                customer_id=order_data.customer_id,
-                order_date=datetime.now(),
-                required_date=datetime.now() + timedelta(days=7),
-                freight=total_amount * 0.1,  # 10% do valor como frete
-                ship_name=order_data.ship_name or customer.company_name,
-                ship_address=order_data.ship_address or customer.address,
-                ship_city=order_data.ship_city or customer.city,
-                ship_region=order_data.ship_region or customer.region,
-                ship_postal_code=order_data.ship_postal_code or customer.postal_code,
-                ship_country=order_data.ship_country or customer.country
-            )
+            # Simula tempo de processamento antes da primeira query: a
+            # conexão só é retirada do pool (e a transação aberta) depois
+            with order_stage("processing"):
+                await delay_provider.sleep(0.1, 0.5)
             
-            self.db.add(new_order)
-            self.db.flush()  # Para obter o order_id
+            with order_stage("prepare"):
+                customer, products, total_amount, detail_rows = await self._prepare_order(order_data)
             
-            # Adiciona os itens do pedido
-            for item in order_data.items:
-                product = self.db.query(Product).filter(Product.product_id == item.product_id).first()
-                item_price = item.unit_price if item.unit_price else product.unit_price
-                
-                order_detail = OrderDetail(
-                    order_id=new_order.order_id,
-                    product_id=item.product_id,
-                    unit_price=item_price,
-                    quantity=item.quantity,
-                    discount=item.discount
-                )
-                self.db.add(order_detail)
+            with order_stage("persist"):
+                order_id = await self._insert_order(order_data, customer, total_amount, detail_rows)
+                await self.db.commit()
             
-            self.db.commit()
+            # Com reserva de estoque os produtos do pedido mudaram: invalida o catálogo
+            if settings.stock_reservation_enabled:
+                self._catalog_changed(products.keys())
             
-            # Registra métricas de sucesso
-            orders_counter.add(1, {"status": "success", "customer_id": order_data.customer_id})
-            revenue_counter.add(total_amount, {"currency": "BRL"})
-            conversion_counter.add(1, {"type": "success"})
+            self._record_success(order_data, total_amount)
             
-            logger.info(f"Pedido {new_order.order_id} criado com sucesso. Total: R$ {total_amount:.2f}")
+            logger.info("Pedido %s criado com sucesso. Total: R$ %.2f", order_id, total_amount)
             
             return OrderResponse(
                 success=True,
                 message="Pedido processado com sucesso",
-                order_id=new_order.order_id,
+                order_id=order_id,
                 total_amount=total_amount,
                 scenario="success"
             )
     
-    def _simulate_payment_error(self, order_data: OrderCreate) -> OrderResponse:
+    async def accept_order(self, order_data: OrderCreate) -> OrderResponse:
+        """Modo assíncrono: grava o pedido e sua entrada no outbox e retorna
+        
+        Pedido, itens e outbox são gravados na mesma transação; pagamento e
+        estoque são processados depois pelo worker (worker.py).
+        """
+        with tracer.start_as_current_span("order_accept") as span:
+            with order_stage("prepare"):
+                customer, products, total_amount, detail_rows = await self._prepare_order(order_data)
+            
+            with order_stage("persist"):
+                order_id = await self._insert_order(order_data, customer, total_amount, detail_rows)
+                await self.db.execute(insert(OrderOutbox).values(**outbox_entry_values(order_id, order_data, total_amount)))
+                await self.db.commit()
+            
+            if settings.stock_reservation_enabled:
+                self._catalog_changed(products.keys())
+            span.set_attribute("order_id", order_id)
+            logger.info("Pedido %s aceito para processamento assíncrono", order_id)
+            
+            return OrderResponse(
+                success=True,
+                message="Pedido aceito para processamento",
+                order_id=order_id,
+                total_amount=total_amount,
+                scenario=SCENARIO_ACCEPTED
+            )
+    
+    async def process_accepted_order(self, order_data: OrderCreate, total_amount: float) -> str:
+        """Executa as etapas de pagamento e estoque de um pedido aceito
+        
+        Usado pelo worker do outbox. Erros simulados são propagados como
+        HTTPException (503 pagamento, 409 estoque), como no modo síncrono.
+        """
+        with tracer.start_as_current_span("order_processing") as span:
+            scenario = self.scenario_chooser.choose()
+            span.set_attribute("scenario", scenario)
+            
+            if scenario == SCENARIO_PAYMENT_ERROR:
+                await self._simulate_payment_error(order_data)
+            elif scenario == SCENARIO_STOCK_ERROR:
+                await self._simulate_stock_error(order_data)
+            
+            with order_stage("processing"):
+                await delay_provider.sleep(0.1, 0.5)
+            self._record_success(order_data, total_amount)
+            return scenario
+    
+    async def create_orders_bulk(self, raw_orders: List[Any]) -> BulkOrderResponse:
+        """Cria pedidos em lote (carga e seeding), sem cenários simulados
+        
+        Valida todos os itens numa passada, resolve clientes e produtos com
+        uma query IN por conjunto e insere pedidos e itens com INSERTs
+        multi-row, uma transação por lote. Itens inválidos não interrompem
+        o lote: cada um recebe seu resultado pelo índice no payload; se a
+        gravação de um lote falha, só os itens daquele lote são rejeitados.
+        Com STOCK_RESERVATION_ENABLED o estoque é reservado por lote, na
+        transação do lote; pedidos sem estoque são rejeitados um a um.
+        """
+        with tracer.start_as_current_span("bulk_order_processing") as span:
+            span.set_attribute("orders_count", len(raw_orders))
+            results: List[Optional[BulkOrderResult]] = [None] * len(raw_orders)
+            
+            def fail(index: int, error: str):
+                results[index] = BulkOrderResult(index=index, success=False, error=error)
+            
+            valid = []
+            for index, raw in enumerate(raw_orders):
+                try:
+                    order_data = OrderCreate.model_validate(raw)
+                except ValidationError as e:
+                    error = e.errors()[0]
+                    location = ".".join(str(part) for part in error["loc"])
+                    fail(index, f"{location}: {error['msg']}" if location else error["msg"])
+                    continue
+                
+                product_ids = [item.product_id for item in order_data.items]
+                if not product_ids:
+                    fail(index, "Pedido sem itens")
+                elif len(set(product_ids)) != len(product_ids):
+                    fail(index, "Produto repetido no pedido")
+                else:
+                    valid.append((index, order_data))
+            
+            customers = await self._load_customers(order_data.customer_id for _, order_data in valid)
+            products = await self._load_products(
+                item.product_id for _, order_data in valid for item in order_data.items
+            )
+            
+            now = datetime.now()
+            pending = []
+            for index, order_data in valid:
+                customer = customers.get(order_data.customer_id)
+                if not customer:
+                    fail(index, "Cliente não encontrado")
+                    continue
+                
+                missing = self._find_missing_product(order_data, products)
+                if missing is not None:
+                    fail(index, f"Produto {missing} não encontrado")
+                    continue
+                
+                total_amount, detail_rows = self._price_items(order_data, products)
+                order_values = self._order_values(order_data, customer, total_amount, now)
+                pending.append((index, order_values, detail_rows, total_amount, order_data))
+            
+            created, revenue = 0, 0
+            for start in range(0, len(pending), settings.bulk_orders_batch_size):
+                batch = pending[start:start + settings.bulk_orders_batch_size]
+                
+                try:
+                    if settings.stock_reservation_enabled:
+                        # Reserva na mesma transação do lote: o rollback devolve o estoque
+                        batch = await self._reserve_batch_stock(batch, fail)
+                        if not batch:
+                            await self.db.rollback()
+                            continue
+                    
+                    # RETURNING na ordem dos parâmetros associa cada order_id ao seu item
+                    result = await self.db.execute(
+                        insert(Order).returning(Order.order_id, sort_by_parameter_order=True),
+                        [order_values for _, order_values, _, _, _ in batch]
+                    )
+                    order_ids = result.scalars().all()
+                    
+                    details = []
+                    for (_, _, detail_rows, _, _), order_id in zip(batch, order_ids):
+                        details.extend({**row, "order_id": order_id} for row in detail_rows)
+                    
+                    await self.db.execute(insert(OrderDetail), details)
+                    await self.db.commit()
+                except Exception as e:
+                    # Só este lote é perdido: os já confirmados e os próximos seguem
+                    await self.db.rollback()
+                    logger.error(f"Erro ao gravar lote de {len(batch)} pedidos: {e}")
+                    span.record_exception(e)
+                    error_counter.add(1, {"error_type": "bulk_batch", "operation": "bulk_order_processing"})
+                    for index, _, _, _, _ in batch:
+                        fail(index, "Erro ao gravar o lote no banco")
+                    continue
+                
+                for (index, _, _, total_amount, _), order_id in zip(batch, order_ids):
+                    results[index] = BulkOrderResult(
+                        index=index, success=True, order_id=order_id, total_amount=total_amount
+                    )
+                    revenue += total_amount
+                created += len(batch)
+            
+            if created:
+                orders_counter.add(created, {"status": "success", "mode": "bulk"})
+                revenue_counter.add(revenue, {"currency": "BRL"})
+                if settings.stock_reservation_enabled:
+                    self._catalog_changed(products.keys())
+            
+            failed = len(raw_orders) - created
+            span.set_attribute("created", created)
+            span.set_attribute("failed", failed)
+            logger.info(f"Lote processado: {created} pedidos criados, {failed} rejeitados")
+            
+            return BulkOrderResponse(total=len(raw_orders), created=created, failed=failed, results=results)
+    
+    async def _prepare_order(self, order_data: OrderCreate) -> Tuple[Customer, dict, float, List[dict]]:
+        """Valida cliente e produtos e calcula o total e os itens do pedido"""
+        customer = await self.db.get(Customer, order_data.customer_id)
+        if not customer:
+            raise HTTPException(status_code=404, detail="Cliente não encontrado")
+        
+        # Carrega todos os produtos do pedido em uma única query (IN)
+        products = await self._load_products(item.product_id for item in order_data.items)
+        
+        missing = self._find_missing_product(order_data, products)
+        if missing is not None:
+            raise HTTPException(status_code=404, detail=f"Produto {missing} não encontrado")
+        
+        total_amount, detail_rows = self._price_items(order_data, products)
+        return customer, products, total_amount, detail_rows
+    
+    async def _insert_order(self, order_data: OrderCreate, customer: Customer, total_amount: float, detail_rows: List[dict]) -> int:
+        """Insere o pedido (order_id via RETURNING) e seus itens (INSERT multi-row)
+        
+        Com STOCK_RESERVATION_ENABLED o estoque é reservado antes, na mesma
+        transação: os locks das linhas de produto duram só até o commit.
+        """
+        if settings.stock_reservation_enabled:
+            with order_stage("stock_reservation"):
+                await self._reserve_stock(order_data)
+        
+        order_id = await self.db.scalar(
+            insert(Order)
+            .values(**self._order_values(order_data, customer, total_amount, datetime.now()))
+            .returning(Order.order_id)
+        )
+        
+        if detail_rows:
+            await self.db.execute(insert(OrderDetail).values([{**row, "order_id": order_id} for row in detail_rows]))
+        return order_id
+    
+    async def _reserve_stock(self, order_data: OrderCreate):
+        """Decrementa o estoque dos itens do pedido ou falha com 409
+        
+        As linhas são travadas em ordem crescente de product_id (SELECT ...
+        ORDER BY ... FOR UPDATE): pedidos concorrentes com produtos em comum
+        esperam uns pelos outros, mas nunca em ciclo (sem deadlock). Depois
+        um único UPDATE ... FROM (VALUES ...) decrementa apenas os produtos
+        com estoque suficiente; qualquer ausência no RETURNING é conflito.
+        """
+        quantities = self._stock_quantities(order_data)
+        product_ids = sorted(quantities)
+        
+        with tracer.start_as_current_span("stock_reservation") as span:
+            span.set_attribute("products_count", len(product_ids))
+            
+            stock = await self._lock_stock(product_ids)
+            reserved = await self._decrement_stock(quantities)
+            
+            shortage = next((product_id for product_id in product_ids if product_id not in reserved), None)
+            if shortage is None:
+                stock_reservations_counter.add(1, {"outcome": "reserved"})
+                return
+            
+            # Libera os locks imediatamente
+            await self.db.rollback()
+            
+            stock_reservations_counter.add(1, {"outcome": "insufficient"})
+            error_counter.add(1, {"error_type": "stock_unavailable", "operation": "order_processing"})
+            conversion_counter.add(1, {"type": "stock_failure"})
+            span.set_attribute("conflict_product_id", shortage)
+            
+            row = stock.get(shortage)
+            available = (row.units_in_stock or 0) if row else 0
+            logger.warning("Estoque insuficiente para o produto %s: disponível %s, solicitado %s", shortage, available, quantities[shortage])
+            
+            raise HTTPException(status_code=409, detail=self._shortage_message(stock, shortage, available, quantities[shortage]))
+    
+    async def _reserve_batch_stock(self, batch: List[tuple], fail: Callable[[int, str], None]) -> List[tuple]:
+        """Reserva o estoque de um lote da carga em massa; retorna os pedidos atendidos
+        
+        Um único SELECT ... FOR UPDATE trava os produtos do lote (em ordem
+        crescente, como em _reserve_stock) e os pedidos são atendidos na
+        ordem do payload enquanto houver estoque; os que não cabem são
+        rejeitados individualmente. As quantidades aceitas saem num único
+        UPDATE ... FROM (VALUES ...). Não faz commit.
+        """
+        requests = [(entry, self._stock_quantities(entry[-1])) for entry in batch]
+        stock = await self._lock_stock(sorted({product_id for _, quantities in requests for product_id in quantities}))
+        available = {product_id: row.units_in_stock or 0 for product_id, row in stock.items()}
+        
+        accepted, totals = [], defaultdict(int)
+        for entry, quantities in requests:
+            shortage = next((product_id for product_id, quantity in quantities.items() if available.get(product_id, 0) < quantity), None)
+            if shortage is not None:
+                fail(entry[0], self._shortage_message(stock, shortage, available.get(shortage, 0), quantities[shortage]))
+                stock_reservations_counter.add(1, {"outcome": "insufficient"})
+                continue
+            
+            for product_id, quantity in quantities.items():
+                available[product_id] -= quantity
+                totals[product_id] += quantity
+            accepted.append(entry)
+        
+        if totals:
+            # Com as linhas travadas o estoque conferido acima não muda
+            reserved = await self._decrement_stock(totals)
+            if len(reserved) != len(totals):
+                raise RuntimeError("Estoque alterado durante a reserva do lote")
+            stock_reservations_counter.add(len(accepted), {"outcome": "reserved"})
+        return accepted
+    
+    async def _lock_stock(self, product_ids: List[int]) -> dict:
+        """Trava as linhas dos produtos (SELECT ... FOR UPDATE em ordem crescente)"""
+        start = time.perf_counter()
+        locked = await self.db.execute(
+            select(Product.product_id, Product.product_name, Product.units_in_stock)
+            .where(Product.product_id.in_(product_ids))
+            .order_by(Product.product_id)
+            .with_for_update()
+        )
+        stock = {row.product_id: row for row in locked}
+        lock_wait_ms = (time.perf_counter() - start) * 1000
+        stock_lock_wait_histogram.record(lock_wait_ms)
+        trace.get_current_span().set_attribute("lock_wait_ms", round(lock_wait_ms, 1))
+        return stock
+    
+    async def _decrement_stock(self, quantities: dict) -> set:
+        """Decrementa só os produtos com estoque suficiente; retorna os atendidos"""
+        requested = values(
+            column("product_id", Integer), column("quantity", Integer), name="requested"
+        ).data(sorted(quantities.items()))
+        result = await self.db.execute(
+            update(Product)
+            .where(Product.product_id == requested.c.product_id, Product.units_in_stock >= requested.c.quantity)
+            .values(units_in_stock=Product.units_in_stock - requested.c.quantity)
+            .returning(Product.product_id)
+            .execution_options(synchronize_session=False)
+        )
+        return set(result.scalars().all())
+    
+    @staticmethod
+    def _shortage_message(stock: dict, product_id: int, available: int, requested: int) -> str:
+        row = stock.get(product_id)
+        product_name = row.product_name if row else f"Produto {product_id}"
+        return f"Produto '{product_name}' sem estoque suficiente. Disponível: {available}, Solicitado: {requested}"
+    
+    async def release_stock(self, order_data: OrderCreate):
+        """Devolve ao estoque as quantidades reservadas por um pedido
+        
+        Compensação do modo assíncrono: o estoque é reservado no aceite e, se
+        o worker desiste do pedido, volta na mesma transação que o marca como
+        failed. Não faz commit.
+        """
+        quantities = self._stock_quantities(order_data)
+        returned = values(
+            column("product_id", Integer), column("quantity", Integer), name="returned"
+        ).data(sorted(quantities.items()))
+        await self.db.execute(
+            update(Product)
+            .where(Product.product_id == returned.c.product_id)
+            .values(units_in_stock=Product.units_in_stock + returned.c.quantity)
+            .execution_options(synchronize_session=False)
+        )
+        stock_reservations_counter.add(1, {"outcome": "released"})
+    
+    @staticmethod
+    def _stock_quantities(order_data: OrderCreate) -> dict:
+        """Quantidade total por produto (OrderItem já exige quantity > 0)"""
+        quantities = defaultdict(int)
+        for item in order_data.items:
+            quantities[item.product_id] += item.quantity
+        return quantities
+    
+    @staticmethod
+    def _catalog_changed(product_ids):
+        """Invalida os produtos alterados e recarrega-os do primário por um tempo
+        
+        Sem isso, a próxima leitura poderia vir de uma réplica ainda sem a
+        escrita e devolver o estoque antigo ao cache até o TTL.
+        """
+        catalog_cache.invalidate_products(product_ids)
+        db_connection.pin_reads_to_primary(settings.database_replica_lag_seconds)
+    
+    @staticmethod
+    def _record_success(order_data: OrderCreate, total_amount: float):
+        """Registra métricas de sucesso"""
+        orders_counter.add(1, {"status": "success", "customer_id": order_data.customer_id})
+        revenue_counter.add(total_amount, {"currency": "BRL"})
+        conversion_counter.add(1, {"type": "success"})
+    
+    @staticmethod
+    def _find_missing_product(order_data: OrderCreate, products: dict) -> Optional[int]:
+        return next((item.product_id for item in order_data.items if item.product_id not in products), None)
+    
+    @staticmethod
+    def _price_items(order_data: OrderCreate, products: dict) -> Tuple[float, List[dict]]:
+        """Calcula o total do pedido e as linhas de order_details (sem order_id)"""
+        total_amount = 0
+        detail_rows = []
+        for item in order_data.items:
+            item_price = item.unit_price if item.unit_price else products[item.product_id].unit_price
+            discount = item.discount or 0
+            total_amount += item_price * item.quantity * (1 - discount)
+            detail_rows.append({
+                "product_id": item.product_id,
+                "unit_price": item_price,
+                "quantity": item.quantity,
+                "discount": discount
+            })
+        return total_amount, detail_rows
+    
+    @staticmethod
+    def _order_values(order_data: OrderCreate, customer: Customer, total_amount: float, now: datetime) -> dict:
+        """Colunas do pedido; o endereço de entrega padrão é o do cliente"""
+        return {
+            "customer_id": order_data.customer_id,
+            "order_date": now,
+            "required_date": now + timedelta(days=7),
+            "freight": total_amount * 0.1,  # 10% do valor como frete
+            "ship_name": order_data.ship_name or customer.company_name,
+            "ship_address": order_data.ship_address or customer.address,
+            "ship_city": order_data.ship_city or customer.city,
+            "ship_region": order_data.ship_region or customer.region,
+            "ship_postal_code": order_data.ship_postal_code or customer.postal_code,
+            "ship_country": order_data.ship_country or customer.country
+        }
+    
+    async def _load_by_ids(self, column, ids) -> list:
+        """SELECT ... WHERE column IN (...) em blocos (limite de parâmetros do driver)"""
+        ids = sorted(set(ids))
+        entities = []
+        for start in range(0, len(ids), IN_CHUNK_SIZE):
+            result = await self.db.scalars(select(column.class_).where(column.in_(ids[start:start + IN_CHUNK_SIZE])))
+            entities.extend(result)
+        return entities
+    
+    async def _load_products(self, product_ids) -> dict:
+        """Carrega os produtos informados, indexados por id (uma query IN por bloco)"""
+        return {product.product_id: product for product in await self._load_by_ids(Product.product_id, product_ids)}
+    
+    async def _load_customers(self, customer_ids) -> dict:
+        """Carrega os clientes informados, indexados por id"""
+        return {customer.customer_id: customer for customer in await self._load_by_ids(Customer.customer_id, customer_ids)}
+    
+    async def _simulate_payment_error(self, order_data: OrderCreate) -> OrderResponse:
         """Simula erro de pagamento (timeout do gateway)"""
         with tracer.start_as_current_span("payment_error_simulation"):
             
             # Simula tempo de processamento reduzido para evitar timeout real
-            time.sleep(random.uniform(0.5, 1.0))
+            await delay_provider.sleep(0.5, 1.0)
             
             error_message = "Timeout do gateway de pagamento - Tente novamente"
             
@@ -142,26 +558,28 @@ class OrderService:
             error_counter.add(1, {"error_type": "payment_timeout", "operation": "order_processing"})
             conversion_counter.add(1, {"type": "payment_failure"})
             
-            logger.error(f"Erro de pagamento simulado para cliente {order_data.customer_id}")
+            logger.error("Erro de pagamento simulado para cliente %s", order_data.customer_id)
             
             raise HTTPException(
                 status_code=503, 
                 detail=error_message
             )
     
-    def _simulate_stock_error(self, order_data: OrderCreate) -> OrderResponse:
+    async def _simulate_stock_error(self, order_data: OrderCreate) -> OrderResponse:
         """Simula erro de validação de estoque"""
         with tracer.start_as_current_span("stock_error_simulation"):
             
+            # Simula tempo de verificação de estoque (antes da query, para não
+            # manter a conexão ociosa dentro da transação)
+            await delay_provider.sleep(0.5, 1.5)
+            
             # Seleciona um produto aleatório do pedido para simular falta de estoque
             random_item = random.choice(order_data.items)
             
             # Busca informações do produto para a mensagem
-            product = self.db.query(Product).filter(Product.product_id == random_item.product_id).first()
+            product = await self.db.get(Product, random_item.product_id)
             product_name = product.product_name if product else f"Produto {random_item.product_id}"
-            
-            # Simula tempo de verificação de estoque
-            time.sleep(random.uniform(0.5, 1.5))
+            await self.db.rollback()
             
             error_message = f"Produto '{product_name}' sem estoque suficiente. Disponível: 0, Solicitado: {random_item.quantity}"
             
@@ -169,7 +587,7 @@ class OrderService:
             error_counter.add(1, {"error_type": "stock_unavailable", "operation": "order_processing"})
             conversion_counter.add(1, {"type": "stock_failure"})
             
-            logger.error(f"Erro de estoque simulado para produto {product_name}")
+            logger.error("Erro de estoque simulado para produto %s", product_name)
             
             raise HTTPException(
                 status_code=409, 
@@ -1,44 +1,166 @@
 import os
+import time
+import zlib
 import logging
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
 from azure.monitor.opentelemetry import configure_azure_monitor
+from azure.monitor.opentelemetry.exporter import AzureMonitorMetricExporter, AzureMonitorTraceExporter
 from opentelemetry import trace, metrics
+from opentelemetry.metrics import Observation
+from opentelemetry.sdk.metrics.export import MetricExporter
+from opentelemetry.sdk.trace import SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.metrics import Histogram, MeterProvider
+from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+from opentelemetry.sdk.metrics.view import View, ExplicitBucketHistogramAggregation
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
 from opentelemetry.instrumentation.psycopg2 import Psycopg2Instrumentor
+from sampling import (
+    SAMPLING_TAIL,
+    DB_SPANS_SQLALCHEMY,
+    DB_SPANS_PSYCOPG2,
+    DB_SPANS_BOTH,
+    build_sampler,
+    TailSamplingSpanProcessor
+)
+from file_exporter import RotatingJsonLinesWriter, FileSpanProcessor, FileMetricExporter
 from config import settings
 
 logger = logging.getLogger(__name__)
 
-def setup_telemetry(app):
-    """Configura OpenTelemetry e Application Insights"""
+# Exportadores (TELEMETRY_EXPORTER): Application Insights ou arquivos locais
+EXPORTER_AZURE = "azure"
+EXPORTER_FILE = "file"
+
+# Processors do modo tail e do exportador em arquivo (estatísticas em /api/admin/tracing)
+_tail_processor: Optional[TailSamplingSpanProcessor] = None
+_file_processor: Optional[FileSpanProcessor] = None
+
+def setup_telemetry(app=None):
+    """Configura OpenTelemetry e Application Insights
+    
+    Sem app (ex: worker do outbox) apenas a instrumentação de FastAPI é omitida.
+    Com TELEMETRY_EXPORTER=file spans e métricas vão para arquivos locais,
+    sem rede e sem connection string.
+    """
     try:
-        if settings.applicationinsights_connection_string:
-            # Configura Azure Monitor
+        if settings.telemetry_exporter == EXPORTER_FILE:
+            setup_file_exporters()
+            logger.info(f"Telemetria gravada em arquivos OTLP-JSON em {settings.telemetry_file_dir}")
+        elif settings.applicationinsights_connection_string:
+            # Configura Azure Monitor (traces e métricas ficam nos providers
+            # próprios: amostragem configurável e buckets explícitos)
             configure_azure_monitor(
                 connection_string=settings.applicationinsights_connection_string,
                 enable_live_metrics=True,
-                enable_standard_metrics=True
+                enable_standard_metrics=True,
+                disable_tracing=True,
+                disable_metrics=True,
+                # Instrumentações ficam a cargo desta função (ver TRACING_DB_SPANS)
+                instrumentation_options={"fastapi": {"enabled": False}, "psycopg2": {"enabled": False}}
             )
+            trace.set_tracer_provider(build_tracer_provider(
+                BatchSpanProcessor(AzureMonitorTraceExporter(connection_string=settings.applicationinsights_connection_string))
+            ))
+            setup_metrics_provider(AzureMonitorMetricExporter(connection_string=settings.applicationinsights_connection_string))
             logger.info("Application Insights configurado com sucesso")
         else:
             logger.warning("Connection string do Application Insights não configurada")
         
         # Instrumenta FastAPI
-        FastAPIInstrumentor.instrument_app(app)
+        if app is not None:
+            FastAPIInstrumentor.instrument_app(app)
         
-        # Instrumenta SQLAlchemy
-        SQLAlchemyInstrumentor().instrument()
+        # Spans de banco: SQLAlchemy e psycopg2 geram um span cada por query
+        if settings.tracing_db_spans in (DB_SPANS_SQLALCHEMY, DB_SPANS_BOTH):
+            SQLAlchemyInstrumentor().instrument()
+        if settings.tracing_db_spans in (DB_SPANS_PSYCOPG2, DB_SPANS_BOTH):
+            Psycopg2Instrumentor().instrument()
         
-        # Instrumenta Psycopg2
-        Psycopg2Instrumentor().instrument()
-        
-        logger.info("Instrumentação OpenTelemetry configurada")
+        logger.info(
+            "Instrumentação OpenTelemetry configurada (amostragem: %s, spans de banco: %s)",
+            settings.tracing_sampling, settings.tracing_db_spans
+        )
         
     except Exception as e:
         logger.error(f"Erro ao configurar telemetria: {e}")
         # Não falha a aplicação se a telemetria falhar
         pass
 
+def setup_file_exporters():
+    """Providers com exportadores em arquivo (um par de arquivos por processo)"""
+    global _file_processor
+    
+    def writer(kind: str) -> RotatingJsonLinesWriter:
+        return RotatingJsonLinesWriter(
+            os.path.join(settings.telemetry_file_dir, f"{kind}-{os.getpid()}.jsonl"),
+            max_bytes=settings.telemetry_file_max_bytes,
+            backup_count=settings.telemetry_file_backup_count
+        )
+    
+    _file_processor = FileSpanProcessor(writer("traces"), queue_size=settings.telemetry_file_queue_size)
+    trace.set_tracer_provider(build_tracer_provider(_file_processor))
+    setup_metrics_provider(FileMetricExporter(writer("metrics")))
+
+def build_tracer_provider(processor: SpanProcessor) -> TracerProvider:
+    """TracerProvider com o sampler de TRACING_SAMPLING na frente do processor de exportação"""
+    global _tail_processor
+    provider = TracerProvider(sampler=build_sampler(settings.tracing_sampling, settings.tracing_sample_ratio))
+    if settings.tracing_sampling == SAMPLING_TAIL:
+        processor = _tail_processor = TailSamplingSpanProcessor(
+            processor,
+            ratio=settings.tracing_sample_ratio,
+            latency_threshold_ms=settings.tracing_tail_latency_ms,
+            max_traces=settings.tracing_tail_max_traces
+        )
+    provider.add_span_processor(processor)
+    return provider
+
+def tracing_stats() -> dict:
+    """Configuração de amostragem e decisões do modo tail"""
+    return {
+        "sampling": settings.tracing_sampling,
+        "sample_ratio": settings.tracing_sample_ratio,
+        "db_spans": settings.tracing_db_spans,
+        "tail": _tail_processor.stats() if _tail_processor else None,
+        "file": _file_processor.stats() if _file_processor else None
+    }
+
+def parse_buckets(spec: str) -> List[float]:
+    """Converte "5,10,25" em limites de bucket ordenados"""
+    buckets = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            buckets.add(float(part))
+        except ValueError:
+            logger.warning(f"Limite de bucket inválido ignorado: '{part}'")
+    return sorted(buckets)
+
+def metric_views() -> List[View]:
+    """Views com buckets explícitos para os histogramas da aplicação
+    
+    Os buckets padrão do SDK têm pouca resolução na faixa dos SLOs; com
+    limites fixos e configuráveis os percentis saem das métricas agregadas,
+    sem consultar spans amostrados.
+    """
+    latency = ExplicitBucketHistogramAggregation(parse_buckets(settings.metrics_latency_buckets_ms))
+    loop_lag = ExplicitBucketHistogramAggregation(parse_buckets(settings.metrics_loop_lag_buckets_ms))
+    views = [View(instrument_name=EVENT_LOOP_LAG_METRIC, aggregation=loop_lag)]
+    # Um View por instrumento: curingas sobrepostos gerariam séries duplicadas
+    for name in LATENCY_HISTOGRAMS:
+        views.append(View(instrument_type=Histogram, instrument_name=name, aggregation=latency))
+    return views
+
+def setup_metrics_provider(exporter: MetricExporter):
+    """MeterProvider com o exportador informado e os Views da aplicação"""
+    reader = PeriodicExportingMetricReader(exporter, export_interval_millis=settings.metrics_export_interval_ms)
+    metrics.set_meter_provider(MeterProvider(metric_readers=[reader], views=metric_views()))
+
 def get_tracer():
     """Obtém o tracer OpenTelemetry"""
     return trace.get_tracer(__name__)
@@ -47,9 +169,142 @@ def get_meter():
     """Obtém o meter OpenTelemetry"""  
     return metrics.get_meter(__name__)
 
+OVERFLOW_VALUE = "_other"
+
+class AttributePolicy:
+    """Atributos aceitos por um instrumento (limita o número de séries)
+    
+    - allowed: chaves mantidas; cada uma aceita até max_values valores
+      distintos, os seguintes viram "_other"
+    - bucketed: chaves de valores ilimitados (ex: customer_id) trocadas por
+      <chave>_bucket, um de N buckets pelo crc32 do valor (estável entre
+      processos e réplicas)
+    Chaves fora das duas listas são descartadas e contadas.
+    """
+    
+    def __init__(self, allowed: Iterable[str] = (), bucketed: Optional[Dict[str, int]] = None, max_values: Optional[int] = None):
+        self.allowed = frozenset(allowed)
+        self.bucketed = bucketed or {}
+        self.max_values = max_values or settings.metrics_max_attribute_values
+        self._seen = {key: set() for key in self.allowed}
+    
+    def apply(self, instrument: str, attributes):
+        if not attributes:
+            return attributes
+        
+        result = {}
+        for key, value in attributes.items():
+            if key in self.allowed:
+                seen = self._seen[key]
+                if value not in seen:
+                    if len(seen) >= self.max_values:
+                        _drop_attribute(instrument, key, "overflow")
+                        value = OVERFLOW_VALUE
+                    else:
+                        seen.add(value)
+                result[key] = value
+            elif key in self.bucketed:
+                result[f"{key}_bucket"] = zlib.crc32(str(value).encode()) % self.bucketed[key]
+            else:
+                _drop_attribute(instrument, key, "not_allowed")
+        return result
+
+class _GuardedInstrument:
+    """Counter/histograma que aplica a política antes de registrar"""
+    
+    def __init__(self, instrument, name: str, policy: AttributePolicy):
+        self._instrument = instrument
+        self._name = name
+        self._policy = policy
+    
+    def add(self, amount, attributes=None):
+        self._instrument.add(amount, self._policy.apply(self._name, attributes))
+    
+    def record(self, amount, attributes=None):
+        self._instrument.record(amount, self._policy.apply(self._name, attributes))
+
+class PolicyMeter:
+    """Meter que envolve counters e histogramas com a política do instrumento
+    
+    Instrumento sem política em ATTRIBUTE_POLICIES não aceita atributos.
+    Gauges observáveis passam direto: seus callbacks já usam atributos fixos.
+    """
+    
+    def __init__(self, meter, policies: Dict[str, AttributePolicy]):
+        self._meter = meter
+        self._policies = policies
+    
+    def _guard(self, instrument, name: str) -> _GuardedInstrument:
+        policy = self._policies.get(name)
+        if policy is None:
+            logger.warning(f"Métrica {name} sem política de atributos: atributos serão descartados")
+            policy = AttributePolicy()
+        return _GuardedInstrument(instrument, name, policy)
+    
+    def create_counter(self, name: str, unit: str = "", description: str = "") -> _GuardedInstrument:
+        return self._guard(self._meter.create_counter(name, unit=unit, description=description), name)
+    
+    def create_up_down_counter(self, name: str, unit: str = "", description: str = "") -> _GuardedInstrument:
+        return self._guard(self._meter.create_up_down_counter(name, unit=unit, description=description), name)
+    
+    def create_histogram(self, name: str, unit: str = "", description: str = "") -> _GuardedInstrument:
+        return self._guard(self._meter.create_histogram(name, unit=unit, description=description), name)
+    
+    def __getattr__(self, name):
+        return getattr(self._meter, name)
+
+# Chaves de atributo aceitas por instrumento
+ATTRIBUTE_POLICIES = {
+    "northwind_orders_total": AttributePolicy(
+        allowed=("status", "mode"),
+        bucketed={"customer_id": settings.metrics_customer_buckets}
+    ),
+    "northwind_revenue_total": AttributePolicy(allowed=("currency",)),
+    "northwind_conversion_events": AttributePolicy(allowed=("type",)),
+    "northwind_errors_total": AttributePolicy(allowed=("error_type", "operation")),
+    "northwind_cache_hits_total": AttributePolicy(allowed=("cache", "coalesced")),
+    "northwind_cache_misses_total": AttributePolicy(allowed=("cache",)),
+    "northwind_cache_evictions_total": AttributePolicy(allowed=("cache",)),
+    "northwind_idempotency_requests_total": AttributePolicy(allowed=("outcome",)),
+    "northwind_outbox_processed_total": AttributePolicy(allowed=("status",)),
+    "northwind_outbox_processing_lag": AttributePolicy(allowed=("status",)),
+    "northwind_stock_lock_wait": AttributePolicy(),
+    "northwind_stock_reservations_total": AttributePolicy(allowed=("outcome",)),
+    "northwind_admission_shed_total": AttributePolicy(allowed=("route_class", "reason")),
+    "northwind_admission_queue_time": AttributePolicy(allowed=("route_class",)),
+    "northwind_db_query_duration": AttributePolicy(allowed=("target",)),
+    "northwind_db_pool_checkout_wait": AttributePolicy(allowed=("pool",)),
+    "northwind_order_stage_duration": AttributePolicy(allowed=("stage",)),
+    "northwind_request_db_time": AttributePolicy(allowed=("route", "method")),
+    "northwind_serialization_duration": AttributePolicy(allowed=("serializer",)),
+    "northwind_event_loop_lag": AttributePolicy()
+}
+
 # Métricas customizadas globais
 tracer = get_tracer()
-meter = get_meter()
+_sdk_meter = get_meter()
+meter = PolicyMeter(_sdk_meter, ATTRIBUTE_POLICIES)
+
+# Atributos descartados pela política (fora da lista ou acima de max_values)
+dropped_attributes_counter = _sdk_meter.create_counter(
+    "northwind_metric_attributes_dropped_total",
+    description="Atributos de métricas descartados pela política de cardinalidade"
+)
+
+_dropped_attributes: Dict[tuple, int] = {}
+
+def _drop_attribute(instrument: str, key: str, reason: str):
+    _dropped_attributes[(instrument, key, reason)] = _dropped_attributes.get((instrument, key, reason), 0) + 1
+    dropped_attributes_counter.add(1, {"instrument": instrument, "reason": reason})
+
+def attribute_policy_stats() -> dict:
+    """Atributos descartados por instrumento, chave e motivo"""
+    return {
+        "dropped": [
+            {"instrument": instrument, "key": key, "reason": reason, "count": count}
+            for (instrument, key, reason), count in sorted(_dropped_attributes.items())
+        ]
+    }
 
 # Contadores de métricas de negócio
 orders_counter = meter.create_counter(
@@ -70,4 +325,229 @@ conversion_counter = meter.create_counter(
 error_counter = meter.create_counter(
     "northwind_errors_total",
     description="Número total de erros por tipo"
+)
+
+# Métricas do cache de catálogo
+cache_hits_counter = meter.create_counter(
+    "northwind_cache_hits_total",
+    description="Leituras atendidas pelo cache de catálogo"
+)
+
+cache_misses_counter = meter.create_counter(
+    "northwind_cache_misses_total",
+    description="Leituras que precisaram carregar do banco"
+)
+
+cache_evictions_counter = meter.create_counter(
+    "northwind_cache_evictions_total",
+    description="Entradas removidas do cache por limite de tamanho"
+)
+
+# Requisições de pedido com Idempotency-Key, por desfecho
+# (executed, replayed, coalesced, mismatch, timeout)
+idempotency_counter = meter.create_counter(
+    "northwind_idempotency_requests_total",
+    description="Pedidos com Idempotency-Key por desfecho"
+)
+
+# Métricas do outbox de pedidos (modo assíncrono, exportadas pelo worker)
+outbox_processed_counter = meter.create_counter(
+    "northwind_outbox_processed_total",
+    description="Entradas do outbox processadas por status final"
+)
+
+outbox_lag_histogram = meter.create_histogram(
+    "northwind_outbox_processing_lag",
+    unit="ms",
+    description="Tempo entre o aceite do pedido e o fim do processamento"
+)
+
+_outbox_stats = {"depth": 0, "oldest_age": 0.0}
+
+def set_outbox_stats(depth: int, oldest_age: float):
+    """Atualiza a profundidade da fila e a idade da entrada mais antiga"""
+    _outbox_stats["depth"] = depth
+    _outbox_stats["oldest_age"] = oldest_age
+
+meter.create_observable_gauge(
+    "northwind_outbox_queue_depth",
+    callbacks=[lambda options: [Observation(_outbox_stats["depth"])]],
+    description="Entradas do outbox pendentes ou em processamento"
+)
+
+meter.create_observable_gauge(
+    "northwind_outbox_oldest_age",
+    callbacks=[lambda options: [Observation(_outbox_stats["oldest_age"])]],
+    unit="s",
+    description="Idade da entrada mais antiga ainda não processada"
+)
+
+# Reserva de estoque (STOCK_RESERVATION_ENABLED)
+stock_lock_wait_histogram = meter.create_histogram(
+    "northwind_stock_lock_wait",
+    unit="ms",
+    description="Tempo para travar as linhas de produto do pedido"
+)
+
+# outcome: reserved, insufficient ou released (devolvido pelo worker do outbox);
+# taxa de conflito = insufficient / (reserved + insufficient)
+stock_reservations_counter = meter.create_counter(
+    "northwind_stock_reservations_total",
+    description="Tentativas de reserva de estoque por resultado"
+)
+
+# Controle de admissão (descarte de carga)
+admission_shed_counter = meter.create_counter(
+    "northwind_admission_shed_total",
+    description="Requisições descartadas com 503 por classe de rota e motivo"
+)
+
+admission_queue_histogram = meter.create_histogram(
+    "northwind_admission_queue_time",
+    unit="ms",
+    description="Tempo de espera na fila de admissão"
+)
+
+_admission_controllers = []
+
+def register_admission_controller(controller):
+    """Registra o controle de admissão para exportar requisições em andamento e na fila"""
+    _admission_controllers.append(controller)
+
+def _observe_admission_in_flight(options):
+    for controller in _admission_controllers:
+        for route_class, count in controller.in_flight.items():
+            yield Observation(count, {"route_class": route_class})
+
+def _observe_admission_queued(options):
+    for controller in _admission_controllers:
+        for route_class, count in controller.stats()["queued"].items():
+            yield Observation(count, {"route_class": route_class})
+
+meter.create_observable_gauge(
+    "northwind_admission_in_flight",
+    callbacks=[_observe_admission_in_flight],
+    description="Requisições em andamento por classe de rota"
+)
+
+meter.create_observable_gauge(
+    "northwind_admission_queued",
+    callbacks=[_observe_admission_queued],
+    description="Requisições aguardando admissão por classe de rota"
+)
+
+# Duração das queries por destino (primary/replica)
+db_query_histogram = meter.create_histogram(
+    "northwind_db_query_duration",
+    unit="ms",
+    description="Duração das queries SQL por destino"
+)
+
+# Métricas do pool de conexões do banco
+pool_checkout_histogram = meter.create_histogram(
+    "northwind_db_pool_checkout_wait",
+    unit="ms",
+    description="Tempo de espera para obter uma conexão do pool"
+)
+
+# Pools monitorados pelos gauges observáveis (nome -> pool SQLAlchemy)
+_monitored_pools = {}
+
+def register_pool(name, pool):
+    """Registra um pool SQLAlchemy para exportar conexões em uso/ociosas"""
+    _monitored_pools[name] = pool
+
+def _observe_pool_in_use(options):
+    for name, pool in _monitored_pools.items():
+        yield Observation(pool.checkedout(), {"pool": name})
+
+def _observe_pool_idle(options):
+    for name, pool in _monitored_pools.items():
+        yield Observation(pool.checkedin(), {"pool": name})
+
+def _observe_pool_overflow(options):
+    for name, pool in _monitored_pools.items():
+        yield Observation(max(pool.overflow(), 0), {"pool": name})
+
+meter.create_observable_gauge(
+    "northwind_db_pool_in_use",
+    callbacks=[_observe_pool_in_use],
+    description="Conexões do pool em uso"
+)
+
+meter.create_observable_gauge(
+    "northwind_db_pool_idle",
+    callbacks=[_observe_pool_idle],
+    description="Conexões ociosas disponíveis no pool"
+)
+
+meter.create_observable_gauge(
+    "northwind_db_pool_overflow",
+    callbacks=[_observe_pool_overflow],
+    description="Conexões abertas além do pool_size"
+)
+
+# Latência por etapa do pipeline de pedidos (stage: prepare, processing, persist...)
+order_stage_histogram = meter.create_histogram(
+    "northwind_order_stage_duration",
+    unit="ms",
+    description="Duração de cada etapa do pipeline de pedidos"
+)
+
+@contextmanager
+def order_stage(stage: str):
+    """Mede uma etapa do pipeline de pedidos (registrada também em caso de erro)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        order_stage_histogram.record((time.perf_counter() - start) * 1000, {"stage": stage})
+
+# Tempo total em queries SQL por requisição, por rota (template, ex: /api/orders/{order_id})
+request_db_time_histogram = meter.create_histogram(
+    "northwind_request_db_time",
+    unit="ms",
+    description="Tempo gasto em queries SQL por requisição"
+)
+
+# Serialização do corpo das respostas JSON (serializer: json ou orjson)
+serialization_histogram = meter.create_histogram(
+    "northwind_serialization_duration",
+    unit="ms",
+    description="Tempo de serialização das respostas JSON"
+)
+
+# Atraso do loop de eventos (sonda em loop_monitor.py)
+EVENT_LOOP_LAG_METRIC = "northwind_event_loop_lag"
+
+event_loop_lag_histogram = meter.create_histogram(
+    EVENT_LOOP_LAG_METRIC,
+    unit="ms",
+    description="Atraso do loop de eventos medido pela sonda em background"
+)
+
+_event_loop_stats = {"lag_ms": 0.0}
+
+def set_event_loop_lag(lag_ms: float):
+    """Registra uma medição da sonda do loop de eventos"""
+    _event_loop_stats["lag_ms"] = lag_ms
+    event_loop_lag_histogram.record(lag_ms)
+
+meter.create_observable_gauge(
+    "northwind_event_loop_lag_current",
+    callbacks=[lambda options: [Observation(_event_loop_stats["lag_ms"])]],
+    unit="ms",
+    description="Última medição de atraso do loop de eventos"
+)
+
+# Histogramas de latência com os buckets de METRICS_LATENCY_BUCKETS_MS (ver metric_views)
+LATENCY_HISTOGRAMS = (
+    "northwind_outbox_processing_lag",
+    "northwind_stock_lock_wait",
+    "northwind_admission_queue_time",
+    "northwind_db_query_duration",
+    "northwind_db_pool_checkout_wait",
+    "northwind_order_stage_duration",
+    "northwind_request_db_time",
+    "northwind_serialization_duration"
 )
\ No newline at end of file
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Módulos do backend são planos (python main.py / uvicorn main:app)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
\ No newline at end of file
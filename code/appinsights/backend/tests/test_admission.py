@@ -0,0 +1,182 @@
+"""Controle de admissão: prioridade, prazo da fila, descarte e liberação da vaga"""
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from admission import ROUTE_CATALOG, ROUTE_CHECKOUT, ROUTE_DEFAULT, AdmissionController
+
+def _controller(max_in_flight: int = 1, queue_size: int = 10, queue_timeout: float = 1.0, limit: int = 10):
+    limits = {ROUTE_CHECKOUT: limit, ROUTE_CATALOG: limit, ROUTE_DEFAULT: limit}
+    return AdmissionController(limits, max_in_flight=max_in_flight, queue_size=queue_size, queue_timeout=queue_timeout)
+
+def test_checkout_admitted_before_catalog():
+    controller = _controller()
+    
+    async def run():
+        assert await controller.acquire(ROUTE_DEFAULT)
+        admitted = []
+        
+        async def request(route_class):
+            assert await controller.acquire(route_class)
+            admitted.append(route_class)
+            controller.release(route_class)
+        
+        # Catálogo entra na fila primeiro, mas checkout tem prioridade
+        catalog = asyncio.create_task(request(ROUTE_CATALOG))
+        await asyncio.sleep(0)
+        checkout = asyncio.create_task(request(ROUTE_CHECKOUT))
+        await asyncio.sleep(0)
+        assert controller.stats()["queued"] == {ROUTE_CHECKOUT: 1, ROUTE_CATALOG: 1, ROUTE_DEFAULT: 0}
+        
+        controller.release(ROUTE_DEFAULT)
+        await asyncio.gather(catalog, checkout)
+        return admitted
+    
+    assert asyncio.run(run()) == [ROUTE_CHECKOUT, ROUTE_CATALOG]
+    assert controller.stats()["in_flight"] == {ROUTE_CHECKOUT: 0, ROUTE_CATALOG: 0, ROUTE_DEFAULT: 0}
+
+def test_class_limit_does_not_block_other_classes():
+    controller = _controller(max_in_flight=10, limit=1)
+    
+    async def run():
+        assert await controller.acquire(ROUTE_CATALOG)
+        return await controller.acquire(ROUTE_CHECKOUT)
+    
+    assert asyncio.run(run()) is True
+
+def test_queue_deadline_sheds_request():
+    controller = _controller(queue_timeout=0.05)
+    
+    async def run():
+        assert await controller.acquire(ROUTE_CATALOG)
+        return await controller.acquire(ROUTE_CATALOG)
+    
+    assert asyncio.run(run()) is False
+    # A requisição descartada não deixa rastro na fila nem ocupa vaga
+    assert controller.stats()["queued"][ROUTE_CATALOG] == 0
+    assert controller.stats()["in_flight"][ROUTE_CATALOG] == 1
+
+def test_full_queue_sheds_immediately():
+    controller = _controller(queue_size=1, queue_timeout=5.0)
+    
+    async def run():
+        assert await controller.acquire(ROUTE_CATALOG)
+        waiting = asyncio.create_task(controller.acquire(ROUTE_CATALOG))
+        await asyncio.sleep(0)
+        shed = await asyncio.wait_for(controller.acquire(ROUTE_CATALOG), timeout=1.0)
+        
+        controller.release(ROUTE_CATALOG)
+        return shed, await waiting
+    
+    assert asyncio.run(run()) == (False, True)
+
+def test_cancelled_waiter_leaves_queue():
+    controller = _controller(queue_timeout=5.0)
+    
+    async def run():
+        assert await controller.acquire(ROUTE_CATALOG)
+        waiting = asyncio.create_task(controller.acquire(ROUTE_CATALOG))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        controller.release(ROUTE_CATALOG)
+    
+    asyncio.run(run())
+    assert controller.stats()["queued"][ROUTE_CATALOG] == 0
+    assert controller.stats()["in_flight"][ROUTE_CATALOG] == 0
+
+@pytest.fixture
+def streaming_app(monkeypatch):
+    import main
+    
+    controller = _controller(queue_timeout=0.05)
+    monkeypatch.setattr(main, "admission_controller", controller)
+    app = FastAPI()
+    app.middleware("http")(main.admission_control_middleware)
+    state = {"in_flight_during_body": None, "gate": None}
+    
+    @app.get("/api/products/export")
+    async def export():
+        async def body():
+            yield b"first\n"
+            state["in_flight_during_body"] = controller.stats()["in_flight"][ROUTE_CATALOG]
+            if state["gate"] is not None:
+                await state["gate"].wait()
+            yield b"second\n"
+        return StreamingResponse(body(), media_type="text/plain")
+    
+    return app, controller, state
+
+def test_slot_held_until_streamed_body_ends(streaming_app):
+    from fastapi.testclient import TestClient
+    
+    app, controller, state = streaming_app
+    response = TestClient(app).get("/api/products/export")
+    
+    assert response.status_code == 200
+    assert response.text == "first\nsecond\n"
+    assert state["in_flight_during_body"] == 1
+    assert controller.stats()["in_flight"][ROUTE_CATALOG] == 0
+
+def test_shed_request_gets_503(streaming_app):
+    from fastapi.testclient import TestClient
+    
+    app, controller, _ = streaming_app
+    
+    async def occupy():
+        assert await controller.acquire(ROUTE_CATALOG)
+    
+    asyncio.run(occupy())
+    response = TestClient(app).get("/api/products/export")
+    
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+    controller.release(ROUTE_CATALOG)
+
+def test_slot_released_when_client_disconnects(streaming_app):
+    app, controller, state = streaming_app
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/api/products/export",
+        "raw_path": b"/api/products/export",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80)
+    }
+    
+    async def run():
+        state["gate"] = asyncio.Event()
+        first_chunk = asyncio.Event()
+        disconnected = asyncio.Event()
+        received = []
+        
+        async def receive():
+            if not received:
+                received.append(True)
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+        
+        async def send(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                first_chunk.set()
+        
+        task = asyncio.create_task(app(scope, receive, send))
+        await asyncio.wait_for(first_chunk.wait(), timeout=2)
+        assert controller.stats()["in_flight"][ROUTE_CATALOG] == 1
+        
+        # O corpo nunca termina: só a desconexão libera a vaga
+        disconnected.set()
+        await asyncio.wait_for(task, timeout=2)
+    
+    asyncio.run(run())
+    assert controller.stats()["in_flight"][ROUTE_CATALOG] == 0
\ No newline at end of file
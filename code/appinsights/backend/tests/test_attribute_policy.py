@@ -0,0 +1,105 @@
+"""Política de atributos das métricas (limite de cardinalidade)"""
+import zlib
+
+import pytest
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+import telemetry
+from telemetry import OVERFLOW_VALUE, AttributePolicy, PolicyMeter, attribute_policy_stats
+
+@pytest.fixture
+def reader():
+    return InMemoryMetricReader()
+
+@pytest.fixture
+def sdk_meter(reader, monkeypatch):
+    """Meter do SDK com leitura em memória; descartes contados do zero"""
+    meter = MeterProvider(metric_readers=[reader]).get_meter("test")
+    monkeypatch.setattr(telemetry, "_dropped_attributes", {})
+    monkeypatch.setattr(telemetry, "dropped_attributes_counter", meter.create_counter("dropped"))
+    return meter
+
+def _points(reader, name: str) -> dict:
+    """Valor de cada série do instrumento, indexado pelos atributos"""
+    points = {}
+    for resource_metrics in reader.get_metrics_data().resource_metrics:
+        for scope_metrics in resource_metrics.scope_metrics:
+            for metric in scope_metrics.metrics:
+                if metric.name == name:
+                    for point in metric.data.data_points:
+                        points[tuple(sorted(point.attributes.items()))] = point.value
+    return points
+
+def test_allowlist_keeps_only_allowed_keys(reader, sdk_meter):
+    meter = PolicyMeter(sdk_meter, {"orders": AttributePolicy(allowed=("status",))})
+    counter = meter.create_counter("orders")
+    
+    counter.add(1, {"status": "success", "order_id": 42})
+    
+    assert _points(reader, "orders") == {(("status", "success"),): 1}
+    assert attribute_policy_stats()["dropped"] == [
+        {"instrument": "orders", "key": "order_id", "reason": "not_allowed", "count": 1}
+    ]
+
+def test_values_beyond_max_values_become_other(reader, sdk_meter):
+    meter = PolicyMeter(sdk_meter, {"errors": AttributePolicy(allowed=("error_type",), max_values=2)})
+    counter = meter.create_counter("errors")
+    
+    for error_type in ("timeout", "payment", "stock", "network", "timeout"):
+        counter.add(1, {"error_type": error_type})
+    
+    assert _points(reader, "errors") == {
+        (("error_type", "timeout"),): 2,
+        (("error_type", "payment"),): 1,
+        (("error_type", OVERFLOW_VALUE),): 2
+    }
+    assert attribute_policy_stats()["dropped"] == [
+        {"instrument": "errors", "key": "error_type", "reason": "overflow", "count": 2}
+    ]
+
+def test_bucketed_key_uses_crc32(reader, sdk_meter):
+    policy = AttributePolicy(allowed=("status",), bucketed={"customer_id": 16})
+    meter = PolicyMeter(sdk_meter, {"orders": policy})
+    counter = meter.create_counter("orders")
+    
+    counter.add(1, {"status": "success", "customer_id": "ALFKI"})
+    counter.add(1, {"status": "success", "customer_id": "ALFKI"})
+    
+    bucket = zlib.crc32(b"ALFKI") % 16
+    assert _points(reader, "orders") == {(("customer_id_bucket", bucket), ("status", "success")): 2}
+    assert attribute_policy_stats()["dropped"] == []
+
+def test_buckets_are_bounded(reader, sdk_meter):
+    policy = AttributePolicy(bucketed={"customer_id": 4})
+    meter = PolicyMeter(sdk_meter, {"orders": policy})
+    counter = meter.create_counter("orders")
+    
+    for index in range(200):
+        counter.add(1, {"customer_id": f"C{index:04d}"})
+    
+    points = _points(reader, "orders")
+    assert len(points) <= 4
+    assert sum(points.values()) == 200
+
+def test_instrument_without_policy_drops_all_attributes(reader, sdk_meter):
+    meter = PolicyMeter(sdk_meter, {})
+    histogram = meter.create_histogram("latency")
+    
+    histogram.record(12.5, {"route": "/api/products"})
+    
+    assert attribute_policy_stats()["dropped"] == [
+        {"instrument": "latency", "key": "route", "reason": "not_allowed", "count": 1}
+    ]
+
+def test_dropped_attributes_counter(reader, sdk_meter):
+    meter = PolicyMeter(sdk_meter, {"orders": AttributePolicy(allowed=("status",), max_values=1)})
+    counter = meter.create_counter("orders")
+    
+    counter.add(1, {"status": "success", "user_agent": "locust"})
+    counter.add(1, {"status": "failed"})
+    
+    assert _points(reader, "dropped") == {
+        (("instrument", "orders"), ("reason", "not_allowed")): 1,
+        (("instrument", "orders"), ("reason", "overflow")): 1
+    }
\ No newline at end of file
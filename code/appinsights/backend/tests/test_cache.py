@@ -0,0 +1,161 @@
+"""TTLCache: single-flight, expiração, eviction LRU e invalidação durante a carga"""
+import asyncio
+
+import pytest
+
+import cache
+from cache import TTLCache
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    return clock
+
+def test_single_flight_loads_once():
+    store = TTLCache("test")
+    calls = 0
+    
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"value": calls}
+    
+    async def run():
+        return await asyncio.gather(*(store.get_or_load("key", loader) for _ in range(20)))
+    
+    results = asyncio.run(run())
+    
+    assert calls == 1
+    assert all(result == {"value": 1} for result in results)
+    assert store.stats()["inflight"] == 0
+
+def test_single_flight_propagates_loader_error():
+    store = TTLCache("test")
+    
+    async def loader():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("banco indisponível")
+    
+    async def run():
+        return await asyncio.gather(*(store.get_or_load("key", loader) for _ in range(3)), return_exceptions=True)
+    
+    results = asyncio.run(run())
+    
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert store.get("key") is None
+
+def test_entries_expire_after_ttl(clock):
+    store = TTLCache("test", ttl_seconds=60)
+    store.set("key", "value")
+    
+    clock.now += 59
+    assert store.get("key") == "value"
+    clock.now += 1
+    assert store.get("key") is None
+    assert store.stats()["entries"] == 0
+
+def test_expired_entry_is_reloaded(clock):
+    store = TTLCache("test", ttl_seconds=60)
+    values = iter(["first", "second"])
+    
+    async def loader():
+        return next(values)
+    
+    assert asyncio.run(store.get_or_load("key", loader)) == "first"
+    clock.now += 61
+    assert asyncio.run(store.get_or_load("key", loader)) == "second"
+
+def test_evicts_least_recently_used():
+    store = TTLCache("test", max_entries=2)
+    store.set("a", 1)
+    store.set("b", 2)
+    # Leitura move "a" para o fim: "b" passa a ser a menos usada
+    assert store.get("a") == 1
+    store.set("c", 3)
+    
+    assert store.get("b") is None
+    assert store.get("a") == 1
+    assert store.get("c") == 3
+
+def test_none_is_not_cached():
+    store = TTLCache("test")
+    calls = 0
+    
+    async def loader():
+        nonlocal calls
+        calls += 1
+        return None
+    
+    asyncio.run(store.get_or_load("key", loader))
+    asyncio.run(store.get_or_load("key", loader))
+    assert calls == 2
+
+@pytest.mark.parametrize("invalidate", [
+    lambda store: store.invalidate("products:1"),
+    lambda store: store.invalidate_prefix("products:"),
+    lambda store: store.clear()
+])
+def test_invalidation_during_load_discards_result(invalidate):
+    store = TTLCache("test")
+    
+    async def run():
+        started = asyncio.Event()
+        release = asyncio.Event()
+        
+        async def loader():
+            started.set()
+            await release.wait()
+            return "stale"
+        
+        task = asyncio.create_task(store.get_or_load("products:1", loader))
+        await started.wait()
+        invalidate(store)
+        release.set()
+        return await task
+    
+    # Quem já esperava recebe o valor carregado, mas ele não fica em cache
+    assert asyncio.run(run()) == "stale"
+    assert store.get("products:1") is None
+    assert store.stats()["inflight"] == 0
+
+def test_invalidation_does_not_affect_other_loads():
+    store = TTLCache("test")
+    
+    async def run():
+        started = asyncio.Event()
+        release = asyncio.Event()
+        
+        async def loader():
+            started.set()
+            await release.wait()
+            return "fresh"
+        
+        task = asyncio.create_task(store.get_or_load("categories", loader))
+        await started.wait()
+        store.invalidate_prefix("products:")
+        release.set()
+        return await task
+    
+    assert asyncio.run(run()) == "fresh"
+    assert store.get("categories") == "fresh"
+
+def test_disabled_cache_always_loads():
+    store = TTLCache("test", enabled=False)
+    calls = 0
+    
+    async def loader():
+        nonlocal calls
+        calls += 1
+        return calls
+    
+    assert asyncio.run(store.get_or_load("key", loader)) == 1
+    assert asyncio.run(store.get_or_load("key", loader)) == 2
\ No newline at end of file
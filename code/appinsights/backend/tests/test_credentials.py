@@ -0,0 +1,95 @@
+"""Renovação do token do Managed Identity (offline, com FakeCredential)"""
+import sqlite3
+import time
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+from credentials import FakeCredential, ManagedIdentityTokenProvider
+
+REFRESH_MARGIN = 300
+
+class FlakyCredential(FakeCredential):
+    """Emite o primeiro token e falha em todas as renovações"""
+    
+    def get_token(self, *scopes, **kwargs):
+        if self.calls >= 1:
+            self.calls += 1
+            raise RuntimeError("Azure AD indisponível")
+        return super().get_token(*scopes, **kwargs)
+
+def _wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+@pytest.fixture
+def started():
+    providers = []
+    
+    def start(credential, **kwargs):
+        provider = ManagedIdentityTokenProvider(credential, refresh_margin=REFRESH_MARGIN, **kwargs)
+        provider.start()
+        providers.append(provider)
+        return provider
+    
+    yield start
+    for provider in providers:
+        provider.stop()
+
+def test_first_token_fetched_on_start(started):
+    credential = FakeCredential()
+    provider = started(credential)
+    
+    assert credential.calls == 1
+    assert provider.get_token() == "fake-token-1"
+    assert provider.expires_on > time.time() + REFRESH_MARGIN
+
+def test_get_token_before_start_fails():
+    provider = ManagedIdentityTokenProvider(FakeCredential())
+    
+    with pytest.raises(RuntimeError):
+        provider.get_token()
+
+def test_refreshes_before_expiry(started):
+    # Entra na margem de renovação em 1 s, bem antes de expirar
+    credential = FakeCredential(lifetime_seconds=REFRESH_MARGIN + 1)
+    provider = started(credential)
+    
+    assert _wait_for(lambda: credential.calls >= 2)
+    assert provider.get_token() == "fake-token-2"
+    assert provider.expires_on > time.time()
+
+def test_keeps_previous_token_when_refresh_fails(started):
+    credential = FlakyCredential(lifetime_seconds=REFRESH_MARGIN + 1)
+    provider = started(credential, retry_interval=0.05)
+    
+    # Falhou pelo menos duas vezes: a segunda já veio do retry_interval
+    assert _wait_for(lambda: credential.calls >= 3)
+    assert provider.get_token() == "fake-token-1"
+
+def test_do_connect_injects_cached_token(started, monkeypatch):
+    from database import db_connection
+    
+    provider = started(FakeCredential())
+    monkeypatch.setattr(db_connection, "token_provider", provider)
+    
+    engine = create_engine("sqlite://")
+    db_connection._attach_token_provider(engine)
+    captured = {}
+    
+    # Registrado depois do hook de token: vê os cparams já com a senha e
+    # abre a conexão SQLite sem repassar password ao driver
+    @event.listens_for(engine, "do_connect")
+    def _capture(dialect, conn_rec, cargs, cparams):
+        captured.update(cparams)
+        return sqlite3.connect(":memory:")
+    
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    
+    assert captured["password"] == "fake-token-1"
+    engine.dispose()
\ No newline at end of file
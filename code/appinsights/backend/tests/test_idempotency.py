@@ -0,0 +1,142 @@
+"""IdempotencyManager com o store em memória"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import idempotency as idempotency_module
+from idempotency import IdempotencyManager, MemoryIdempotencyStore
+from schemas import OrderResponse
+
+KEY = "order-123"
+FINGERPRINT = "fingerprint-a"
+
+class RecordingStore(MemoryIdempotencyStore):
+    """Registra as chaves liberadas e pode falhar as primeiras gravações"""
+    
+    def __init__(self, complete_failures: int = 0):
+        super().__init__(max_entries=100, ttl_seconds=60)
+        self.complete_failures = complete_failures
+        self.released = []
+    
+    async def complete(self, key, fingerprint, response):
+        if self.complete_failures > 0:
+            self.complete_failures -= 1
+            raise RuntimeError("store indisponível")
+        await super().complete(key, fingerprint, response)
+    
+    async def release(self, key):
+        self.released.append(key)
+
+class CountingHandler:
+    def __init__(self, delay: float = 0.0, error: Exception = None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+    
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return OrderResponse(success=True, message="Pedido criado", order_id=self.calls)
+
+def test_concurrent_same_key_executes_once():
+    manager = IdempotencyManager(RecordingStore(), wait_timeout=1)
+    handler = CountingHandler(delay=0.05)
+    
+    async def run():
+        return await asyncio.gather(*(manager.execute(KEY, FINGERPRINT, handler) for _ in range(5)))
+    
+    results = asyncio.run(run())
+    
+    assert handler.calls == 1
+    assert {response.order_id for response, _ in results} == {1}
+    assert sorted(replayed for _, replayed in results) == [False, True, True, True, True]
+
+def test_completed_key_is_replayed():
+    manager = IdempotencyManager(RecordingStore(), wait_timeout=1)
+    handler = CountingHandler()
+    
+    first, replayed_first = asyncio.run(manager.execute(KEY, FINGERPRINT, handler))
+    second, replayed_second = asyncio.run(manager.execute(KEY, FINGERPRINT, handler))
+    
+    assert handler.calls == 1
+    assert (replayed_first, replayed_second) == (False, True)
+    assert second == first
+
+def test_fingerprint_mismatch_is_rejected():
+    manager = IdempotencyManager(RecordingStore(), wait_timeout=1)
+    handler = CountingHandler()
+    asyncio.run(manager.execute(KEY, FINGERPRINT, handler))
+    
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(manager.execute(KEY, "fingerprint-b", handler))
+    
+    assert error.value.status_code == 422
+    assert handler.calls == 1
+
+def test_fingerprint_mismatch_while_in_flight_is_rejected():
+    manager = IdempotencyManager(RecordingStore(), wait_timeout=1)
+    handler = CountingHandler(delay=0.05)
+    
+    async def run():
+        return await asyncio.gather(
+            manager.execute(KEY, FINGERPRINT, handler),
+            manager.execute(KEY, "fingerprint-b", handler),
+            return_exceptions=True
+        )
+    
+    executed, mismatched = asyncio.run(run())
+    
+    assert executed[1] is False
+    assert isinstance(mismatched, HTTPException) and mismatched.status_code == 422
+
+def test_failed_handler_releases_key():
+    store = RecordingStore()
+    manager = IdempotencyManager(store, wait_timeout=1)
+    failing = CountingHandler(delay=0.05, error=HTTPException(status_code=503, detail="Banco indisponível"))
+    
+    async def run():
+        return await asyncio.gather(*(manager.execute(KEY, FINGERPRINT, failing) for _ in range(3)), return_exceptions=True)
+    
+    results = asyncio.run(run())
+    
+    # Quem aguardava recebe o mesmo erro; a execução foi uma só
+    assert failing.calls == 1
+    assert all(result is failing.error for result in results)
+    assert store.released == [KEY]
+    
+    # O retry executa o pedido de novo
+    handler = CountingHandler()
+    response, replayed = asyncio.run(manager.execute(KEY, FINGERPRINT, handler))
+    assert handler.calls == 1
+    assert replayed is False and response.success
+
+def test_failed_complete_never_reexecutes(monkeypatch):
+    monkeypatch.setattr(idempotency_module, "COMPLETE_RETRY_INITIAL_SECONDS", 0.01)
+    store = RecordingStore(complete_failures=2)
+    manager = IdempotencyManager(store, wait_timeout=1)
+    handler = CountingHandler()
+    
+    async def run():
+        first = await manager.execute(KEY, FINGERPRINT, handler)
+        # Resposta ainda não gravada: o replay vem das pendentes do processo
+        pending = manager.stats()["pending"]
+        second = await manager.execute(KEY, FINGERPRINT, handler)
+        await asyncio.gather(*manager._tasks)
+        return first, pending, second
+    
+    (first, replayed_first), pending, (second, replayed_second) = asyncio.run(run())
+    
+    assert handler.calls == 1
+    assert store.released == []
+    assert pending == 1
+    assert (replayed_first, replayed_second) == (False, True)
+    assert second == first
+    
+    # A gravação em segundo plano concluiu: o store responde o replay
+    assert manager.stats()["pending"] == 0
+    response, replayed = asyncio.run(manager.execute(KEY, FINGERPRINT, handler))
+    assert replayed is True and response == first
+    assert handler.calls == 1
\ No newline at end of file
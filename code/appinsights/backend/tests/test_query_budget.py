@@ -0,0 +1,182 @@
+"""Orçamento de queries por endpoint (@query_budget)
+
+Executa as rotas com orçamento contra um SQLite com dados mínimos e compara
+X-DB-Query-Count com o orçamento declarado; verifica também que o modo
+estrito recusa o commit de uma requisição acima do orçamento.
+    
+    pip install -r requirements-dev.txt
+    pytest tests
+"""
+import contextvars
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from database import Base, get_async_db, get_async_read_db
+from models import Category, Customer, Order, OrderDetail, Product
+from queries import (
+    QueryBudgetExceeded,
+    get_query_budget,
+    install_query_budget_guard,
+    install_query_counter,
+    remove_query_budget_guard,
+    start_query_counter
+)
+
+# Valores dos parâmetros de caminho das rotas com orçamento
+PATH_PARAMS = {"product_id": 1, "category_id": 1, "customer_id": "ALFKI", "order_id": 1}
+
+# Rotas com banco sem orçamento fixo (número de queries cresce com o lote)
+UNBUDGETED_ROUTES = {"/api/orders/bulk"}
+
+ORDER_PAYLOAD = {"customer_id": "ALFKI", "items": [{"product_id": 1, "quantity": 2}]}
+
+def _seed(path):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all([
+            Category(category_id=1, category_name="Beverages"),
+            Product(product_id=1, product_name="Chai", category_id=1, unit_price=18.0, units_in_stock=100),
+            Customer(customer_id="ALFKI", company_name="Alfreds Futterkiste", city="Berlin"),
+            Order(order_id=1, customer_id="ALFKI", order_date=datetime(2024, 1, 1)),
+            OrderDetail(order_id=1, product_id=1, unit_price=18.0, quantity=1, discount=0)
+        ])
+        session.commit()
+    engine.dispose()
+
+@pytest.fixture(scope="module")
+def app():
+    pytest.importorskip("aiosqlite")
+    import main
+    return main.app
+
+@pytest.fixture(scope="module")
+def client(app, tmp_path_factory):
+    from fastapi.testclient import TestClient
+    import services
+    from cache import catalog_cache
+    from latency import delay_provider
+    
+    path = tmp_path_factory.mktemp("db") / "northwind.db"
+    _seed(path)
+    
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+    install_query_counter(engine.sync_engine)
+    sessions = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    
+    async def override_db():
+        async with sessions() as db:
+            yield db
+    
+    with pytest.MonkeyPatch.context() as patch:
+        # Sem cache (toda requisição vai ao banco), sem atraso e sem erros simulados
+        patch.setattr(catalog_cache, "enabled", False)
+        patch.setattr(delay_provider, "scale", 0.0)
+        patch.setattr(services, "default_scenario_chooser", services.ScenarioChooser({services.SCENARIO_SUCCESS: 1}))
+        app.dependency_overrides[get_async_db] = override_db
+        app.dependency_overrides[get_async_read_db] = override_db
+        # Sem o context manager: o lifespan conectaria no PostgreSQL
+        yield TestClient(app, raise_server_exceptions=False)
+        app.dependency_overrides.clear()
+
+def _budgeted_routes(app, method: str):
+    for route in app.routes:
+        budget = get_query_budget(getattr(route, "endpoint", None))
+        if budget is not None and method in route.methods:
+            yield route.path, budget
+
+def _dependency_calls(dependant):
+    for dependency in dependant.dependencies:
+        yield dependency.call
+        yield from _dependency_calls(dependency)
+
+def test_database_routes_declare_budget(app):
+    missing = [
+        route.path for route in app.routes
+        if hasattr(route, "dependant")
+        and {get_async_db, get_async_read_db} & set(_dependency_calls(route.dependant))
+        and get_query_budget(route.endpoint) is None
+        and route.path not in UNBUDGETED_ROUTES
+    ]
+    assert missing == []
+
+def test_get_routes_within_budget(app, client):
+    routes = list(_budgeted_routes(app, "GET"))
+    assert routes
+    
+    for path, budget in routes:
+        response = client.get(path.format(**PATH_PARAMS))
+        # 503 é esperado em /livez e /readyz sem o lifespan; 500 seria erro real
+        assert response.status_code != 500, f"{path}: {response.text}"
+        assert int(response.headers["X-DB-Query-Count"]) <= budget, path
+
+def test_post_routes_within_budget(app, client):
+    routes = dict(_budgeted_routes(app, "POST"))
+    assert "/api/orders" in routes
+    
+    for path, budget in routes.items():
+        response = client.post(path, json=ORDER_PAYLOAD)
+        assert response.status_code == 200, f"{path}: {response.text}"
+        assert int(response.headers["X-DB-Query-Count"]) <= budget, path
+
+@pytest.mark.parametrize("path", ["/api/categories", "/api/products/1", "/api/products?limit=1000", "/api/products?cursor="])
+def test_not_modified_skips_database(client, monkeypatch, path):
+    from cache import catalog_cache
+    
+    monkeypatch.setattr(catalog_cache, "enabled", True)
+    catalog_cache.clear()
+    
+    first = client.get(path)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200
+    assert etag.startswith('W/"')
+    
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["X-DB-Query-Count"] == "0"
+    catalog_cache.clear()
+
+def test_etag_revalidated_without_cache(client):
+    # Cache desligado: consulta de novo, mas a mesma ETag ainda responde 304
+    etag = client.get("/api/categories").headers["ETag"]
+    response = client.get("/api/categories", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["X-DB-Query-Count"] == "1"
+
+@pytest.fixture
+def strict_guard():
+    # Hooks globais na classe Session: removidos ao fim para não vazar
+    install_query_budget_guard()
+    yield
+    remove_query_budget_guard()
+
+def test_strict_budget_refuses_commit(tmp_path, strict_guard):
+    engine = create_engine(f"sqlite:///{tmp_path / 'strict.db'}")
+    Base.metadata.create_all(engine, tables=[Category.__table__])
+    install_query_counter(engine)
+    
+    def over_budget_request():
+        counter = start_query_counter()
+        counter.budget = 1
+        with Session(engine) as session:
+            session.add(Category(category_id=1, category_name="Beverages"))
+            session.flush()
+            session.execute(select(Category))
+            with pytest.raises(QueryBudgetExceeded):
+                session.commit()
+        return counter
+    
+    # Contexto próprio: o contador não vaza para os outros testes
+    counter = contextvars.copy_context().run(over_budget_request)
+    
+    assert counter.count == 2
+    assert counter.commits == 0
+    with Session(engine) as session:
+        assert session.get(Category, 1) is None
+    engine.dispose()
\ No newline at end of file
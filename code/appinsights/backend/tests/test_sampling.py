@@ -0,0 +1,101 @@
+"""Tail sampling: erros e traces lentos sempre exportados, o resto pela fração"""
+import pytest
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import NonRecordingSpan, SpanContext, Status, StatusCode, TraceFlags
+
+from sampling import TailSamplingSpanProcessor
+
+MS = 1_000_000
+
+@pytest.fixture
+def exporter():
+    return InMemorySpanExporter()
+
+@pytest.fixture
+def make_tracer(exporter):
+    def make(ratio: float = 0.0, latency_threshold_ms: float = 500, max_traces: int = 100):
+        processor = TailSamplingSpanProcessor(
+            SimpleSpanProcessor(exporter), ratio=ratio, latency_threshold_ms=latency_threshold_ms, max_traces=max_traces
+        )
+        provider = TracerProvider()
+        provider.add_span_processor(processor)
+        return provider.get_tracer("test"), processor
+    return make
+
+def _request(tracer, duration_ms: float = 10, child_error: bool = False, context=None):
+    """Trace local de uma requisição: raiz e um span filho"""
+    root = tracer.start_span("GET /api/products", context=context, start_time=0)
+    with trace.use_span(root, end_on_exit=False):
+        with tracer.start_as_current_span("SELECT products") as child:
+            if child_error:
+                child.set_status(Status(StatusCode.ERROR))
+    root.end(end_time=int(duration_ms * MS))
+    return root
+
+def test_error_trace_is_kept_entirely(exporter, make_tracer):
+    tracer, processor = make_tracer(ratio=0.0)
+    
+    root = _request(tracer, child_error=True)
+    
+    assert [span.name for span in exporter.get_finished_spans()] == ["SELECT products", "GET /api/products"]
+    assert {span.context.trace_id for span in exporter.get_finished_spans()} == {root.context.trace_id}
+    assert processor.stats()["kept_error"] == 1
+
+def test_slow_trace_is_kept(exporter, make_tracer):
+    tracer, processor = make_tracer(ratio=0.0, latency_threshold_ms=500)
+    
+    _request(tracer, duration_ms=499)
+    _request(tracer, duration_ms=500)
+    
+    assert len(exporter.get_finished_spans()) == 2
+    assert processor.stats()["kept_slow"] == 1
+    assert processor.stats()["dropped"] == 1
+
+def test_fast_successful_traces_dropped_with_zero_ratio(exporter, make_tracer):
+    tracer, processor = make_tracer(ratio=0.0)
+    
+    for _ in range(20):
+        _request(tracer)
+    
+    assert exporter.get_finished_spans() == ()
+    assert processor.stats()["dropped"] == 20
+    assert processor.stats()["pending_traces"] == 0
+
+def test_remaining_traces_sampled_at_ratio(exporter, make_tracer):
+    tracer, processor = make_tracer(ratio=0.25)
+    
+    for _ in range(2000):
+        _request(tracer)
+    
+    kept = processor.stats()["kept_sampled"]
+    assert 400 <= kept <= 600
+    assert kept + processor.stats()["dropped"] == 2000
+    # Traces mantidos saem inteiros: raiz e filho
+    assert len(exporter.get_finished_spans()) == 2 * kept
+
+def test_remote_parent_is_local_root(exporter, make_tracer):
+    tracer, processor = make_tracer(ratio=0.0)
+    remote = SpanContext(
+        trace_id=0x1234, span_id=0x5678, is_remote=True, trace_flags=TraceFlags(TraceFlags.SAMPLED)
+    )
+    
+    _request(tracer, child_error=True, context=trace.set_span_in_context(NonRecordingSpan(remote)))
+    
+    assert len(exporter.get_finished_spans()) == 2
+    assert processor.stats()["pending_traces"] == 0
+
+def test_buffer_limited_to_max_traces(exporter, make_tracer):
+    tracer, processor = make_tracer(ratio=1.0, max_traces=2)
+    
+    # Filhos cujas raízes nunca terminam ficam no buffer até o descarte
+    roots = [tracer.start_span("root") for _ in range(3)]
+    for root in roots:
+        with trace.use_span(root, end_on_exit=False):
+            tracer.start_span("child").end()
+    
+    assert processor.stats()["pending_traces"] == 2
+    assert processor.stats()["evicted"] == 1
+    assert exporter.get_finished_spans() == ()
\ No newline at end of file
@@ -0,0 +1,109 @@
+"""Worker do outbox de pedidos (modo assíncrono)
+
+Consome order_outbox, executa as etapas de pagamento e estoque de cada
+pedido aceito e grava o status final. Pode rodar em várias instâncias.
+    
+    python worker.py
+"""
+import signal
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from database import AsyncSessionLocal, db_connection
+from outbox import (
+    OUTBOX_PENDING,
+    OUTBOX_COMPLETED,
+    OUTBOX_FAILED,
+    ensure_outbox_schema,
+    claim_entries,
+    finish_entry,
+    queue_stats
+)
+from schemas import OrderCreate
+from services import OrderService
+from telemetry import setup_telemetry, tracer, set_outbox_stats, outbox_lag_histogram, outbox_processed_counter
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+async def process_entry(entry, semaphore: asyncio.Semaphore):
+    async with semaphore, AsyncSessionLocal() as session:
+        with tracer.start_as_current_span("outbox_process_entry") as span:
+            span.set_attribute("order_id", entry.order_id)
+            span.set_attribute("attempt", entry.attempts)
+            
+            order_data = OrderCreate.model_validate(entry.payload)
+            retry_at = None
+            try:
+                await OrderService(session).process_accepted_order(order_data, entry.total_amount)
+                status, error = OUTBOX_COMPLETED, None
+            except HTTPException as e:
+                status, error = OUTBOX_FAILED, e.detail
+                # Timeout de pagamento é transitório: tenta de novo com backoff
+                if e.status_code == 503 and entry.attempts < settings.outbox_max_attempts:
+                    status = OUTBOX_PENDING
+                    retry_at = datetime.utcnow() + timedelta(
+                        seconds=settings.outbox_retry_backoff_seconds * entry.attempts
+                    )
+            except Exception as e:
+                logger.error(f"Erro inesperado no pedido {entry.order_id}: {e}")
+                span.record_exception(e)
+                status, error = OUTBOX_FAILED, str(e)
+                await session.rollback()
+            
+            # Pedido desistido: devolve o estoque reservado no aceite, na mesma
+            # transação que grava o status (commit em finish_entry)
+            if status == OUTBOX_FAILED and settings.stock_reservation_enabled:
+                await OrderService(session).release_stock(order_data)
+                span.set_attribute("stock_released", True)
+            
+            await finish_entry(session, entry.id, status, error, retry_at)
+            span.set_attribute("status", status)
+            outbox_processed_counter.add(1, {"status": status})
+            if status != OUTBOX_PENDING:
+                lag_ms = (datetime.utcnow() - entry.created_at).total_seconds() * 1000
+                outbox_lag_histogram.record(lag_ms, {"status": status})
+
+async def run_worker(stop: asyncio.Event):
+    await db_connection.test_connection()
+    await ensure_outbox_schema()
+    semaphore = asyncio.Semaphore(settings.outbox_worker_concurrency)
+    logger.info("Worker do outbox iniciado")
+    
+    while not stop.is_set():
+        try:
+            async with AsyncSessionLocal() as session:
+                set_outbox_stats(*await queue_stats(session))
+                entries = await claim_entries(session, settings.outbox_batch_size, settings.outbox_lease_seconds)
+            
+            if entries:
+                await asyncio.gather(*(process_entry(entry, semaphore) for entry in entries))
+                # Lote cheio: provavelmente há mais trabalho, não espera
+                if len(entries) == settings.outbox_batch_size:
+                    continue
+        except Exception as e:
+            logger.error(f"Erro no ciclo do worker do outbox: {e}")
+        
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.outbox_poll_interval)
+        except asyncio.TimeoutError:
+            pass
+    
+    logger.info("Worker do outbox finalizado")
+
+async def main():
+    setup_telemetry()
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    try:
+        await run_worker(stop)
+    finally:
+        await db_connection.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,90 @@
+"""Benchmark de criação de pedidos: N chamadas a POST /api/orders vs um lote
+
+Gera pedidos sintéticos com clientes e produtos reais da API e mede a
+vazão (pedidos/s) de cada modo. Para comparar só o custo de banco e HTTP,
+suba o backend sem atraso artificial e sem erros simulados:
+    
+    LATENCY_SCALE=0 SUCCESS_RATE=100 ERROR_PAYMENT_RATE=0 ERROR_STOCK_RATE=0
+
+Exemplos:
+    python bulk_orders_benchmark.py --orders 2000
+    python bulk_orders_benchmark.py --orders 20000 --ndjson --skip-single
+"""
+import argparse
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+def build_orders(base_url: str, count: int, max_items: int):
+    customers = requests.get(f"{base_url}/api/customers", params={"limit": 100}).json()
+    products = requests.get(f"{base_url}/api/products", params={"limit": 1000}).json()
+    customer_ids = [customer["customer_id"] for customer in customers]
+    product_ids = [product["product_id"] for product in products]
+    
+    orders = []
+    for _ in range(count):
+        items = random.sample(product_ids, random.randint(1, min(max_items, len(product_ids))))
+        orders.append({
+            "customer_id": random.choice(customer_ids),
+            "items": [{"product_id": product_id, "quantity": random.randint(1, 5)} for product_id in items]
+        })
+    return orders
+
+def run_single(base_url: str, orders: list, concurrency: int) -> float:
+    session = requests.Session()
+    
+    def post(order):
+        session.post(f"{base_url}/api/orders", json=order).raise_for_status()
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(post, orders))
+    return time.perf_counter() - start
+
+def run_bulk(base_url: str, orders: list, chunk: int, ndjson: bool) -> float:
+    session = requests.Session()
+    
+    start = time.perf_counter()
+    for offset in range(0, len(orders), chunk):
+        batch = orders[offset:offset + chunk]
+        if ndjson:
+            response = session.post(
+                f"{base_url}/api/orders/bulk",
+                data="".join(json.dumps(order) + "\n" for order in batch),
+                headers={"Content-Type": "application/x-ndjson"}
+            )
+        else:
+            response = session.post(f"{base_url}/api/orders/bulk", json=batch)
+        response.raise_for_status()
+        summary = response.json()
+        if summary["failed"]:
+            print(f"Aviso: {summary['failed']} pedidos rejeitados no lote")
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de pedidos individuais vs lote")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--max-items", type=int, default=3, help="Itens por pedido (máximo)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Chamadas simultâneas no modo individual")
+    parser.add_argument("--chunk", type=int, default=10000, help="Pedidos por requisição no modo lote")
+    parser.add_argument("--ndjson", action="store_true", help="Envia o lote como NDJSON")
+    parser.add_argument("--skip-single", action="store_true", help="Mede apenas o modo lote")
+    args = parser.parse_args()
+    
+    base_url = args.base_url.rstrip("/")
+    orders = build_orders(base_url, args.orders, args.max_items)
+    
+    print(f"{args.orders} pedidos (pedidos/s)")
+    bulk_elapsed = run_bulk(base_url, orders, args.chunk, args.ndjson)
+    print(f"{'lote':>12} {args.orders / bulk_elapsed:>10.0f}")
+    
+    if not args.skip_single:
+        single_elapsed = run_single(base_url, orders, args.concurrency)
+        print(f"{'individual':>12} {args.orders / single_elapsed:>10.0f}")
+        print(f"Lote {single_elapsed / bulk_elapsed:.1f}x mais rápido")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
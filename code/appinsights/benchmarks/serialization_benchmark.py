@@ -0,0 +1,106 @@
+"""Benchmark do caminho de serialização das listagens
+
+Compara o caminho padrão (objetos -> pydantic from_attributes ->
+jsonable_encoder -> json) com o caminho rápido (dicts projetados -> orjson).
+
+Modos:
+    offline: mede só a serialização em processo, com produtos sintéticos
+    http: mede GET /api/products na API com e sem o header X-Fast-Json
+
+Exemplos:
+    python serialization_benchmark.py offline --rows 1000 --repeat 200
+    python serialization_benchmark.py http --base-url http://localhost:8000 --limit 1000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+def _synthetic_products(rows: int):
+    """Gera objetos no formato do ORM e os dicts equivalentes da projeção"""
+    objects, dicts = [], []
+    for i in range(1, rows + 1):
+        category = {"category_id": i % 8 + 1, "category_name": f"Categoria {i % 8}", "description": "Descrição"}
+        product = {
+            "product_id": i, "product_name": f"Produto {i}", "supplier_id": i % 29 + 1,
+            "category_id": category["category_id"], "quantity_per_unit": "10 boxes x 20 bags",
+            "unit_price": 18.0 + i % 50, "units_in_stock": 39, "units_on_order": 0,
+            "reorder_level": 10, "discontinued": 0
+        }
+        objects.append(SimpleNamespace(**product, category=SimpleNamespace(**category)))
+        dicts.append({**product, "category": category})
+    return objects, dicts
+
+def _measure(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), statistics.quantiles(samples, n=100)[98]
+
+def run_offline(rows: int, repeat: int):
+    import orjson
+    from typing import List
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from schemas import Product as ProductSchema
+    
+    objects, dicts = _synthetic_products(rows)
+    adapter = TypeAdapter(List[ProductSchema])
+    
+    def default_path():
+        validated = adapter.validate_python(objects, from_attributes=True)
+        return json.dumps(jsonable_encoder(validated)).encode()
+    
+    def fast_path():
+        return orjson.dumps(dicts)
+    
+    # Sanidade: os dois caminhos produzem o mesmo JSON
+    assert json.loads(default_path()) == json.loads(fast_path())
+    
+    print(f"Serialização de {rows} produtos, {repeat} repetições (ms)")
+    print(f"{'caminho':>10} {'mediana':>10} {'p99':>10}")
+    for name, fn in (("padrão", default_path), ("rápido", fast_path)):
+        median, p99 = _measure(fn, repeat)
+        print(f"{name:>10} {median:>10.2f} {p99:>10.2f}")
+
+def run_http(base_url: str, limit: int, repeat: int):
+    import requests
+    
+    session = requests.Session()
+    url = f"{base_url.rstrip('/')}/api/products"
+    params = {"limit": limit}
+    
+    print(f"GET /api/products?limit={limit}, {repeat} repetições (ms)")
+    print(f"{'caminho':>10} {'mediana':>10} {'p99':>10}")
+    for name, headers in (("padrão", {}), ("rápido", {"X-Fast-Json": "1"})):
+        median, p99 = _measure(lambda: session.get(url, params=params, headers=headers).raise_for_status(), repeat)
+        print(f"{name:>10} {median:>10.2f} {p99:>10.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de serialização padrão vs orjson")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+    
+    offline = subparsers.add_parser("offline")
+    offline.add_argument("--rows", type=int, default=1000)
+    offline.add_argument("--repeat", type=int, default=100)
+    
+    http = subparsers.add_parser("http")
+    http.add_argument("--base-url", default="http://localhost:8000")
+    http.add_argument("--limit", type=int, default=1000)
+    http.add_argument("--repeat", type=int, default=50)
+    
+    args = parser.parse_args()
+    if args.mode == "offline":
+        run_offline(args.rows, args.repeat)
+    else:
+        run_http(args.base_url, args.limit, args.repeat)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
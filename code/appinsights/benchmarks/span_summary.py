@@ -0,0 +1,93 @@
+"""Resumo de latência por nome de span a partir dos arquivos do exportador local
+
+Lê os arquivos OTLP-JSON gravados com TELEMETRY_EXPORTER=file
+(traces-<pid>.jsonl e rotações .1, .2, ...) e mostra contagem, erros e
+percentis de duração por nome de span.
+
+Exemplos:
+    python span_summary.py ../backend/telemetry
+    python span_summary.py ../backend/telemetry --name /api/orders --sort p99 --top 20
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+from collections import defaultdict
+
+STATUS_ERROR = 2
+
+def _trace_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(glob.glob(os.path.join(path, "traces-*.jsonl*")))
+        else:
+            yield path
+
+def load_durations(paths, name_filter: str = ""):
+    """Durações (ms) e contagem de erros por nome de span"""
+    durations, errors = defaultdict(list), defaultdict(int)
+    for path in _trace_files(paths):
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                for resource_spans in request.get("resourceSpans", []):
+                    for scope_spans in resource_spans.get("scopeSpans", []):
+                        for span in scope_spans.get("spans", []):
+                            name = span["name"]
+                            if name_filter not in name:
+                                continue
+                            durations[name].append((int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1_000_000)
+                            if span.get("status", {}).get("code") == STATUS_ERROR:
+                                errors[name] += 1
+    return durations, errors
+
+def _percentile(cuts, samples, p: int) -> float:
+    return cuts[p - 1] if cuts else samples[0]
+
+def summarize(durations, errors):
+    rows = []
+    for name, samples in durations.items():
+        samples.sort()
+        cuts = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else []
+        rows.append({
+            "name": name,
+            "count": len(samples),
+            "errors": errors.get(name, 0),
+            "p50": _percentile(cuts, samples, 50),
+            "p90": _percentile(cuts, samples, 90),
+            "p99": _percentile(cuts, samples, 99),
+            "max": samples[-1]
+        })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Percentis de latência por nome de span (arquivos OTLP-JSON)")
+    parser.add_argument("paths", nargs="*", default=["telemetry"], help="Diretórios ou arquivos traces-*.jsonl")
+    parser.add_argument("--name", default="", help="Só spans cujo nome contém este texto")
+    parser.add_argument("--sort", choices=["count", "p50", "p90", "p99", "max", "name"], default="p99")
+    parser.add_argument("--top", type=int, default=0, help="Limita o número de linhas (0 = todas)")
+    args = parser.parse_args()
+    
+    durations, errors = load_durations(args.paths, args.name)
+    if not durations:
+        print("Nenhum span encontrado")
+        return
+    
+    rows = summarize(durations, errors)
+    rows.sort(key=lambda row: row[args.sort], reverse=args.sort != "name")
+    if args.top:
+        rows = rows[:args.top]
+    
+    width = max(len(row["name"]) for row in rows)
+    print(f"{'span':<{width}} {'count':>8} {'erros':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for row in rows:
+        print(
+            f"{row['name']:<{width}} {row['count']:>8} {row['errors']:>6} "
+            f"{row['p50']:>9.2f} {row['p90']:>9.2f} {row['p99']:>9.2f} {row['max']:>9.2f}"
+        )
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""Benchmark do custo de tracing por requisição em cada modo de amostragem
+
+Gera, em processo, a mesma árvore de spans de um POST /api/orders (span do
+servidor, spans manuais e um span por query, ou dois com TRACING_DB_SPANS=both)
+usando o TracerProvider de telemetry.build_tracer_provider com um
+exportador que só conta os spans. Mede o tempo por requisição e quantos
+spans chegariam ao exportador.
+
+Modos comparados: off (sem SDK), always_on, ratio e tail, cada um com spans
+de banco "sqlalchemy" e "both".
+
+Exemplo:
+    python tracing_benchmark.py --requests 5000 --queries 7 --ratio 0.1 --error-rate 0.05
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+def _counting_exporter():
+    from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+    
+    class CountingExporter(SpanExporter):
+        def __init__(self):
+            self.exported = 0
+        
+        def export(self, spans):
+            self.exported += len(spans)
+            return SpanExportResult.SUCCESS
+    
+    return CountingExporter()
+
+def _simulate_request(tracer, queries: int, db_spans: str, failed: bool):
+    """Árvore de spans de um pedido bem-sucedido (ou com erro)"""
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+    
+    with tracer.start_as_current_span("POST /api/orders", kind=SpanKind.SERVER) as server:
+        with tracer.start_as_current_span("create_order") as span:
+            span.set_attribute("customer_id", "ALFKI")
+            with tracer.start_as_current_span("order_processing") as processing:
+                processing.set_attribute("scenario", "success")
+                with tracer.start_as_current_span("successful_order_processing"):
+                    for _ in range(queries):
+                        with tracer.start_as_current_span("SELECT northwind", kind=SpanKind.CLIENT) as query:
+                            query.set_attribute("db.system", "postgresql")
+                            query.set_attribute("db.statement", "SELECT products.product_id FROM products WHERE ...")
+                            if db_spans == "both":
+                                with tracer.start_as_current_span("SELECT", kind=SpanKind.CLIENT) as driver:
+                                    driver.set_attribute("db.system", "postgresql")
+                                    driver.set_attribute("db.statement", "SELECT products.product_id FROM products WHERE ...")
+        if failed:
+            server.set_status(Status(StatusCode.ERROR))
+
+def run(requests_count: int, queries: int, ratio: float, error_rate: float):
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.trace import NoOpTracerProvider
+    from config import settings
+    from telemetry import build_tracer_provider
+    
+    settings.tracing_sample_ratio = ratio
+    # Sem requisições lentas: no modo tail só erros e a fração ratio são mantidos
+    settings.tracing_tail_latency_ms = 60_000
+    
+    rng = random.Random(42)
+    failures = [rng.random() < error_rate for _ in range(requests_count)]
+    
+    print(f"{requests_count} requisições, {queries} queries cada, ratio={ratio}, erros={error_rate:.0%}")
+    print(f"{'modo':>10} {'spans db':>10} {'mediana µs':>12} {'p99 µs':>10} {'spans/req':>10}")
+    
+    cases = [("off", "sqlalchemy")]
+    cases += [(mode, db_spans) for mode in ("always_on", "ratio", "tail") for db_spans in ("sqlalchemy", "both")]
+    for mode, db_spans in cases:
+        exporter = None
+        if mode == "off":
+            provider = NoOpTracerProvider()
+        else:
+            settings.tracing_sampling = mode
+            exporter = _counting_exporter()
+            provider = build_tracer_provider(BatchSpanProcessor(exporter))
+        tracer = provider.get_tracer(__name__)
+        
+        samples = []
+        for failed in failures:
+            start = time.perf_counter()
+            _simulate_request(tracer, queries, db_spans, failed)
+            samples.append((time.perf_counter() - start) * 1_000_000)
+        
+        exported = 0
+        if exporter is not None:
+            provider.force_flush()
+            provider.shutdown()
+            exported = exporter.exported
+        
+        median = statistics.median(samples)
+        p99 = statistics.quantiles(samples, n=100)[98]
+        print(f"{mode:>10} {db_spans:>10} {median:>12.1f} {p99:>10.1f} {exported / requests_count:>10.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Custo de tracing por requisição por modo de amostragem")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=7, help="Queries por requisição (orçamento de POST /api/orders)")
+    parser.add_argument("--ratio", type=float, default=0.1, help="TRACING_SAMPLE_RATIO dos modos ratio e tail")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    args = parser.parse_args()
+    run(args.requests, args.queries, args.ratio, args.error_rate)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -11,6 +11,10 @@ SUCCESS_RATE = int(os.getenv('SUCCESS_RATE', '70'))
 ERROR_PAYMENT_RATE = int(os.getenv('ERROR_PAYMENT_RATE', '15'))
 ERROR_STOCK_RATE = int(os.getenv('ERROR_STOCK_RATE', '15'))
 
+# Cenário de disputa de estoque (requer STOCK_RESERVATION_ENABLED=true no backend)
+HOT_PRODUCT_SCENARIO = os.getenv('HOT_PRODUCT_SCENARIO', 'false').lower() == 'true'
+HOT_PRODUCT_IDS = [int(pid) for pid in os.getenv('HOT_PRODUCT_IDS', '1,2,3').split(',') if pid.strip()]
+
 fake = Faker('pt_BR')
 
 class NorthwindEcommerceUser(HttpUser):
@@ -278,6 +282,48 @@ class NorthwindEcommerceUser(HttpUser):
             else:
                 response.failure(f"Order failed with status {response.status_code}")
 
+class HotProductBuyer(HttpUser):
+    """Compradores concorrentes disputando o estoque de poucos produtos
+    
+    Cada pedido leva um subconjunto dos HOT_PRODUCT_IDS em ordem aleatória,
+    gerando espera por lock e conflitos de estoque (409) no backend. Ativado
+    com HOT_PRODUCT_SCENARIO=true. Para repor o estoque entre execuções:
+    UPDATE products SET units_in_stock = 1000 WHERE product_id IN (...)
+    """
+    
+    abstract = not HOT_PRODUCT_SCENARIO
+    wait_time = between(0.1, 0.5)
+    
+    def on_start(self):
+        self.customers = []
+        with self.client.get("/api/customers?limit=50", catch_response=True, name="hot_load_customers") as response:
+            if response.status_code == 200:
+                self.customers = response.json()
+            else:
+                response.failure("Failed to load customers")
+    
+    @task
+    def buy_hot_products(self):
+        """Pedido com produtos disputados"""
+        if not self.customers or not HOT_PRODUCT_IDS:
+            return
+        
+        product_ids = random.sample(HOT_PRODUCT_IDS, random.randint(1, len(HOT_PRODUCT_IDS)))
+        order_data = {
+            "customer_id": random.choice(self.customers)['customer_id'],
+            "items": [{"product_id": pid, "quantity": random.randint(1, 3)} for pid in product_ids]
+        }
+        
+        with self.client.post("/api/orders", json=order_data,
+                            catch_response=True, name="hot_product_order") as response:
+            if response.status_code in [200, 202]:
+                response.success()
+            elif response.status_code in [409, 503]:
+                # Conflito de estoque ou erro de pagamento simulado
+                response.success()
+            else:
+                response.failure(f"Hot product order failed with status {response.status_code}")
+
 # Configuração para execução via linha de comando
 if __name__ == "__main__":
     import subprocess
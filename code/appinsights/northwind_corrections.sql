@@ -26,6 +26,12 @@ ALTER SEQUENCE employees_employee_id_seq OWNED BY employees.employee_id;
 ALTER SEQUENCE suppliers_supplier_id_seq OWNED BY suppliers.supplier_id;
 ALTER SEQUENCE shippers_shipper_id_seq OWNED BY shippers.shipper_id;
 
+-- 3.1 AMPLIAR order_id PARA integer
+-- Em smallint o limite é 32767: a partir de 11078 restam ~21 mil pedidos,
+-- menos do que algumas cargas de POST /api/orders/bulk
+ALTER TABLE order_details ALTER COLUMN order_id TYPE integer;
+ALTER TABLE orders ALTER COLUMN order_id TYPE integer;
+
 -- 4. PERMISSÕES PARA O USUÁRIO demouser
 
 -- Permissões em todas as tabelas